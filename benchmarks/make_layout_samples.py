@@ -0,0 +1,110 @@
+"""
+Synthetic Ravaged Realm and Thalassa samples for the benchmark corpus.
+
+Only an Arena I formation was captured, so the portraits of
+Sample_Formation are moved onto the slots of the other layouts: every
+occupied Arena I slot is covered with an empty slot, then each portrait is
+blended back in, centered on its target slot. The board, border and investment
+section stay those of the captured screenshot.
+
+    python -m benchmarks.make_layout_samples
+"""
+import json
+
+import cv2
+import numpy as np
+
+from bot.core.config import path_settings
+from bot.image.analyze_image import SLOT_DIAMETER, analyze_formation, get_layouts
+from bot.image.frame import DecodedFrame
+
+SOURCE = "Sample_Formation.png"
+SOURCE_ARENA = "Arena I"
+EMPTY_SLOT = 1
+# Empty slots are blended within this multiple of the slot radius to cover a
+# portrait and its rim, portraits just outside their detected circle
+EMPTY_RADIUS = 1.15
+PORTRAIT_MARGIN = 1.1
+
+# Target arena to (file, tiles the source portraits move to, in source order)
+LAYOUT_SAMPLES = {
+    # Slots 6-9 have no Arena I slot, so the layout is decidable
+    "Ravaged Realm": ("benchmarks/Sample_Ravaged_Realm.png", [1, 2, 4, 6, 7, 8, 9]),
+    # Thalassa slots 1-10 are Arena I slots 1-10, so only a hint could tell them apart.
+    # Rowan keeps its slot; the neighbours overlapping it in the source spoil a moved copy
+    "Thalassa": ("benchmarks/Sample_Thalassa.png", [4, 2, 3, 5, 6, 8, 10])
+}
+
+
+def get_board_origin(image: np.ndarray) -> tuple[int, int, int]:
+    """Left, top and width of the square that layouts are measured in, as analyze_formation crops it."""
+    _, mask = cv2.threshold(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), 240, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    return x, y + h - w, w
+
+
+def get_patch(image: np.ndarray, center: tuple[int, int], half: int) -> np.ndarray:
+    """Square patch around a pixel center."""
+    x, y = center
+    return image[y - half:y + half, x - half:x + half].copy()
+
+
+def put_patch(image: np.ndarray, center: tuple[int, int], patch: np.ndarray, alpha: np.ndarray):
+    """Blend a square patch into the image around a pixel center."""
+    x, y = center
+    half = len(patch) // 2
+    region = image[y - half:y + half, x - half:x + half]
+    region[:] = (patch * alpha + region * (1 - alpha)).astype(np.uint8)
+
+
+def make_layout_sample(arena: str, tiles: list[int], units: dict[str, str]) -> tuple[np.ndarray, dict[str, str]]:
+    """Move the source portraits onto tiles of an arena. Returns the image and its tile labels."""
+    image = cv2.imread(str(path_settings.base_dir / SOURCE))
+    left, top, width = get_board_origin(image)
+    layouts = get_layouts()
+
+    def center(layout: str, tile: int) -> tuple[int, int]:
+        x, y = layouts[layout].centers[tile - 1]
+        return int(round(left + x * width)), int(round(top + y * width))
+
+    radius = SLOT_DIAMETER * width / 2
+    half = int(np.ceil(radius * EMPTY_RADIUS))
+    offsets = np.arange(-half, half) + 0.5
+    distance = np.hypot(*np.meshgrid(offsets, offsets)) / radius
+
+    def get_alpha(scale: float) -> np.ndarray:
+        return np.clip((scale - distance) * 8, 0, 1)[..., None]
+
+    # Portraits sit off their slot centers, so they are cut around the circles analysis found
+    result = analyze_formation(DecodedFrame(image.copy()), SOURCE_ARENA)
+    circles = {}
+    for a, b, r in result.circles_pos:
+        tile, _ = layouts[SOURCE_ARENA].locate(a / result.width, b / result.width)
+        circles[tile] = (left + a, top + b, r)
+    portraits = []
+    for tile, name in units.items():
+        x, y, r = circles[int(tile)]
+        portraits.append((get_patch(image, (x, y), half), r, name))
+    empty = get_patch(image, center(SOURCE_ARENA, EMPTY_SLOT), half)
+    for tile in units:
+        put_patch(image, center(SOURCE_ARENA, int(tile)), empty, get_alpha(EMPTY_RADIUS))
+    for tile in range(1, len(layouts[arena].centers) + 1):
+        put_patch(image, center(arena, tile), empty, get_alpha(EMPTY_RADIUS))
+
+    labels = {}
+    for tile, (patch, r, name) in zip(tiles, portraits):
+        put_patch(image, center(arena, tile), patch, get_alpha(min(r * PORTRAIT_MARGIN / radius, EMPTY_RADIUS)))
+        labels[str(tile)] = name
+    return image, labels
+
+
+if __name__ == "__main__":
+    with open(path_settings.ground_truth_path, "r") as f:
+        ground_truth = json.load(f)
+    source = next(entry for entry in ground_truth['samples'] if entry['file'] == SOURCE)
+
+    for arena, (file_name, tiles) in LAYOUT_SAMPLES.items():
+        image, labels = make_layout_sample(arena, tiles, source['units'])
+        cv2.imwrite(str(path_settings.base_dir / file_name), image)
+        print(json.dumps({'file': file_name, 'type': "formation", 'arena': arena, 'units': labels}))
@@ -12,6 +12,8 @@ from bot.core.enum_classes import BossType
 from bot.core.utils import datetime_now, discord_timestamp
 from bot.database.database import Database
 from bot.database.users import Users
+from bot.image.render_backends import make_render_backend
+from bot.image.render_pool import RenderPool
 from bot.image.webp_converter import WebpConverter
 from bot.services.counter_service import CounterService
 from bot.services.formation_image_service import FormationImageService
@@ -31,7 +33,8 @@ _db = Database()
 _image_service = ImageService(_db)
 _counter_service = CounterService(_db)
 _users = Users(_db, _image_service)
-_formation_image_service = FormationImageService(_users, _image_service)
+_render_pool = RenderPool()
+_formation_image_service = FormationImageService(_users, _image_service, _render_pool)
 _commands_backend = Commands_Backend(_users, _formation_image_service, _counter_service)
 
 bot = commands.Bot(command_prefix="!", intents=intents)
@@ -40,8 +43,10 @@ commands_frontend = Commands_Frontend(bot, _commands_backend)
 
 @bot.event
 async def setup_hook():
-    """Register persistent views before bot connects."""
+    """Register persistent views, warm the popular tiles and spawn the render workers before bot connects."""
     bot.add_view(ReportFormationView())
+    make_render_backend().prewarm()
+    bot.loop.create_task(_render_pool.warm())
 
 @bot.event
 async def on_ready():
@@ -63,6 +68,8 @@ async def on_ready():
     
     rotate_channels.start()
     logger.info("Channel rotation task started")
+    if not check_render_pool.is_running():
+        check_render_pool.start()
 
 ### AUTOCOMPLETES ###
 async def all_name_autocomplete(interaction: discord.Interaction, current: str):
@@ -125,6 +132,15 @@ tile_types = [discord.app_commands.Choice(name='Artifacts', value="A"), discord.
 async def rotate_channels():
     """Periodic task to rotate channel permissions."""
     await commands_frontend.rotate_channels(bot)
+
+@tasks.loop(minutes=5)
+async def check_render_pool():
+    """Periodic task to ping the render workers and log the queue depth."""
+    status = await _render_pool.check_health()
+    if status is None:
+        logger.warning("Render pool failed its health check: {}".format(_render_pool.metrics()))
+    else:
+        logger.info("Render pool healthy: {}".format(status))
     
 #####################
 ### HOUSE KEEPING ###
@@ -213,6 +229,16 @@ def is_stage_role_ctx(ctx: commands.Context) -> bool:
         return True
     return any(role.id in app_settings.stage_role_ids for role in ctx.author.roles)
 
+def is_admin_ctx(ctx: commands.Context) -> bool:
+    """Check if user has admin or mod role for text commands."""
+    if ctx.guild is None or ctx.guild.id != app_settings.server_id:
+        return False
+    if ctx.author.guild_permissions.administrator:
+        return True
+    if ctx.author.id == app_settings.amaryllis_id:
+        return True
+    return any(role.id in app_settings.admin_mod_role_ids for role in ctx.author.roles)
+
 @bot.command(name='souschef')
 async def souschef(ctx: commands.Context):
     if not is_waiter_ctx(ctx):
@@ -593,6 +619,12 @@ async def submit_formation_phantimal(ctx: commands.Context):
 async def collect(ctx: commands.Context, index: int=-1):
     await commands_frontend.collect_wrapper(ctx, index)
 
+@bot.command(name="learn")
+async def learn(ctx: commands.Context, label: str, number: int=None):
+    if not is_admin_ctx(ctx):
+        return
+    await commands_frontend.learn_wrapper(ctx, label, number)
+
 ### OVERRIDES
 @bot.command(name='amaryllis')
 async def toggle_manage_channels(ctx: commands.Context):
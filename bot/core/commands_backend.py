@@ -112,31 +112,31 @@ class Commands_Backend:
         
         return names
     
-    def add_one(self, user_id: int, name: str, idx: int) -> tuple[str, str]:
+    def add_one(self, user_id: int, name: str, idx: int, render: bool=True) -> tuple[str, str]:
         """Add one unit/artifact and return updated formation image."""
         self.initialize_user(user_id)
         name = self.__add_one(user_id, name, idx)
         if name:
-            return name, self.show_image(user_id)
+            return name, self.__updated_image(user_id, render)
         return None, None
     
-    def remove_one(self, user_id: int, name: str) -> tuple[str, str]:
+    def remove_one(self, user_id: int, name: str, render: bool=True) -> tuple[str, str]:
         """Remove one unit/artifact and return updated formation image."""
         self.initialize_user(user_id)
         name = self.__remove_single(user_id, name)
         if name:
-            return name, self.show_image(user_id)
+            return name, self.__updated_image(user_id, render)
         return None, None
     
-    def swap_pair(self, user_id: int, name1: str, name2: str) -> tuple[list[str], str]:
+    def swap_pair(self, user_id: int, name1: str, name2: str, render: bool=True) -> tuple[list[str], str]:
         """Swap two units/artifacts and return updated formation image."""
         self.initialize_user(user_id)
         names = self.__swap_pair(user_id, name1, name2)
         if names:
-            return names, self.show_image(user_id)
+            return names, self.__updated_image(user_id, render)
         return [], None
     
-    def move_one(self, user_id: int, name: str, idx: int) -> tuple[str, str]:
+    def move_one(self, user_id: int, name: str, idx: int, render: bool=True) -> tuple[str, str]:
         """Move unit/artifact to new position and return updated formation image."""
         self.initialize_user(user_id)
         name = self.__remove_single(user_id, name)
@@ -145,19 +145,27 @@ class Commands_Backend:
         
         name = self.__add_one(user_id, name, idx)
         if name:
-            return name, self.show_image(user_id)
+            return name, self.__updated_image(user_id, render)
         return None, None
     
-    def mirror_formation(self, user_id: int):
+    def mirror_formation(self, user_id: int, render: bool=True):
         """Mirror formation horizontally and return updated image."""
         self.initialize_user(user_id)
         self.users.mirror_formation(user_id)
-        return self.show_image(user_id)
+        return self.__updated_image(user_id, render)
     
     def show_image(self, user_id: int, is_private=True) -> str:
         """Generate and return formation image filename."""
         return self.image_service.generate_formation_image(user_id, is_private)
     
+    async def render_image(self, user_id: int, is_private=True) -> str:
+        """Generate formation image filename without blocking the event loop."""
+        return await self.image_service.render_formation_image(user_id, is_private)
+    
+    def __updated_image(self, user_id: int, render: bool) -> str | None:
+        """Image after an edit, or None when the caller renders it later."""
+        return self.show_image(user_id) if render else None
+    
     def name_to_emoji(self, name: str) -> str | None:
         """Convert unit/artifact name to Discord emoji string."""
         name = translate_name(name)
@@ -169,25 +177,25 @@ class Commands_Backend:
         """Initialize user data if not already loaded."""
         self.users.initialize_user(user_id)
         
-    def clear_user(self, user_id: int):
+    def clear_user(self, user_id: int, render: bool=True):
         """Clear user's formation and return updated image."""
         self.initialize_user(user_id)
         self.users.clear_formation(user_id)
-        return self.show_image(user_id)
+        return self.__updated_image(user_id, render)
     
-    def set_base_hex(self, user_id: int, idx: int, hex_name: str) -> str | None:
+    async def set_base_hex(self, user_id: int, idx: int, hex_name: str, is_private=True) -> str | None:
         """Set base hex fill/outline and return updated image."""
         self.initialize_user(user_id)
         if (idx % 2 == 0 and hex_name in data_settings.fills) or (idx % 2 == 1 and hex_name in data_settings.lines):
             self.users.update_base_hex(user_id, idx, hex_name)
-            return self.show_image(user_id)
+            return await self.render_image(user_id, is_private)
         return None
 
-    def set_settings(self, user_id: int, key: str, value: bool) -> str:
-        """Update user settings and return updated image."""
+    async def set_settings(self, user_id: int, key: str, value: bool, render: bool=True) -> str | None:
+        """Update user settings and return updated image, or None when the caller renders it later."""
         self.initialize_user(user_id)
         self.users.update_settings(user_id, key, value)
-        return self.show_image(user_id)
+        return await self.render_image(user_id) if render else None
         
     def set_name(self, user_id: int, name: str) -> str | None:
         """Set formation name."""
@@ -202,7 +210,7 @@ class Commands_Backend:
         self.initialize_user(user_id)
         return self.users.get_name(user_id)
         
-    def set_map(self, user_id: int, arena: str) -> tuple[str, str]:
+    async def set_map(self, user_id: int, arena: str) -> tuple[str, str]:
         """Set formation map and return updated image."""
         self.initialize_user(user_id)
         arena = translate_name(arena, data_settings.arena_dict)
@@ -210,10 +218,10 @@ class Commands_Backend:
         
         if arena:
             self.users.set_map(user_id, arena)
-            return arena, self.show_image(user_id)
+            return arena, await self.render_image(user_id)
         return None, None
     
-    def add_list(self, user_id: int, pairs: str) -> tuple[list[str], str]:
+    def add_list(self, user_id: int, pairs: str, render: bool=True) -> tuple[list[str], str]:
         """Add multiple units/artifacts from pairs string and return updated image."""
         self.initialize_user(user_id)
         args = split_input(pairs)
@@ -229,22 +237,22 @@ class Commands_Backend:
         added_names = [name for name in added_names if name]
         
         if added_names:
-            return added_names, self.show_image(user_id)
+            return added_names, self.__updated_image(user_id, render)
             
         return [], None
         
-    def remove_list(self, user_id: int, names_or_indices: str) -> tuple[list[str], str]:
+    def remove_list(self, user_id: int, names_or_indices: str, render: bool=True) -> tuple[list[str], str]:
         """Remove multiple units/artifacts and return updated image."""
         self.initialize_user(user_id)
         removed_names = [self.__remove_single(user_id, idx) for idx in split_input(names_or_indices)]
         removed_names = [name for name in removed_names if name]
         
         if removed_names:
-            return removed_names, self.show_image(user_id)
+            return removed_names, self.__updated_image(user_id, render)
         
         return [], None
     
-    def swap_list(self, user_id: int, pairs: str) -> tuple[list[str], str]:
+    def swap_list(self, user_id: int, pairs: str, render: bool=True) -> tuple[list[str], str]:
         """Swap multiple pairs of units/artifacts and return updated image."""
         self.users.initialize_user(user_id)
         args = split_input(pairs)
@@ -257,7 +265,7 @@ class Commands_Backend:
             swapped_names += self.__swap_pair(user_id, args[i], args[i + 1])
         
         if swapped_names:
-            return swapped_names, self.show_image(user_id)
+            return swapped_names, self.__updated_image(user_id, render)
             
         return [], None
     
@@ -271,12 +279,12 @@ class Commands_Backend:
         self.initialize_user(user_id)
         return self.users.get_names_list(user_id)
         
-    def load_formation(self, user_id: int, name: str) -> tuple[bool, str, str]:
+    async def load_formation(self, user_id: int, name: str) -> tuple[bool, str, str]:
         """Load saved formation by name and return updated image."""
         self.initialize_user(user_id)
         success = self.users.switch_formation(user_id, name)
         if success:
-            filename = self.show_image(user_id)
+            filename = await self.render_image(user_id)
             return True, filename, name
         return False, None, name
     
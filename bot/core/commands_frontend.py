@@ -2,18 +2,23 @@ import io
 import logging
 from datetime import datetime, timezone
 
+import cv2
 import discord
+import numpy as np
 from discord.ext import commands
 
 logger = logging.getLogger()
 
 from bot.core.commands_backend import Commands_Backend
-from bot.core.config import app_settings
+from bot.core.config import app_settings, data_settings
 from bot.core.enum_classes import TRANSLATE, BossType, ChannelType, Language
 from bot.core.utils import (clean_input_str, datetime_now, discord_timestamp,
                             get_emoji, get_or_fetch_channel,
                             get_or_fetch_server, is_afk_channel,
-                            is_kitchen_channel, replace_emojis)
+                            is_kitchen_channel, replace_emojis,
+                            translate_name)
+from bot.image.template_pack import get_template_bank, learn_template
+from bot.services.render_coalescer import RenderCoalescer
 from bot.submission.submit_collect import Submit_Collect
 from bot.ui.modals import BasicModal, SpreadsheetModal, StageSubmissionModal
 from bot.ui.views import DropdownView, ReportFormationView, YesNoView
@@ -33,6 +38,7 @@ class Commands_Frontend:
         """Initialize frontend with bot instance and backend."""
         self.backend = backend or Commands_Backend()
         self.bot = bot
+        self.renders = RenderCoalescer(self.backend.render_image)
 
     def infographic(self, value: dict) -> str:
         """Format infographic text with Discord timestamp."""
@@ -83,70 +89,76 @@ class Commands_Frontend:
             return
         await interaction.response.send_message("Invalid name.", ephemeral=not show_public)
         
+    async def send_formation_update(self, interaction: discord.Interaction):
+        """Send the edited formation image unless a newer edit from the same user supersedes it."""
+        filename = await self.renders.request(interaction.user.id)
+        if filename:
+            await interaction.followup.send(file=discord.File(filename), ephemeral=True)
+        
     async def add_wrapper(self, interaction: discord.Interaction, pairs: str, lang: Language=Language.EN):
         """Add units/artifacts to formation from pairs string."""
-        added_names, filename = self.backend.add_list(interaction.user.id, pairs)
+        added_names, _ = self.backend.add_list(interaction.user.id, pairs, render=False)
         
         if added_names:
             await interaction.response.send_message("{}{}".format(TRANSLATE["Added"][lang], get_emojis(added_names)), ephemeral=True)
-            await interaction.followup.send(file=discord.File(filename), ephemeral=True)
+            await self.send_formation_update(interaction)
         else:
             await self.error_message(interaction, lang)
         
     async def remove_wrapper(self, interaction: discord.Interaction, names_or_indices: str, lang: Language=Language.EN):
         """Remove units/artifacts from formation."""
-        removed_names, filename = self.backend.remove_list(interaction.user.id, names_or_indices)
+        removed_names, _ = self.backend.remove_list(interaction.user.id, names_or_indices, render=False)
         
         if removed_names:
             await interaction.response.send_message("{}{}".format(TRANSLATE["Removed"][lang], get_emojis(removed_names)), ephemeral=True)
-            await interaction.followup.send(file=discord.File(filename), ephemeral=True)
+            await self.send_formation_update(interaction)
         else:
             await self.error_message(interaction, lang)
         
     async def swap_wrapper(self, interaction: discord.Interaction, pairs: str, lang: Language=Language.EN):
         """Swap units/artifacts in formation."""
-        swapped_names, filename = self.backend.swap_list(interaction.user.id, pairs)
+        swapped_names, _ = self.backend.swap_list(interaction.user.id, pairs, render=False)
         if swapped_names:
             await interaction.response.send_message("{}{}".format(TRANSLATE['Swapped'][lang], get_emojis(swapped_names)), ephemeral=True)
-            await interaction.followup.send(file=discord.File(filename), ephemeral=True)
+            await self.send_formation_update(interaction)
         else:
             await self.error_message(interaction, lang)
             
     async def add_one_wrapper(self, interaction: discord.Interaction, unit: str, idx: int, lang: Language=Language.EN):
         """Add single unit/artifact to formation."""
-        name, filename = self.backend.add_one(interaction.user.id, unit, idx)
+        name, _ = self.backend.add_one(interaction.user.id, unit, idx, render=False)
         
         if name:
             await interaction.response.send_message("{}{}".format(TRANSLATE["Added"][lang], get_emoji(name)), ephemeral=True)
-            await interaction.followup.send(file=discord.File(filename), ephemeral=True)
+            await self.send_formation_update(interaction)
         else:
             await self.error_message(interaction, lang)
             
     async def remove_one_wrapper(self, interaction: discord.Interaction, name: str, lang: Language=Language.EN):
         """Remove single unit/artifact from formation."""
-        name, filename = self.backend.remove_one(interaction.user.id, name)
+        name, _ = self.backend.remove_one(interaction.user.id, name, render=False)
         
         if name:
             await interaction.response.send_message("{}{}".format(TRANSLATE["Removed"][lang], get_emoji(name)), ephemeral=True)
-            await interaction.followup.send(file=discord.File(filename), ephemeral=True)
+            await self.send_formation_update(interaction)
         else:
             await self.error_message(interaction, lang)
         
     async def swap_pair_wrapper(self, interaction: discord.Interaction, name1: str, name2: str, lang: Language=Language.EN):
         """Swap two units/artifacts in formation."""
-        swapped_names, filename = self.backend.swap_pair(interaction.user.id, name1, name2)
+        swapped_names, _ = self.backend.swap_pair(interaction.user.id, name1, name2, render=False)
         if swapped_names:
             await interaction.response.send_message("{}{}".format(TRANSLATE['Swapped'][lang], get_emojis(swapped_names)), ephemeral=True)
-            await interaction.followup.send(file=discord.File(filename), ephemeral=True)
+            await self.send_formation_update(interaction)
         else:
             await self.error_message(interaction, lang)
             
     async def move_one_wrapper(self, interaction: discord.Interaction, name: str, idx: int, lang: Language=Language.EN):
         """Move unit/artifact to new position."""
-        name, filename = self.backend.move_one(interaction.user.id, name, idx)
+        name, _ = self.backend.move_one(interaction.user.id, name, idx, render=False)
         if name:
             await interaction.response.send_message("{}{}".format('Moved ', get_emoji(name)), ephemeral=True)
-            await interaction.followup.send(file=discord.File(filename), ephemeral=True)
+            await self.send_formation_update(interaction)
         else:
             await self.error_message(interaction, lang)
                 
@@ -154,27 +166,27 @@ class Commands_Frontend:
         """Display current formation image."""
         user_id = interaction.user.id
         self.backend.initialize_user(user_id)
-        filename = self.backend.show_image(user_id=user_id, is_private=not display_mode)
+        filename = await self.backend.render_image(user_id=user_id, is_private=not display_mode)
         await interaction.response.send_message(file=discord.File(filename), ephemeral=ephemeral)
         
     async def clear_wrapper(self, interaction: discord.Interaction, lang: Language=Language.EN):
         """Clear current formation."""
-        filename = self.backend.clear_user(interaction.user.id)
+        self.backend.clear_user(interaction.user.id, render=False)
         await interaction.response.send_message(TRANSLATE['Clear'][lang], ephemeral=True)
-        await interaction.followup.send(file=discord.File(filename), ephemeral=True)
+        await self.send_formation_update(interaction)
         
     async def mirror_wrapper(self, interaction: discord.Interaction, lang: Language=Language.EN):
         """Mirror formation horizontally."""
-        filename = self.backend.mirror_formation(interaction.user.id)
+        self.backend.mirror_formation(interaction.user.id, render=False)
         await interaction.response.send_message('Mirrored formation', ephemeral=True)
-        await interaction.followup.send(file=discord.File(filename), ephemeral=True)
+        await self.send_formation_update(interaction)
         
     async def set_map_wrapper(self, interaction: discord.Interaction, map: str, user_id: int=None, save_map: bool=False, lang: Language=Language.EN):
         """Set formation map."""
         if user_id is None:
             user_id = interaction.user.id
         #map = clean_name(map)
-        map, filename = self.backend.set_map(user_id, map)
+        map, filename = await self.backend.set_map(user_id, map)
         if save_map:
             success, new_name = self.backend.update_formation(user_id)
         if map:
@@ -195,7 +207,7 @@ class Commands_Frontend:
             
     async def show_title_wrapper(self, interaction: discord.Interaction, show_title: bool, lang: Language=Language.EN):
         """Toggle formation title display."""
-        filename = self.backend.set_settings(interaction.user.id, 'show_title', show_title)
+        filename = await self.backend.set_settings(interaction.user.id, 'show_title', show_title)
         if show_title:
             await interaction.response.send_message('Showing title.', ephemeral=True)
             await interaction.followup.send(file=discord.File(filename), ephemeral=True)
@@ -207,7 +219,7 @@ class Commands_Frontend:
             
     async def show_numbers_wrapper(self, interaction: discord.Interaction, show_numbers: bool, lang: Language=Language.EN):
         """Toggle tile number display."""
-        filename = self.backend.set_settings(interaction.user.id, 'show_numbers', show_numbers)
+        filename = await self.backend.set_settings(interaction.user.id, 'show_numbers', show_numbers)
         if show_numbers:
             await interaction.response.send_message('Showing tile numbers.', ephemeral=True)
             await interaction.followup.send(file=discord.File(filename), ephemeral=True)
@@ -219,7 +231,7 @@ class Commands_Frontend:
             
     async def make_transparent_wrapper(self, interaction: discord.Interaction, make_transparent: bool, lang: Language=Language.EN):
         """Toggle base tile transparency."""
-        filename = self.backend.set_settings(interaction.user.id, 'make_transparent', make_transparent)
+        filename = await self.backend.set_settings(interaction.user.id, 'make_transparent', make_transparent)
         if make_transparent:
             await interaction.response.send_message('Base tiles are now transparent.', ephemeral=True)
             await interaction.followup.send(file=discord.File(filename), ephemeral=True)
@@ -235,12 +247,7 @@ class Commands_Frontend:
         if user_id is None:
             user_id = interaction.user.id
             
-        filename = self.backend.set_base_hex(user_id, idx, hex_name)
-        if not filename:
-            await self.error_message(interaction, lang)
-            return
-            
-        filename = self.backend.show_image(user_id=user_id, is_private=False)
+        filename = await self.backend.set_base_hex(user_id, idx, hex_name, is_private=False)
         if filename:
             await interaction.response.send_message('Base hex has been changed.', ephemeral=ephemeral)
             await interaction.followup.send(file=discord.File(filename), ephemeral=ephemeral)
@@ -253,17 +260,11 @@ class Commands_Frontend:
         if user_id is None:
             user_id = interaction.user.id
             
-        filename = self.backend.set_settings(user_id, 'make_transparent', make_transparent)
+        await self.backend.set_settings(user_id, 'make_transparent', make_transparent, render=False)
         if not make_transparent:
-            filename = self.backend.set_base_hex(user_id, 0, fill_name)
-            
-        filename = self.backend.set_base_hex(user_id, 1, line_name)
-        
-        if not filename:
-            await self.error_message(interaction, lang)
-            return
+            await self.backend.set_base_hex(user_id, 0, fill_name, is_private=False)
             
-        filename = self.backend.show_image(user_id=user_id, is_private=False)
+        filename = await self.backend.set_base_hex(user_id, 1, line_name, is_private=False)
         if filename:
             #await interaction.response.send_message('Base hex has been changed.', ephemeral=ephemeral)
             await interaction.response.send_message(file=discord.File(filename), ephemeral=ephemeral)
@@ -292,7 +293,7 @@ class Commands_Frontend:
             await view.wait()
             if not view.result: return
         
-        success, filename, name = self.backend.load_formation(user_id, name)
+        success, filename, name = await self.backend.load_formation(user_id, name)
         
         if success:
             await interaction.followup.send("Loading new formation: {}".format(name), ephemeral=True)
@@ -434,6 +435,38 @@ class Commands_Frontend:
         if len(files) >= 10:
             await ctx.channel.send(files=files[10:])
             
+    async def learn_wrapper(self, ctx: commands.Context, label: str, number: int=None):
+        """Add a logged circle crop from the spam thread to the template bank under the correct label."""
+        if not ctx.message.reference or ctx.channel.id != app_settings.thread_id:
+            return
+        
+        label = translate_name(label)
+        if label not in data_settings.all_hex_names and label not in get_template_bank().labels:
+            await ctx.send("Unknown unit: {}".format(label))
+            return
+        
+        # Crops are logged as "{name}_{number}.png"; the formation render is not a crop
+        replied_message = await ctx.channel.fetch_message(ctx.message.reference.message_id)
+        crops = [attachment for attachment in replied_message.attachments
+                 if attachment.filename.endswith(".png") and attachment.filename not in ("formation.png", "circles.png")]
+        if number is not None:
+            crops = [attachment for attachment in crops if attachment.filename.endswith("_{}.png".format(number))]
+        if len(crops) != 1:
+            options = ", ".join(attachment.filename for attachment in crops) or "none"
+            await ctx.send("Pick one crop by tile number. Crops: {}".format(options))
+            return
+        
+        image_bytes = await crops[0].read()
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            await ctx.send("Could not read {}".format(crops[0].filename))
+            return
+        
+        if learn_template(image, label):
+            await ctx.send("Learned {} from {} ({} templates)".format(label, crops[0].filename, len(get_template_bank())))
+        else:
+            await ctx.send("{} is already a template".format(crops[0].filename))
+    
     async def context_no_modal_wrapper(self, interaction: discord.Interaction, message: discord.Message):
         if isinstance(message.channel, discord.DMChannel):
             await interaction.response.send_message("Submissions are only allowed from Yaphalla", ephemeral=True)
@@ -92,6 +92,17 @@ class AppSettings(BaseSettings):
         description="Default Google Sheets spreadsheet ID"
     )
     
+    log_contact_sheet: bool = Field(
+        default=False,
+        description="Log a submission's circle crops as one contact sheet instead of one file each"
+    )
+    
+    render_workers: int = Field(
+        default=1,
+        ge=1,
+        description="Render worker processes; each warm worker holds about 85 MB"
+    )
+    
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -221,6 +232,31 @@ class PathSettings(BaseSettings):
     def templates_folder(self) -> Path:
         """Path to templates folder."""
         return self.base_dir / "assets" / "images" / "templates"
+    
+    @property
+    def ground_truth_path(self) -> Path:
+        """Path to labeled ground truth for the sample screenshots."""
+        return self.base_dir / "benchmarks" / "ground_truth.json"
+    
+    @property
+    def cache_folder(self) -> Path:
+        """Path to folder for generated build artifacts."""
+        return self.base_dir / "cache"
+    
+    @property
+    def template_pack_folder(self) -> Path:
+        """Path to the precompiled template pack."""
+        return self.cache_folder / "templates"
+    
+    @property
+    def ocr_cache_folder(self) -> Path:
+        """Path to persisted OCR results."""
+        return self.cache_folder / "ocr"
+    
+    @property
+    def tile_atlas_folder(self) -> Path:
+        """Path to the pre-scaled tile atlas."""
+        return self.cache_folder / "atlas"
 
 
 class DataSettings(BaseSettings):
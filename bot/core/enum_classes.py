@@ -46,6 +46,20 @@ class BossType(Enum):
     PRIMAL_LORD = 4
     MISC = 5
 
+class ScreenshotType(Enum):
+    DAMAGE = 0
+    FORMATION = 1
+    TEAM = 2
+    UNKNOWN = 3
+    
+    @property
+    def has_damage(self) -> bool:
+        return self != ScreenshotType.FORMATION
+    
+    @property
+    def has_formation(self) -> bool:
+        return self in (ScreenshotType.FORMATION, ScreenshotType.UNKNOWN)
+
 class Language(Enum):
     EN = 0
     CN = 1
@@ -1,11 +1,19 @@
 import io
 import os
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
 
 import cv2
 import numpy as np
 
-from bot.core.config import path_settings
+from bot.core.config import data_settings
+from bot.image.frame import DecodedFrame, as_frame
+from bot.image.hex import Hex
+from bot.image.recognition_engines import NCCEngine, RecognitionEngine
+from bot.image.template_pack import (CIRCLE_TEMPLATE_SIZE, TemplateBank,
+                                     get_template_bank)
 
 BOUNDARIES = [{
     1: [0.328, 0.423, 0.435, 0.521],
@@ -36,26 +44,207 @@ BOUNDARIES = [{
     -1: [0.115, 0.225, 0.800, 0.920]
 }]
 
+# Arenas whose slot boundaries were measured from screenshots. They calibrate
+# the hex-to-screenshot transform that every arena in maps.json is laid out with.
+LAYOUT_BOUNDARIES = {
+    "Arena I": BOUNDARIES[0],
+    "Ravaged Realm": BOUNDARIES[1]
+}
+DEFAULT_ARENA = "Arena I"
+ARTIFACT_BOUNDS = BOUNDARIES[0][-1]
+SLOT_DIAMETER = BOUNDARIES[0][1][1] - BOUNDARIES[0][1][0]
+
+# A circle further than half a slot radius from the tile center is not on the tile
+MIN_TILE_CONFIDENCE = 0.5
+
 # RECT_FOLDER = 'Cropped_Rectangles'
-CIRCLE_TEMPLATE_SIZE = (96, 96)
 RECT_TEMPLATE_SIZE = (110, 118)
+# Border detection runs on a mask this many times smaller; a border narrower
+# than this fraction of the image is implausible and is searched for again in full
+BORDER_PROXY_SCALE = 4
+BORDER_MIN_WIDTH = 0.5
+CONTACT_SHEET_LABEL_HEIGHT = 18
+
+# Slot sampling: every slot is resampled to a fixed grid so the occupancy
+# test does not depend on the screenshot resolution
+SLOT_SAMPLE_SIZE = 48
+SLOT_EMPTY_MAX = 18.0
+SLOT_OCCUPIED_MIN = 24.0
+
+def fit_hex_transform() -> np.ndarray:
+    """Fit the affine map from hex pixel coordinates to screenshot width fractions on the measured layouts."""
+    src, dst = [], []
+    for arena, bounds in LAYOUT_BOUNDARIES.items():
+        for idx, (q, r) in enumerate(Hex.order_tiles(data_settings.maps[arena]['Tiles'])):
+            x1, x2, y1, y2 = bounds[idx + 1]
+            src.append([*Hex.qr_to_exact_xy(q, r), 1])
+            dst.append([(x1 + x2) / 2, (y1 + y2) / 2])
+
+    transform, *_ = np.linalg.lstsq(np.array(src), np.array(dst), rcond=None)
+    return transform
+
+class Layout:
+    """Tile geometry of one arena, in fractions of the cropped (square) screenshot width."""
+    def __init__(self, name: str, tiles: list[list[int]], transform: np.ndarray):
+        """Precompute tile centers and the tile lookup for the inverse transform."""
+        self.name = name
+        self.transform = transform
+        self.inverse = np.linalg.inv(transform[:2])
+
+        ordered = Hex.order_tiles(tiles)
+        self.index = {tuple(tile): idx + 1 for idx, tile in enumerate(ordered)}
+        self.centers = np.array([[*Hex.qr_to_exact_xy(q, r), 1] for q, r in ordered]) @ transform
+
+    def locate(self, x: float, y: float) -> tuple[int, float]:
+        """Get tile number and distance-based confidence of a point, or tile 0 if it is off the arena."""
+        hex_x, hex_y = (np.array([x, y]) - self.transform[2]) @ self.inverse
+        tile = self.index.get(Hex.round_qr(*Hex.xy_to_qr(hex_x, hex_y)), 0)
+        if not tile:
+            return 0, 0.0
+
+        distance = np.hypot(*(np.array([x, y]) - self.centers[tile - 1]))
+        return tile, float(max(0.0, 1 - distance / (SLOT_DIAMETER / 2)))
+
+@lru_cache(maxsize=None)
+def get_layouts() -> dict[str, Layout]:
+    """Build the layout of every arena in maps.json once; layouts are read-only."""
+    transform = fit_hex_transform()
+    return {arena: Layout(arena, value['Tiles'], transform) for arena, value in data_settings.maps.items()}
+
+def encode_png(image: np.ndarray) -> io.BytesIO | None:
+    """Encode an image array to an in-memory PNG, only when it is actually sent."""
+    if image is None:
+        return None
+    
+    success, encoded_image = cv2.imencode('.png', image)
+    if not success:
+        return None
+    
+    byte_stream = io.BytesIO(encoded_image.tobytes())
+    byte_stream.seek(0)
+    return byte_stream
+
+def make_contact_sheet(units: list[dict], columns: int=5) -> np.ndarray | None:
+    """Tile the circle crops of recognized units into one labeled image."""
+    crops = [unit for unit in units if unit['image'] is not None]
+    if not crops:
+        return None
+    
+    cell_w, cell_h = CIRCLE_TEMPLATE_SIZE[0], CIRCLE_TEMPLATE_SIZE[1] + CONTACT_SHEET_LABEL_HEIGHT
+    rows = (len(crops) + columns - 1) // columns
+    sheet = np.zeros((rows * cell_h, min(len(crops), columns) * cell_w, 3), dtype=np.uint8)
+    
+    for i, unit in enumerate(crops):
+        x, y = (i % columns) * cell_w, (i // columns) * cell_h
+        crop = unit['image']
+        if crop.shape[2] == 4:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGRA2BGR)
+        sheet[y:y + CIRCLE_TEMPLATE_SIZE[1], x:x + cell_w] = cv2.resize(crop, CIRCLE_TEMPLATE_SIZE, interpolation=cv2.INTER_AREA)
+        
+        label = "{} {}".format(unit['name'], unit['number'])
+        cv2.putText(sheet, label, (x + 2, y + cell_h - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.35, (255, 255, 255), 1, cv2.LINE_AA)
+    return sheet
+
+@dataclass(frozen=True)
+class FormationResult:
+    """Outcome of one formation analysis."""
+    units: tuple[dict, ...] = ()
+    arena: str | None = None
+    width: int = 0
+    height: int = 0
+    circles_pos: tuple[tuple[int, int, int], ...] = ()
+    circles: tuple[np.ndarray, ...] = ()
+    timings: dict[str, float] = field(default_factory=dict, compare=False)
+
+    def __bool__(self) -> bool:
+        return self.arena is not None
+
+def analyze_formation(image: bytes | DecodedFrame, arena: str=None, engine: RecognitionEngine=None,
+                      fast: bool=True) -> FormationResult:
+    """
+    Analyze one formation screenshot without shared mutable state.
+    
+    Safe to call concurrently from threads. In a process pool, leave engine
+    as None so every worker memory-maps the template pack instead of
+    receiving a pickled copy of it.
+    
+    Args:
+        image: Image bytes or decoded frame
+        arena: Arena hint for layout ties; the layout is detected
+        engine: Recognition engine over a read-only template bank
+        fast: Sample known slot positions before falling back to Hough
+    """
+    analysis = FormationAnalysis(engine or NCCEngine(get_template_bank()), get_layouts(), fast)
+    units = analysis.process_image(image, arena)
+    if not analysis.arena:
+        return FormationResult()
+    
+    return FormationResult(
+        units=tuple(units),
+        arena=analysis.arena,
+        width=analysis.width,
+        height=analysis.height,
+        circles_pos=tuple(tuple(int(v) for v in pos) for pos in analysis.circles_pos),
+        circles=tuple(analysis.circles),
+        timings=analysis.timings)
 
 class Analyze_Image:
     """Analyze formation images to extract unit and artifact positions."""
-    def __init__(self):
-        """Initialize analyzer and load template images."""
+    def __init__(self, fast: bool=True, bank: TemplateBank=None, engine: RecognitionEngine=None):
+        """Initialize analyzer with the shared precompiled template bank and a recognition engine."""
+        self.fast = fast
+        self.layouts = get_layouts()
+        self.bank = engine.bank if engine else bank or get_template_bank()
+        self.engine = engine or NCCEngine(self.bank)
+        self.clear()
+    
+    def clear(self):
+        """Forget the last result."""
+        self.result = FormationResult()
+    
+    @property
+    def units(self) -> list[dict]:
+        return list(self.result.units)
+    
+    @property
+    def arena(self) -> str | None:
+        return self.result.arena
+    
+    @property
+    def layout(self) -> Layout | None:
+        return self.layouts.get(self.result.arena)
+    
+    @property
+    def width(self) -> int:
+        return self.result.width
+    
+    @property
+    def height(self) -> int:
+        return self.result.height
+    
+    @property
+    def circles_pos(self) -> list[tuple[int, int, int]]:
+        return list(self.result.circles_pos)
+    
+    @property
+    def circles(self) -> list[np.ndarray]:
+        return list(self.result.circles)
+    
+    def process_image(self, image: bytes | DecodedFrame, arena: str=None):
+        """Process image bytes or a decoded frame to extract formation data. The arena is only a hint; the layout is detected."""
+        self.result = analyze_formation(image, arena, self.engine, self.fast)
+        if not self.result:
+            return None, None, None
+        return self.units
+
+class FormationAnalysis:
+    """Working state of a single analysis; analyze_formation creates one per call."""
+    def __init__(self, engine: RecognitionEngine, layouts: dict[str, Layout], fast: bool=True):
+        """Initialize analysis with a recognition engine and the arena layouts."""
+        self.fast = fast
+        self.layouts = layouts
+        self.engine = engine
         self.clear()
-        
-        self.circ_templates = {}
-        for file_path in path_settings.templates_folder.iterdir():
-            if file_path.suffix.lower() in ('.png', '.jpg', '.jpeg', '.webp'):
-                input_img = cv2.imread(str(file_path), cv2.IMREAD_UNCHANGED)
-                if input_img is None:
-                    raise ValueError
-                
-                name = file_path.stem
-                template = cv2.resize(input_img, CIRCLE_TEMPLATE_SIZE, interpolation=cv2.INTER_AREA)
-                self.circ_templates[name] = template
         """
         self.rect_templates = {}
         for filename in os.listdir(RECT_FOLDER):
@@ -88,51 +277,62 @@ class Analyze_Image:
         self.units = []
         self.artifact = None
         self.rectangle = None
+        self.layout = None
+        self.arena = None
+        self.timings = {}
         
-    def process_image(self, image_bytes, rr_map: bool=False):
-        """Process image bytes to extract formation data."""
+    def process_image(self, image: bytes | DecodedFrame, arena: str=None):
+        """Process image bytes or a decoded frame to extract formation data. The arena is only a hint; the layout is detected."""
         self.clear()
         
-        np_array = np.frombuffer(image_bytes, np.uint8)
-        self.image = cv2.imdecode(np_array, cv2.IMREAD_COLOR)
-        self.gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        frame = as_frame(image)
+        if frame is None:
+            return None, None, None
+        self.image = frame.bgr
+        self.gray = frame.gray
         
         # Crop the image to the white border
-        self.image = self.crop_image()
-        if self.image is None:
+        start = time.perf_counter()
+        frame = self.crop_image(frame)
+        if frame is None:
             return None, None, None
+        self.image = frame.bgr
         
         # If image was too small, this is not valid
         self.height, self.width = self.image.shape[:2]
         if self.height < 30 or self.width < 30:
             return None, None, None
         
-        map_type = 1 if rr_map else 0
-        # Calculate bounds based on current image dimensions
-        self.bounds = {key : [value[0] * self.width,
-                              value[1] * self.width,
-                              value[2] * self.height,
-                              value[3] * self.height]
-                        for key, value in BOUNDARIES[map_type].items()}
-        
         self.get_rectangle()
-        # Remove bottom section, stripping off the investment section
+        # Remove bottom section, stripping off the investment section; the crops share the decoded gray
         self.height = int(self.height * 2 / 3)
-        self.image = self.image[:self.height, :self.width]
-        self.gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        frame = frame.crop(0, 0, self.width, self.height)
+        self.image = frame.bgr
+        self.gray = frame.gray
+        self.timings['crop'] = time.perf_counter() - start
         
         # Calculate approximate size of circles
-        self.diameter = self.bounds[1][1] - self.bounds[1][0]
+        self.diameter = SLOT_DIAMETER * self.width
         self.minRadius = int(self.diameter / 3)
         
-        # Get position of circles via Hough
-        self.get_circles_pos()
+        # Sample the known slot positions, fall back to Hough if unsure
+        start = time.perf_counter()
+        if self.fast:
+            self.arena = self.get_slot_circles_pos(arena)
+        if not self.arena:
+            self.get_circles_pos()
+            self.arena = self.detect_layout(arena)
+        self.layout = self.layouts[self.arena]
+        self.timings['detect'] = time.perf_counter() - start
         
         # Crop the circles
+        start = time.perf_counter()
         self.get_circles()
         
         # Get tile numbers and character names
-        return self.categorize()
+        units = self.categorize()
+        self.timings['classify'] = time.perf_counter() - start
+        return units
 
     def pad_to_aspect(self, image, aspect_ratio):
         """Pad image to match target aspect ratio."""
@@ -152,21 +352,19 @@ class Analyze_Image:
     
     def get_rectangle(self):
         """Extract rectangle region for artifact detection."""
-        int_bounds = [int(bound) for bound in self.bounds[-1]]
+        int_bounds = [int(ARTIFACT_BOUNDS[0] * self.width),
+                      int(ARTIFACT_BOUNDS[1] * self.width),
+                      int(ARTIFACT_BOUNDS[2] * self.height),
+                      int(ARTIFACT_BOUNDS[3] * self.height)]
         self.rectangle = self.image[int_bounds[2]:int_bounds[3], int_bounds[0]:int_bounds[1]]
         
-    def add_unit(self, unit_name, tile_number, image):
-        """Create unit dictionary with name, tile number, and image bytes."""
-        success, encoded_image = cv2.imencode('.png', image)
-        byte_stream = None
-        if success:
-            byte_stream = io.BytesIO(encoded_image.tobytes())
-            byte_stream.seek(0)
-        
+    def add_unit(self, unit_name, tile_number, tile_confidence, image):
+        """Create unit dictionary with name, tile number, tile confidence and the raw circle crop."""
         return {
             'name': unit_name,
             'number': tile_number,
-            'image': byte_stream}
+            'tile_confidence': tile_confidence,
+            'image': image}
         
     def categorize(self) -> list[dict]:
         """Categorize all detected circles and return unit list."""
@@ -181,11 +379,13 @@ class Analyze_Image:
         # unit_name = self.categorize_rectangle()
         #self.artifact = self.add_unit(unit_name, -1, self.rectangle)
             
+        labels = self.engine.classify_many(self.circles)
         for i in range(len(self.circles_pos) - 1, -1, -1):
-            tile_number, unit_name = self.categorize_circle(i)
+            tile_number, tile_confidence = self.categorize_circle(i)
+            unit_name, _ = labels[i]
             if unit_name == "None" or tile_number == 0:
                 continue
-            self.units.append(self.add_unit(unit_name, tile_number, self.circles[i]))
+            self.units.append(self.add_unit(unit_name, tile_number, tile_confidence, self.circles[i]))
             
         #return image_byte_stream,
         return self.units
@@ -205,19 +405,53 @@ class Analyze_Image:
             filename = temp_dir / f"{name}_{number}.png"
             cv2.imwrite(str(filename), image)
     
-    def crop_image(self):
-        """Crop image to remove white border."""
-        _, mask = cv2.threshold(self.gray, 240, 255, cv2.THRESH_BINARY)
-
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        contours = sorted(contours, key=cv2.contourArea, reverse=True)
-
-        # assume the largest contour is border
-        if contours:
-            x, y, w, h = cv2.boundingRect(contours[0])
-            return self.image[y+h-w:y+h, x:x+w]
+    def crop_image(self, frame: DecodedFrame) -> DecodedFrame | None:
+        """Crop frame to remove white border."""
+        _, mask = cv2.threshold(frame.gray, 240, 255, cv2.THRESH_BINARY)
+        
+        # Find the border on a small proxy, refined to exact pixels, unless the proxy is implausible
+        border = self.find_border_proxy(mask)
+        if border is None:
+            border = self.find_border(mask)
+        
+        if border:
+            x, y, w, h = border
+            return frame.crop(x, y+h-w, x+w, y+h)
         return None
     
+    def find_border(self, mask: np.ndarray) -> tuple[int, int, int, int] | None:
+        """Bounding box of the largest white contour, which is assumed to be the border."""
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None
+        return cv2.boundingRect(max(contours, key=cv2.contourArea))
+    
+    def find_border_proxy(self, mask: np.ndarray) -> tuple[int, int, int, int] | None:
+        """Find the border on a mask max-pooled by BORDER_PROXY_SCALE, then refine it in full resolution."""
+        scale = BORDER_PROXY_SCALE
+        h, w = mask.shape[:2]
+        if h < scale * 8 or w < scale * 8:
+            return None
+        
+        # Every diagonal phase of a block is kept, so any full-length horizontal
+        # or vertical border line, however thin, stays white in the proxy
+        mask = mask[:h - h % scale, :w - w % scale]
+        proxy = mask[::scale, ::scale]
+        for k in range(1, scale):
+            proxy = cv2.max(proxy, mask[k::scale, k::scale])
+        box = self.find_border(proxy)
+        if box is None or box[2] < BORDER_MIN_WIDTH * proxy.shape[1]:
+            return None
+        
+        # Exact extent of the white pixels around the proxy box
+        px, py, pw, ph = box
+        x0, y0 = max(px * scale - scale, 0), max(py * scale - scale, 0)
+        x1, y1 = min((px + pw + 1) * scale, w), min((py + ph + 1) * scale, h)
+        x, y, bw, bh = cv2.boundingRect(mask[y0:y1, x0:x1])
+        if bw == 0:
+            return None
+        return (x0 + x, y0 + y, bw, bh)
+    
     def get_circles_pos(self):
         """Detect circle positions using Hough circle detection."""
         gray_blurred = cv2.blur(self.gray, (3, 3))
@@ -234,19 +468,114 @@ class Analyze_Image:
             for pt in circles[0, :]:
                 if count >= 10: # limit to 10 units
                     break
-                a, b, r = pt[0], pt[1], pt[2]
+                # Python ints, as uint16 wraps around when a circle's edge leaves the image
+                a, b, r = (int(v) for v in pt)
                 self.circles_pos.append([a, b, r])
                 count += 1
                 
-    def get_mask(self, size):
-        """Create circular mask for template matching."""
-        h, w = size
-        mask = np.zeros((h, w), dtype=np.uint8)
-        center = (w // 2, h // 2)
-        radius = min(center)
-        cv2.circle(mask, center, radius, 255, -1)
-        return mask
-                
+    def get_slot_patches(self, centers: np.ndarray, radius: float) -> np.ndarray:
+        """Resample the square around every slot center to a fixed-size grayscale patch."""
+        offsets = ((np.arange(SLOT_SAMPLE_SIZE) + 0.5) / SLOT_SAMPLE_SIZE * 2 - 1) * radius
+        xs = np.clip(np.rint(centers[:, 0, None] + offsets), 0, self.width - 1).astype(np.intp)
+        ys = np.clip(np.rint(centers[:, 1, None] + offsets), 0, self.height - 1).astype(np.intp)
+        return self.gray[ys[:, :, None], xs[:, None, :]]
+
+    def get_slot_scores(self, patches: np.ndarray) -> np.ndarray:
+        """Mean absolute Laplacian inside the circle of each patch."""
+        p = patches.astype(np.float32)
+        lap = np.abs(4 * p[:, 1:-1, 1:-1] - p[:, :-2, 1:-1] - p[:, 2:, 1:-1] - p[:, 1:-1, :-2] - p[:, 1:-1, 2:])
+
+        offsets = (np.arange(1, SLOT_SAMPLE_SIZE - 1) + 0.5) / SLOT_SAMPLE_SIZE * 2 - 1
+        mask = offsets[:, None] ** 2 + offsets[None, :] ** 2 <= 1
+        return lap[:, mask].mean(axis=1)
+
+    def get_layout_order(self, hint: str=None) -> list[str]:
+        """Layout names in tie-breaking order, hinted arena first."""
+        order = list(self.layouts)
+        if hint in self.layouts:
+            order.remove(hint)
+            order.insert(0, hint)
+        return order
+
+    def get_slot_centers(self) -> tuple[np.ndarray, np.ndarray]:
+        """Layout name and pixel center of every slot of every layout."""
+        names = np.array([name for name, layout in self.layouts.items() for _ in layout.centers])
+        centers = np.concatenate([layout.centers for layout in self.layouts.values()]) * self.width
+        return names, centers
+
+    def get_slot_circles_pos(self, hint: str=None) -> str | None:
+        """
+        Detect occupied slots of all layouts at once. Returns the best layout, or None if Hough should decide instead.
+
+        A layout is ruled out by occupied slots that it has no slot at, so the
+        layout that explains every occupied slot with the most of its own wins.
+        Slots shared by several layouts are no evidence either way: when the
+        occupied slots fit more than one layout equally, as with Thalassa
+        lineups on slots 1-10 or Ravaged Realm lineups on its first five
+        slots, the hinted arena wins and then the order of maps.json.
+        """
+        names, centers = self.get_slot_centers()
+        radius = self.diameter / 2
+
+        scores = self.get_slot_scores(self.get_slot_patches(centers, radius))
+        # Scores between the two thresholds are ambiguous
+        ambiguous = (scores > SLOT_EMPTY_MAX) & (scores < SLOT_OCCUPIED_MIN)
+        occupied = scores >= SLOT_OCCUPIED_MIN
+        # Slots of different layouts closer than a slot radius are the same spot on screen
+        shared = np.hypot(*(centers[:, None] - centers[None, :]).transpose(2, 0, 1)) < radius
+
+        best, best_rank = None, None
+        for name in self.get_layout_order(hint):
+            in_layout = names == name
+            count = np.count_nonzero(occupied & in_layout)
+            if np.any(ambiguous & in_layout) or count < 3 or count > 10:
+                continue
+            unexplained = np.count_nonzero(occupied & ~shared[:, in_layout].any(axis=1))
+            rank = (-unexplained, count)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = name, rank
+
+        if best is None:
+            return None
+
+        for i in np.flatnonzero(occupied & (names == best)):
+            self.circles_pos.append(self.refine_slot_circle(centers[i], radius))
+        return best
+
+    def detect_layout(self, hint: str=None) -> str:
+        """Pick the layout whose slots hold the most detected circles, the hinted arena on ties."""
+        order = self.get_layout_order(hint)
+        if not self.circles_pos:
+            return order[0]
+
+        best, best_hits = order[0], -1
+        for name in order:
+            layout = self.layouts[name]
+            hits = sum(layout.locate(a / self.width, b / self.width)[1] >= MIN_TILE_CONFIDENCE
+                       for a, b, _ in self.circles_pos)
+            if hits > best_hits:
+                best, best_hits = name, hits
+        return best
+
+    def refine_slot_circle(self, center: np.ndarray, radius: float) -> list[int]:
+        """Snap a slot center to the portrait circle around it, using Hough on the slot only."""
+        cx, cy = (int(v) for v in np.rint(center))
+        r = int(round(radius))
+        x1, y1 = max(cx - 2 * r, 0), max(cy - 2 * r, 0)
+        roi = cv2.blur(self.gray[y1:cy + 2 * r, x1:cx + 2 * r], (3, 3))
+
+        circles = cv2.HoughCircles(
+            roi, cv2.HOUGH_GRADIENT, dp=1, minDist=self.minRadius,
+            param1=220, param2=22, minRadius=self.minRadius, maxRadius=self.minRadius * 2
+        )
+
+        if circles is not None:
+            for a, b, found_r in circles[0, :]:
+                a, b = int(round(a)) + x1, int(round(b)) + y1
+                if (a - cx) ** 2 + (b - cy) ** 2 <= (r / 2) ** 2:
+                    return [a, b, int(round(found_r))]
+        return [cx, cy, r]
+
     def get_circles(self):
         """Extract circular regions from detected positions."""
         for a, b, r in self.circles_pos:
@@ -291,35 +620,9 @@ class Analyze_Image:
     """
     
     def categorize_circle(self, index):
-        """Identify tile position and unit name for a detected circle."""
+        """Identify tile position for a detected circle."""
         a, b, r = self.circles_pos[index]
-        x1, y1 = max(a - r, 0), max(b - r, 0)
-        x2, y2 = min(a + r, self.width), min(b + r, self.height)
-    
-        tile = 0
-        for key, values in self.bounds.items():
-            w = (values[1] - values[0]) / 4
-            h = (values[3] - values[2]) / 4
-            if x1 + r > values[0] + w and x2 - r < values[1] - w and y1 + r > values[2] + h and y2 - r < values[3] - h:
-                tile = key
-                break
-            
-        circle = self.circles[index]
-        if circle.shape[2] == 4:
-            circle = cv2.cvtColor(circle, cv2.COLOR_BGRA2BGR)
-
-        input_resized = cv2.resize(circle, CIRCLE_TEMPLATE_SIZE, interpolation=cv2.INTER_AREA)
-        mask = self.get_mask(CIRCLE_TEMPLATE_SIZE[::-1])
-
-        best_score = -1
-        best_label = None
-
-        for label, template in self.circ_templates.items():
-            result = cv2.matchTemplate(input_resized, template, cv2.TM_CCOEFF_NORMED, mask=mask)
-            _, score, _, _ = cv2.minMaxLoc(result)
-
-            if score > best_score:
-                best_score = score
-                best_label = label.split('_', 1)[0]
-
-        return tile, best_label
\ No newline at end of file
+        tile, tile_confidence = self.layout.locate(a / self.width, b / self.width)
+        if tile_confidence < MIN_TILE_CONFIDENCE:
+            tile = 0
+        return tile, tile_confidence
\ No newline at end of file
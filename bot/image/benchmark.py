@@ -0,0 +1,331 @@
+"""
+Benchmark and accuracy suite for the recognition pipeline.
+
+Runs every labeled sample screenshot through decode, routing, border crop,
+layout detection, classification, OCR and rendering, and reports per-stage
+latency (p50/p95), the memory high-water mark and accuracy against the
+ground truth. Everything runs offline on the files in the repository.
+
+    python -m bot.image.benchmark            compare against the stored baseline
+    python -m bot.image.benchmark --save     store this run as the new baseline
+
+The command exits non-zero when accuracy drops or a stage gets slower than
+the baseline by more than the allowed ratio plus a fixed tolerance, so
+matcher and OCR changes can be checked before they ship. Latencies are
+compared in units of a fixed reference workload timed in the same run, so a
+baseline saved on one machine holds on a slower or faster one. Checks that
+could not run, such as OCR without Tesseract, are skipped, not failed. Layouts are
+detected without the labeled arena as a hint, so arena accuracy is earned;
+Thalassa shares its slots with Arena I and is only told apart by a hint.
+"""
+import argparse
+import json
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from bot.core.config import path_settings
+from bot.core.enum_classes import ScreenshotType
+from bot.image.analyze_image import analyze_formation
+from bot.image.damage_extractor import DamageExtractor, OCRCache
+from bot.image.frame import DecodedFrame
+from bot.image.screenshot_router import classify_screenshot
+
+STAGES = ('decode', 'route', 'crop', 'detect', 'classify', 'ocr', 'render')
+DEFAULT_REPEAT = 10
+# Timed passes go on past the repeat count until the corpus ran this long
+MIN_RUN_SECONDS = 3.0
+# A stage regresses when its p50 grows past this ratio of the baseline and
+# by more than the tolerance, which covers timer and scheduler noise of the
+# stages that take a few milliseconds
+MAX_SLOWDOWN = 1.25
+REGRESSION_TOLERANCE_MS = 2.0
+OCR_LANGUAGES = 'eng'
+# Reference workload: decode-sized image operations on a fixed screenshot-sized image
+REFERENCE_SHAPE = (1920, 1080, 3)
+REFERENCE_REPEAT = 30
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Percentile of a list of timings, None if nothing was timed."""
+    return float(np.percentile(values, q)) if values else None
+
+
+def calibrate(repeat: int=REFERENCE_REPEAT) -> float:
+    """Median milliseconds of the reference workload on this machine."""
+    image = np.random.default_rng(0).integers(0, 256, REFERENCE_SHAPE, dtype=np.uint8)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        gray = cv2.GaussianBlur(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        small = cv2.resize(image, (image.shape[1] // 2, image.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        cv2.imencode(".png", small)
+        np.abs(cv2.Laplacian(gray, cv2.CV_16S)).mean()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+
+def load_ground_truth(ground_truth_path: Path=None) -> list[dict]:
+    """Labeled samples from the ground truth file."""
+    with open(ground_truth_path or path_settings.ground_truth_path, "r") as f:
+        return json.load(f)['samples']
+
+
+def get_ocr_extractor() -> DamageExtractor | None:
+    """Extractor with a private cache so OCR is always timed, or None if Tesseract is unavailable."""
+    try:
+        extractor = DamageExtractor(languages=OCR_LANGUAGES, cache=OCRCache())
+        extractor.backend.get_languages()
+    except Exception:
+        return None
+    return extractor
+
+
+def render_units(units: dict[str, str], arena: str, user_id: Path, backend: str=None) -> str:
+    """
+    Render a formation with the default user settings, returning the file name.
+    
+    The user ID is the output path without extension; pass a new one per
+    render, or the renderer redraws only the difference to the last image.
+    """
+    from bot.database.database import DEFAULT_HEXES
+    from bot.image.image_maker import Image_Maker
+    from bot.image.render_backends import make_render_backend
+
+    # Some template labels, such as the Real and Fake clones, have no tile to draw
+    backend = make_render_backend(backend)
+    units = {int(tile): name for tile, name in units.items() if name in backend.tiles}
+    settings = {'make_transparent': False, 'show_numbers': True, 'show_title': False}
+    with Image_Maker(user_id, DEFAULT_HEXES, settings, arena, False, False, backend=backend) as img_maker:
+        return img_maker.generate_image("", units, {})
+
+
+class Benchmark:
+    """Timings and accuracy counters collected over one run of the corpus."""
+    def __init__(self, samples: list[dict], corpus: Path=None, repeat: int=DEFAULT_REPEAT, render_backend: str=None):
+        """Read every sample file once; decoding is timed, disk access is not."""
+        corpus = corpus or path_settings.base_dir
+        self.samples = [(entry, (corpus / entry['file']).read_bytes()) for entry in samples]
+        self.repeat = repeat
+        self.render_backend = render_backend
+        self.extractor = get_ocr_extractor()
+        self.timings = {stage: [] for stage in STAGES}
+        self.renders = 0
+        self.clear_accuracy()
+
+    def clear_accuracy(self):
+        """Reset accuracy counters."""
+        self.counts = {key: [0, 0] for key in ('type', 'arena', 'tiles', 'damage')}
+        self.misses = []
+
+    def count(self, key: str, correct: bool, miss: str):
+        """Record one accuracy check."""
+        self.counts[key][0] += correct
+        self.counts[key][1] += 1
+        if not correct:
+            self.misses.append(miss)
+
+    def time(self, stage: str, func, *args, **kwargs):
+        """Call func and record its latency under stage."""
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.timings[stage].append(time.perf_counter() - start)
+        return result
+
+    def run_sample(self, entry: dict, image_bytes: bytes, folder: Path):
+        """Run one sample through every stage and check the results against its labels."""
+        name = entry['file']
+        frame = self.time('decode', DecodedFrame.from_bytes, image_bytes)
+        screenshot_type = self.time('route', classify_screenshot, frame.bgr)
+        if 'type' in entry:
+            expected = ScreenshotType[entry['type'].upper()]
+            self.count('type', screenshot_type == expected,
+                       "{} type: {} != {}".format(name, screenshot_type.name, expected.name))
+
+        if 'units' in entry:
+            # The label is what is checked, so it is not given as the layout hint
+            result = analyze_formation(frame)
+            for stage, elapsed in result.timings.items():
+                self.timings[stage].append(elapsed)
+            if 'arena' in entry:
+                self.count('arena', result.arena == entry['arena'],
+                           "{} arena: {} != {}".format(name, result.arena, entry['arena']))
+
+            found = {str(unit['number']): unit['name'] for unit in result.units}
+            for tile, expected in entry['units'].items():
+                self.count('tiles', found.get(tile) == expected,
+                           "{} tile {}: {} != {}".format(name, tile, found.get(tile), expected))
+
+            self.renders += 1
+            self.time('render', render_units, entry['units'], entry.get('arena', "Arena I"),
+                      folder / "benchmark-{}".format(self.renders), self.render_backend)
+
+        if 'damage' in entry and self.extractor is not None:
+            # A fresh cache key per run would skip OCR, so the cache is emptied instead
+            self.extractor.cache = OCRCache()
+            values = self.time('ocr', self.extractor.extract_all_damage_values, frame, screenshot_type)
+            for expected in entry['damage']:
+                self.count('damage', expected in values, "{} damage: {} not found".format(name, expected))
+
+    def run(self) -> dict:
+        """Run the corpus repeat times, and for at least MIN_RUN_SECONDS, and summarize it."""
+        with tempfile.TemporaryDirectory() as folder:
+            # Warm up lazy loads (template pack, layouts, fonts, tiles) outside the timings
+            for entry, image_bytes in self.samples:
+                self.run_sample(entry, image_bytes, Path(folder))
+            self.timings = {stage: [] for stage in STAGES}
+            self.clear_accuracy()
+
+            # The reference is timed around the passes, so drift during the run affects both alike
+            reference_ms = calibrate()
+            passes, start = 0, time.perf_counter()
+            while passes < self.repeat or time.perf_counter() - start < MIN_RUN_SECONDS:
+                for entry, image_bytes in self.samples:
+                    self.run_sample(entry, image_bytes, Path(folder))
+                passes += 1
+            reference_ms = (reference_ms + calibrate()) / 2
+
+            # Tracing slows everything down, so memory is measured on a separate pass
+            timings, counts, misses = self.timings, self.counts, self.misses
+            self.timings = {stage: [] for stage in STAGES}
+            self.clear_accuracy()
+            tracemalloc.start()
+            for entry, image_bytes in self.samples:
+                self.run_sample(entry, image_bytes, Path(folder))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.timings, self.counts, self.misses = timings, counts, misses
+
+        return self.report(peak, reference_ms)
+
+    def report(self, traced_peak: int, reference_ms: float) -> dict:
+        """Summary of latency, absolute and relative to the reference workload, memory and accuracy."""
+        latency = {}
+        for stage, values in self.timings.items():
+            p50, p95 = percentile(values, 50), percentile(values, 95)
+            latency[stage] = {
+                'p50_ms': None if p50 is None else round(p50 * 1000, 3),
+                'p95_ms': None if p95 is None else round(p95 * 1000, 3),
+                'p50_rel': None if p50 is None else round(p50 * 1000 / reference_ms, 4),
+                'runs': len(values)
+            }
+        return {
+            'reference_ms': round(reference_ms, 3),
+            'latency': latency,
+            'memory': {
+                'traced_peak_mb': round(traced_peak / 2 ** 20, 2),
+                # ru_maxrss is in kilobytes on Linux
+                'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+            },
+            'accuracy': {key: None if total == 0 else round(correct / total, 4)
+                         for key, (correct, total) in self.counts.items()},
+            'misses': sorted(set(self.misses))
+        }
+
+
+def get_expected_ms(report: dict, baseline: dict, stage: str) -> float | None:
+    """Baseline p50 of a stage scaled to the machine of the report, None if either lacks it."""
+    before = baseline.get('latency', {}).get(stage, {}).get('p50_rel')
+    if before is None or report.get('reference_ms') is None:
+        return None
+    return before * report['reference_ms']
+
+
+def compare(report: dict, baseline: dict, max_slowdown: float=MAX_SLOWDOWN,
+            tolerance_ms: float=REGRESSION_TOLERANCE_MS) -> tuple[list[str], list[str]]:
+    """
+    Regressions of a report against a baseline report.
+
+    Returns:
+        Tuple of (regressions, checks skipped because this run could not measure them)
+    """
+    regressions, skipped = [], []
+    for key, value in baseline.get('accuracy', {}).items():
+        current = report['accuracy'].get(key)
+        if value is None:
+            continue
+        if current is None:
+            skipped.append("accuracy {}: not measured".format(key))
+        elif current < value:
+            regressions.append("accuracy {}: {} < {}".format(key, current, value))
+
+    for stage in baseline.get('latency', {}):
+        current = report['latency'].get(stage, {}).get('p50_ms')
+        expected = get_expected_ms(report, baseline, stage)
+        if expected is None:
+            continue
+        if current is None:
+            skipped.append("latency {}: not measured".format(stage))
+        elif current > expected * max_slowdown + tolerance_ms:
+            regressions.append("latency {}: p50 {:.2f} ms > {:.2f} ms x {} + {} ms".format(
+                stage, current, expected, max_slowdown, tolerance_ms))
+    return regressions, skipped
+
+
+def print_report(report: dict, baseline: dict | None):
+    """Print a report, with the baseline p50 scaled to this machine beside each stage if there is one."""
+    print("reference  {:.2f} ms".format(report['reference_ms']))
+    print("{:<10} {:>10} {:>10} {:>6} {:>12}".format("stage", "p50 ms", "p95 ms", "runs", "baseline"))
+    for stage, value in report['latency'].items():
+        if not value['runs']:
+            print("{:<10} {:>10}".format(stage, "skipped"))
+            continue
+        before = get_expected_ms(report, baseline or {}, stage)
+        print("{:<10} {:>10.2f} {:>10.2f} {:>6} {:>12}".format(
+            stage, value['p50_ms'], value['p95_ms'], value['runs'], "" if before is None else "{:.2f}".format(before)))
+
+    memory = report['memory']
+    print("memory     traced peak {} MB, max RSS {} MB".format(memory['traced_peak_mb'], memory['max_rss_mb']))
+    for key, value in report['accuracy'].items():
+        print("accuracy   {:<8} {}".format(key, "n/a" if value is None else "{:.1%}".format(value)))
+    for miss in report['misses']:
+        print("    {}".format(miss))
+
+
+def main(argv: list[str]=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", type=Path, default=None, help="folder holding the sample files")
+    parser.add_argument("--ground-truth", type=Path, default=None, help="labeled samples")
+    parser.add_argument("--baseline", type=Path, default=path_settings.base_dir / "benchmarks" / "baseline.json")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--render-backend", default=None, help="pygame or pillow, the default backend if omitted")
+    parser.add_argument("--max-slowdown", type=float, default=MAX_SLOWDOWN)
+    parser.add_argument("--tolerance-ms", type=float, default=REGRESSION_TOLERANCE_MS)
+    parser.add_argument("--save", action="store_true", help="store this run as the baseline")
+    args = parser.parse_args(argv)
+
+    report = Benchmark(load_ground_truth(args.ground_truth), args.corpus, args.repeat, args.render_backend).run()
+
+    baseline = None
+    if args.baseline.exists():
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=4)
+        print("Baseline written to {}".format(args.baseline))
+        return 0
+
+    if baseline is None:
+        print("No baseline at {}, run with --save to create one".format(args.baseline))
+        return 0
+
+    regressions, skipped = compare(report, baseline, args.max_slowdown, args.tolerance_ms)
+    for check in skipped:
+        print("SKIPPED {}".format(check))
+    for regression in regressions:
+        print("REGRESSION {}".format(regression))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,26 @@
 """
-Damage number extraction from screenshots using pytesseract.
+Damage number extraction from screenshots using Tesseract OCR.
 """
-import io
+import bisect
+import copy
+import hashlib
+import json
+import logging
+import os
 import re
-import subprocess
+import threading
+from functools import lru_cache
+from pathlib import Path
 from typing import Optional
 
 import cv2
 #import easyocr
 import numpy as np
-import pytesseract
-from PIL import Image
+from cachetools import LRUCache
+
+from bot.core.enum_classes import ScreenshotType
+from bot.image.frame import DecodedFrame, as_frame
+from bot.image.ocr_backends import OCRBackend, get_languages, get_ocr_backend
 
 THIN_SPACE = "\u2009"
 NBSP = "\u00A0"
@@ -51,26 +61,31 @@ INLINE_NUM_UNIT_RE = re.compile(
 )
 
 
+# Damage panel of the battle statistics screen as fractions of (x0, x1, y0, y1)
+DAMAGE_PANEL_BOUNDS = (0.13, 1.0, 0.17, 0.6)
+
+# Numbers are near-white text; every BGR channel must clear this level
+DAMAGE_TEXT_THRESHOLD = 190
+DAMAGE_ROW_MIN_PIXELS = 3
+DAMAGE_ROW_MIN_HEIGHT = 0.012  # Fractions of image width, drop separator lines and artwork
+DAMAGE_ROW_MAX_HEIGHT = 0.06
+DAMAGE_ROW_PADDING = 4
+DAMAGE_TEXT_HEIGHT = 32  # Rows are rescaled so text is about this tall for OCR
+
+MIN_OCR_CONFIDENCE = 30
+
+# Bump when OCR preprocessing changes, so cached results are not reused
+OCR_CACHE_VERSION = 2
+OCR_CACHE_SIZE = 256
+OCR_DISK_CACHE_FILES = 4096
+
+logger = logging.getLogger()
+
+
 def get_all_tesseract_langs(fallback="osd+eng"):
     try:
-        out = subprocess.check_output(
-            ["tesseract", "--list-langs"],
-            text=True,
-            stderr=subprocess.STDOUT
-        )
-        langs = []
-        for line in out.splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            if line.lower().startswith("list of available languages"):
-                continue
-            langs.append(line)
-
+        langs = get_languages()
         if langs:
-            if "osd" in langs:
-                langs.remove("osd")
-                langs.insert(0, "osd")
             return "+".join(langs)
     except Exception:
         pass
@@ -143,6 +158,7 @@ def parse_localized_number(num_str: str) -> float:
         raise ValueError(f"could not parse as number: {num_str}")
 
 
+@lru_cache(maxsize=4096)
 def parse_damage_text(text: str) -> Optional[float]:
     """
     Parse damage text and return numeric value.
@@ -180,12 +196,201 @@ def parse_damage_text(text: str) -> Optional[float]:
     return None
 
 
+def get_panel_mask(image: np.ndarray) -> tuple[np.ndarray, int, int]:
+    """
+    Near-white text pixels of the damage panel of a BGR screenshot.
+    
+    Returns:
+        Tuple of (mask, left, top) with the panel's offset in the screenshot
+    """
+    h, w = image.shape[:2]
+    x0, x1, y0, y1 = DAMAGE_PANEL_BOUNDS
+    left, top = int(x0 * w), int(y0 * h)
+    panel = image[top:int(y1 * h), left:int(x1 * w)]
+    return panel.min(axis=2) > DAMAGE_TEXT_THRESHOLD, left, top
+
+
+def get_text_rows(mask: np.ndarray, min_height: float, max_height: float) -> list[tuple[int, int]]:
+    """Top and bottom of each horizontal band of text pixels that is about one line tall."""
+    on = np.concatenate([[False], mask.sum(axis=1) >= DAMAGE_ROW_MIN_PIXELS, [False]])
+    edges = np.flatnonzero(np.diff(on.astype(np.int8)))
+    return [(int(start), int(end)) for start, end in zip(edges[::2], edges[1::2]) if min_height <= end - start <= max_height]
+
+
+def get_panel_rows(mask: np.ndarray, width: int) -> list[tuple[int, int]]:
+    """Text rows of a damage panel mask cut from a screenshot of the given width."""
+    return get_text_rows(mask, DAMAGE_ROW_MIN_HEIGHT * width, DAMAGE_ROW_MAX_HEIGHT * width)
+
+
+def get_words(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Start and end columns of the words of a text row, runs of text columns separated by more than a line height."""
+    columns = np.flatnonzero(mask.any(axis=0))
+    if not len(columns):
+        return columns, columns
+    breaks = np.flatnonzero(np.diff(columns) > len(mask))
+    starts = np.concatenate([[columns[0]], columns[breaks + 1]])
+    ends = np.concatenate([columns[breaks], [columns[-1]]]) + 1
+    return starts, ends
+
+
+def compact_row(row: np.ndarray, mask: np.ndarray) -> tuple[np.ndarray, list[tuple[int, int]]]:
+    """
+    Cut the blank space between the words of a text row down to one line height.
+    
+    Returns:
+        Tuple of (compacted row, list of (compacted x, shift to panel x) per word)
+    """
+    gap = len(row)
+    starts, ends = get_words(mask)
+    if not len(starts):
+        return row, [(0, 0)]
+    
+    pieces, offsets, x = [], [], 0
+    blank = np.full((len(row), gap), 255, dtype=row.dtype)
+    for start, end in zip(starts, ends):
+        pieces += [blank, row[:, start:end]]
+        offsets.append((x, int(start) - gap - x))
+        x += gap + int(end - start)
+    pieces.append(blank)
+    return np.hstack(pieces), offsets
+
+
+def stack_rows(rows: list[np.ndarray], gap: int) -> tuple[np.ndarray, list[int]]:
+    """
+    Stack text rows into one white image, left aligned with blank lines between them.
+    
+    Returns:
+        Tuple of (stacked image, top of each row in it)
+    """
+    width = max(row.shape[1] for row in rows)
+    stacked, tops, y = [], [], 0
+    for row in rows:
+        stacked += [np.pad(row, ((0, gap), (0, width - row.shape[1])), constant_values=255)]
+        tops.append(y)
+        y += len(row) + gap
+    return np.vstack(stacked), tops
+
+
+def split_rows(data: dict, tops: list[int]) -> list[dict]:
+    """Split OCR words of stacked rows by the row their center falls in, with tops relative to the row."""
+    rows = [{field: [] for field in data} for _ in tops]
+    for i in range(len(data['text'])):
+        k = max(bisect.bisect_right(tops, data['top'][i] + data['height'][i] / 2) - 1, 0)
+        for field in data:
+            rows[k][field].append(data[field][i])
+        rows[k]['top'][-1] -= tops[k]
+    return rows
+
+
+def get_damage_results(data: dict, scale: float=1.0, left: int=0, top: int=0) -> list[dict]:
+    """
+    Parse OCR words into damage results.
+    
+    Boxes are mapped back to screenshot coordinates from an OCR input that was
+    cut at (left, top) and resized by scale.
+    """
+    damage_results = []
+    n_boxes = len(data['text'])
+    
+    for i in range(n_boxes):
+        text = data['text'][i].strip()
+        conf = int(float(data['conf'][i])) if str(data['conf'][i]) != '-1' else 0
+        
+        # Skip empty text or very low confidence
+        if not text or conf < MIN_OCR_CONFIDENCE:
+            continue
+        
+        # Parse the text to extract damage value
+        value = parse_damage_text(text)
+        
+        # Get bounding box
+        x = left + int(data['left'][i] / scale)
+        y = top + int(data['top'][i] / scale)
+        w = int(data['width'][i] / scale)
+        h = int(data['height'][i] / scale)
+        bbox = [[x, y], [x + w, y], [x + w, y + h], [x, y + h]]
+        
+        damage_results.append({
+            'text': text,
+            'value': value,
+            'confidence': conf / 100.0,  # Convert to 0-1 scale
+            'bbox': bbox
+        })
+    
+    return damage_results
+
+
+class OCRCache:
+    """Thread-safe LRU of OCR results by content key, optionally persisted as JSON files."""
+    def __init__(self, maxsize: int=OCR_CACHE_SIZE):
+        """Initialize empty in-memory cache."""
+        self.entries = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+    
+    def get(self, key: str, cache_dir: Path=None) -> list[dict] | None:
+        """Cached results for the key, from memory or else from disk."""
+        with self.lock:
+            results = self.entries.get(key)
+        
+        if results is None and cache_dir is not None:
+            try:
+                with open(cache_dir / "{}.json".format(key), "r") as f:
+                    results = json.load(f)
+            except (OSError, ValueError):
+                return None
+            with self.lock:
+                self.entries[key] = results
+        
+        return None if results is None else copy.deepcopy(results)
+    
+    def put(self, key: str, results: list[dict], cache_dir: Path=None):
+        """Store results in memory and, if a folder is given, on disk."""
+        results = copy.deepcopy(results)
+        with self.lock:
+            self.entries[key] = results
+        
+        if cache_dir is None:
+            return
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_dir / "{}.tmp".format(key)
+            with open(tmp_path, "w") as f:
+                json.dump(results, f)
+            os.replace(tmp_path, cache_dir / "{}.json".format(key))
+            self.prune(cache_dir)
+        except OSError as e:
+            logger.warning("Could not persist OCR result: {}".format(e))
+    
+    def prune(self, cache_dir: Path):
+        """Drop the oldest files once the folder holds more than OCR_DISK_CACHE_FILES."""
+        files = list(cache_dir.glob("*.json"))
+        if len(files) <= OCR_DISK_CACHE_FILES:
+            return
+        files.sort(key=lambda file_path: file_path.stat().st_mtime)
+        for file_path in files[:len(files) - OCR_DISK_CACHE_FILES]:
+            file_path.unlink(missing_ok=True)
+
+
+# Extractors are created per submission, so the cache is shared by all of them
+_ocr_cache = OCRCache()
+
+
 class DamageExtractor:
     """Extract damage numbers from screenshots."""
     
-    def __init__(self, languages: list = None):
+    def __init__(self, languages: list = None, backend: OCRBackend = None, cache: OCRCache = None, cache_dir: Path = None):
         """
+        Initialize extractor with OCR languages and backend.
+        
+        Args:
+            languages: Tesseract language string, all installed languages if None
+            backend: OCR backend, the shared in-process engine if available
+            cache: OCR result cache, shared by every extractor if None
+            cache_dir: Folder to persist OCR results in, memory only if None
         """
+        self.backend = backend or get_ocr_backend()
+        self.cache = cache or _ocr_cache
+        self.cache_dir = cache_dir
         if languages is None:
             # languages = ['en']
             languages = get_all_tesseract_langs()
@@ -193,12 +398,13 @@ class DamageExtractor:
         # self.reader = easyocr.Reader(languages, gpu=False)
         self.languages = languages
     
-    def extract_damage(self, image_bytes: bytes) -> list[dict]:
+    def extract_damage(self, image: bytes | DecodedFrame, screenshot_type: ScreenshotType = ScreenshotType.UNKNOWN) -> list[dict]:
         """
-        Extract damage numbers from image bytes.
+        Extract damage numbers from image bytes or a decoded frame.
         
         Args:
-            image_bytes: Image file bytes
+            image: Image file bytes or decoded frame
+            screenshot_type: Routed screenshot type; team cards skip the damage panel
             
         Returns:
             List of dictionaries with keys:
@@ -207,27 +413,77 @@ class DamageExtractor:
             - 'confidence': OCR confidence score (0.0-1.0)
             - 'bbox': Bounding box coordinates as list of 4 points
         """
-        # Convert bytes to numpy array
-        np_array = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(np_array, cv2.IMREAD_COLOR)
-        
-        if image is None:
+        frame = as_frame(image)
+        if frame is None:
             return []
         
-        #results = self.reader.readtext(image)
+        # Forwards, edits and re-submits of the same screenshot skip OCR
+        key = "{}-{}-{}-{}".format(OCR_CACHE_VERSION, self.languages, screenshot_type.name, frame.digest)
+        key = hashlib.sha256(key.encode()).hexdigest()
+        cached = self.cache.get(key, self.cache_dir)
+        if cached is not None:
+            return cached
+        
+        damage_results = []
+        if screenshot_type != ScreenshotType.TEAM:
+            damage_results = self.extract_panel_damage(frame)
+        
+        # Not a recognizable statistics screen, read the whole screenshot
+        if not any(result['value'] is not None for result in damage_results):
+            damage_results = self.extract_full_damage(frame)
         
-        # Convert to PIL Image for pytesseract
-        pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        # Boxes refer to the upload, not the normalized frame
+        for result in damage_results:
+            result['bbox'] = [list(frame.to_source(x, y)) for x, y in result['bbox']]
         
-        # Run OCR with detailed data
-        data = pytesseract.image_to_data(
-            pil_image,
-            lang=self.languages,
-            output_type=pytesseract.Output.DICT,
-            config='--psm 6'  # Assume uniform block of text
-        )
+        self.cache.put(key, damage_results, self.cache_dir)
+        return damage_results
+    
+    def extract_panel_damage(self, frame: DecodedFrame) -> list[dict]:
+        """
+        Read the damage panel row by row.
+        
+        The panel is cut at fixed fractions, binarized to its white digits and
+        split into text rows of digits and units. The rows are stacked into one
+        image and read in a single call, so a subprocess backend starts
+        Tesseract once per screenshot. A character whitelist would drop the
+        spaces between the numbers of a row, so the parser filters instead.
+        """
+        mask, left, top = get_panel_mask(frame.bgr)
+        # Black text on white, which Tesseract reads best
+        binary = np.where(mask, 0, 255).astype(np.uint8)
+        
+        rows = []
+        for row_top, row_bottom in get_panel_rows(mask, frame.width):
+            scale = DAMAGE_TEXT_HEIGHT / (row_bottom - row_top)
+            row_top = max(row_top - DAMAGE_ROW_PADDING, 0)
+            row_bottom = min(row_bottom + DAMAGE_ROW_PADDING, len(binary))
+            row, offsets = compact_row(binary[row_top:row_bottom], mask[row_top:row_bottom])
+            row = cv2.resize(row, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            rows.append((row, scale, row_top, offsets))
+        if not rows:
+            return []
+        
+        stacked, tops = stack_rows([row for row, *_ in rows], DAMAGE_TEXT_HEIGHT)
+        data = self.backend.image_to_data(stacked, lang=self.languages, psm=6)
         
         damage_results = []
+        for data, (_, scale, row_top, offsets) in zip(split_rows(data, tops), rows):
+            for result in get_damage_results(data, scale, 0, top + row_top):
+                # Undo the gap removal so boxes land on the screenshot
+                x = result['bbox'][0][0]
+                shift = left + next(shift for start, shift in reversed(offsets) if start <= x)
+                result['bbox'] = [[bx + shift, by] for bx, by in result['bbox']]
+                damage_results.append(result)
+        return damage_results
+    
+    def extract_full_damage(self, frame: DecodedFrame) -> list[dict]:
+        """Read every word of the screenshot."""
+        #results = self.reader.readtext(image)
+        
+        # Run OCR with detailed data, assuming a uniform block of text
+        data = self.backend.image_to_data(frame.rgb, lang=self.languages, psm=6)
+        
         """for (bbox, text, confidence) in results:
             value = parse_damage_text(text)
             damage_results.append({
@@ -238,47 +494,21 @@ class DamageExtractor:
             })
         return damage_results
         """
-        n_boxes = len(data['text'])
-        
-        for i in range(n_boxes):
-            text = data['text'][i].strip()
-            conf = int(data['conf'][i]) if data['conf'][i] != '-1' else 0
-            
-            # Skip empty text or very low confidence
-            if not text or conf < 30:
-                continue
-            
-            # Parse the text to extract damage value
-            value = parse_damage_text(text)
-            
-            # Get bounding box
-            x = data['left'][i]
-            y = data['top'][i]
-            w = data['width'][i]
-            h = data['height'][i]
-            bbox = [[x, y], [x + w, y], [x + w, y + h], [x, y + h]]
-            
-            damage_results.append({
-                'text': text,
-                'value': value,
-                'confidence': conf / 100.0,  # Convert to 0-1 scale
-                'bbox': bbox
-            })
-        
-        return damage_results
+        return get_damage_results(data)
         
         
-    def extract_largest_damage(self, image_bytes: bytes) -> Optional[float]:
+    def extract_largest_damage(self, image: bytes | DecodedFrame, screenshot_type: ScreenshotType = ScreenshotType.UNKNOWN) -> Optional[float]:
         """
         Extract the largest damage number from image.
         
         Args:
-            image_bytes: Image file bytes
+            image: Image file bytes or decoded frame
+            screenshot_type: Routed screenshot type
             
         Returns:
             Largest parsed damage value, or None if none found
         """
-        results = self.extract_damage(image_bytes)
+        results = self.extract_damage(image, screenshot_type)
         
         valid_values = [r['value'] for r in results if r['value'] is not None]
         if not valid_values:
@@ -286,16 +516,17 @@ class DamageExtractor:
         
         return max(valid_values)
     
-    def extract_all_damage_values(self, image_bytes: bytes) -> list[float]:
+    def extract_all_damage_values(self, image: bytes | DecodedFrame, screenshot_type: ScreenshotType = ScreenshotType.UNKNOWN) -> list[float]:
         """
         Extract all valid damage numbers from image.
         
         Args:
-            image_bytes: Image file bytes
+            image: Image file bytes or decoded frame
+            screenshot_type: Routed screenshot type
             
         Returns:
             List of all parsed damage values
         """
-        results = self.extract_damage(image_bytes)
+        results = self.extract_damage(image, screenshot_type)
         return [r['value'] for r in results if r['value'] is not None]
 
@@ -0,0 +1,160 @@
+"""
+Decoded screenshot shared by the submission pipeline.
+
+An attachment is decoded once, at no more than a canonical working width;
+routing, OCR, formation analysis and debug logging all read from the same
+frame, and derived color views are only computed when first used.
+"""
+import hashlib
+import io
+import logging
+import warnings
+from functools import cached_property
+
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger()
+
+# Large screenshots are decoded down to this working width
+CANONICAL_WIDTH = 1080
+# Decoded frames never exceed this many pixels, and larger sources are refused
+MAX_DECODED_PIXELS = 16_000_000
+MAX_SOURCE_PIXELS = 120_000_000
+
+REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+
+def get_image_size(image_bytes: bytes) -> tuple[int, int] | None:
+    """Width and height from the image header, without decoding pixels."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(image_bytes)) as img:
+                return img.size
+    except Image.DecompressionBombError:
+        # PIL refuses to open far above MAX_SOURCE_PIXELS, which must not pass for an unknown size
+        return MAX_SOURCE_PIXELS + 1, 1
+    except Exception:
+        return None
+
+
+def get_reduction(width: int, height: int, max_width: int) -> int:
+    """Largest decoder reduction that keeps the canonical width, or the smallest that fits the pixel budget."""
+    factor = 1
+    for reduction in REDUCED_FLAGS:
+        if width // reduction >= max_width:
+            factor = reduction
+        elif width * height // reduction ** 2 > MAX_DECODED_PIXELS:
+            factor = reduction
+    return factor
+
+
+def downscale(image: np.ndarray, width: int) -> np.ndarray:
+    """
+    Shrink an image to the given width.
+    
+    Exact halvings with INTER_AREA are fast and alias-free; the last step is
+    under 2x, where INTER_LINEAR is close enough and much faster than a
+    fractional INTER_AREA.
+    """
+    while image.shape[1] >= 2 * width:
+        image = cv2.resize(image, (image.shape[1] // 2, image.shape[0] // 2), interpolation=cv2.INTER_AREA)
+    h, w = image.shape[:2]
+    return cv2.resize(image, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_LINEAR)
+
+
+class DecodedFrame:
+    """One decoded BGR image with lazily derived gray, RGB and PIL views."""
+    def __init__(self, bgr: np.ndarray, scale: float=1.0, origin: tuple[int, int]=(0, 0)):
+        """Wrap a decoded (H, W, 3) BGR image that is scale times the size of its source, cut at origin of the decode."""
+        self.bgr = bgr
+        self.scale = scale
+        self.origin = origin
+
+    @classmethod
+    def from_bytes(cls, image_bytes: bytes, max_width: int | None=CANONICAL_WIDTH) -> "DecodedFrame | None":
+        """
+        Decode encoded image bytes, or None if they are not a usable image.
+        
+        Images wider than max_width are decoded at reduced resolution where the
+        codec supports it and downscaled to max_width. None keeps full resolution
+        within the pixel budget.
+        """
+        if not image_bytes:
+            return None
+        size = get_image_size(image_bytes)
+        flag = cv2.IMREAD_COLOR
+        if size:
+            width, height = size
+            if width * height > MAX_SOURCE_PIXELS:
+                logger.warning("Refusing to decode a {}x{} image".format(width, height))
+                return None
+            factor = get_reduction(width, height, max_width or width)
+            flag = REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+
+        bgr = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+        if bgr is None:
+            return None
+        source_width = size[0] if size else bgr.shape[1]
+
+        h, w = bgr.shape[:2]
+        target = min(max_width or w, w, int(w * (MAX_DECODED_PIXELS / (w * h)) ** 0.5))
+        if target < w:
+            bgr = downscale(bgr, target)
+        return cls(bgr, bgr.shape[1] / source_width)
+
+    @property
+    def height(self) -> int:
+        return self.bgr.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.bgr.shape[1]
+
+    @cached_property
+    def digest(self) -> str:
+        """Content hash of the decoded pixels, stable across re-encodes and metadata edits."""
+        digest = hashlib.sha256("{}x{}".format(self.width, self.height).encode())
+        digest.update(np.ascontiguousarray(self.bgr).data)
+        return digest.hexdigest()
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        """Grayscale view."""
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def rgb(self) -> np.ndarray:
+        """RGB view."""
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
+
+    @cached_property
+    def pil(self) -> Image.Image:
+        """PIL image sharing the RGB buffer."""
+        rgb = np.ascontiguousarray(self.rgb)
+        return Image.frombuffer("RGB", (rgb.shape[1], rgb.shape[0]), rgb, "raw", "RGB", 0, 1)
+
+    def to_source(self, x: float, y: float) -> tuple[int, int]:
+        """Map frame coordinates, of a crop too, back to the pixel grid of the original upload."""
+        return int(round((x + self.origin[0]) / self.scale)), int(round((y + self.origin[1]) / self.scale))
+
+    def crop(self, x0: int, y0: int, x1: int, y1: int) -> "DecodedFrame":
+        """Frame over a region, sharing memory and any views already computed."""
+        frame = DecodedFrame(self.bgr[y0:y1, x0:x1], self.scale, (self.origin[0] + x0, self.origin[1] + y0))
+        for name in ('gray', 'rgb'):
+            if name in self.__dict__:
+                frame.__dict__[name] = self.__dict__[name][y0:y1, x0:x1]
+        return frame
+
+
+def as_frame(image: "bytes | DecodedFrame") -> "DecodedFrame | None":
+    """Accept either encoded bytes or an already decoded frame."""
+    if isinstance(image, DecodedFrame):
+        return image
+    return DecodedFrame.from_bytes(image)
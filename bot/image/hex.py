@@ -9,13 +9,43 @@ class Hex:
     HEX_LENGTH = HALF_PNG_WIDTH * 2 / math.sqrt(3)
 
     @staticmethod
-    def qr_to_xy(q, r) -> tuple[int, int]:
-        """Convert hex coordinates (q, r) to pixel coordinates (x, y)."""
+    def order_tiles(tiles: list[list[int]]) -> list[list[int]]:
+        """Sort arena tiles (q, r) into tile number order."""
+        return sorted(tiles, key=lambda x: (x[0] - x[1], x[0], x[1]), reverse=True)
+
+    @staticmethod
+    def qr_to_exact_xy(q, r) -> tuple[float, float]:
+        """Convert hex coordinates (q, r) to unrounded pixel coordinates (x, y)."""
         #s = -q-r
         y = 3/2 * Hex.HEX_LENGTH * q
         x = math.sqrt(3) * Hex.HEX_LENGTH * (q / 2 + r)
         #x = - math.sqrt(3) * Hex.HEX_LENGTH * (q / 2 + s)
+        return x, y
+
+    @staticmethod
+    def qr_to_xy(q, r) -> tuple[int, int]:
+        """Convert hex coordinates (q, r) to pixel coordinates (x, y)."""
+        x, y = Hex.qr_to_exact_xy(q, r)
         return int(x), int(y)
+
+    @staticmethod
+    def xy_to_qr(x, y) -> tuple[float, float]:
+        """Convert pixel coordinates (x, y) to fractional hex coordinates (q, r)."""
+        q = y / (3/2 * Hex.HEX_LENGTH)
+        r = x / (math.sqrt(3) * Hex.HEX_LENGTH) - q / 2
+        return q, r
+
+    @staticmethod
+    def round_qr(q, r) -> tuple[int, int]:
+        """Round fractional hex coordinates to the nearest hex using cube rounding."""
+        s = -q - r
+        rq, rr, rs = round(q), round(r), round(s)
+        dq, dr, ds = abs(rq - q), abs(rr - r), abs(rs - s)
+        if dq > dr and dq > ds:
+            rq = -rr - rs
+        elif dr > ds:
+            rr = -rq - rs
+        return rq, rr
     
     @staticmethod
     def hex_to_center_pixel(q, r, height):
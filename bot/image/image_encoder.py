@@ -0,0 +1,193 @@
+"""
+Output encoders for formation images.
+
+Formation images are uploaded to Discord on every edit, so upload size
+dominates perceived latency on mobile. Hex art is mostly flat, which a 256
+color palette keeps close to the original at a fraction of the size of a
+true color PNG. Each context picks its own encoder: private previews favour
+small, fast uploads while public posts and archived submissions stay lossless.
+
+Run `python -m bot.image.image_encoder` to compare size and encode time of
+every encoder on every arena.
+"""
+import io
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+
+from bot.image.render_backends import Canvas
+
+DEFAULT_ENCODER = "png"
+# Encoder per context; private previews are ephemeral, public posts and submissions are kept
+CONTEXT_ENCODERS = {
+    'preview': "png-palette",
+    'public': "png",
+    'submission': "png"
+}
+PALETTE_COLORS = 256
+# Lossless WebP is smallest at higher effort, but method 4 takes seconds per image
+WEBP_LOSSLESS_METHOD = 0
+WEBP_METHOD = 2
+WEBP_QUALITY = 80
+MAX_WEBP_QUALITY = 90
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    """Encoded bytes with the cost of producing them."""
+    data: bytes
+    extension: str
+    encoder: str
+    encode_ms: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+class ImageEncoder:
+    """Interface for encoding a canvas into an image file format."""
+    name = "base"
+    extension = "png"
+
+    def encode(self, canvas: Canvas) -> bytes:
+        """Encoded image bytes."""
+        raise NotImplementedError
+
+    def encode_timed(self, canvas: Canvas) -> EncodedImage:
+        """Encoded image with its encode time."""
+        start = time.perf_counter()
+        data = self.encode(canvas)
+        return EncodedImage(data, self.extension, self.name, (time.perf_counter() - start) * 1000)
+
+
+class PNGEncoder(ImageEncoder):
+    """True color PNG written by the render backend, as formation images always were."""
+    name = "png"
+
+    def encode(self, canvas: Canvas) -> bytes:
+        return canvas.encode()
+
+
+class PalettePNGEncoder(ImageEncoder):
+    """PNG quantized to a 256 color palette with alpha, without dithering the flat hex fills."""
+    name = "png-palette"
+
+    def __init__(self, colors: int=PALETTE_COLORS):
+        """Initialize encoder with a palette size."""
+        self.colors = colors
+
+    def encode(self, canvas: Canvas) -> bytes:
+        image = Image.fromarray(canvas.to_array(), "RGBA")
+        palette = image.quantize(self.colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        buffer = io.BytesIO()
+        palette.save(buffer, "PNG")
+        return buffer.getvalue()
+
+
+class WebPLosslessEncoder(ImageEncoder):
+    """Lossless WebP at the fastest compression effort."""
+    name = "webp-lossless"
+    extension = "webp"
+
+    def encode(self, canvas: Canvas) -> bytes:
+        buffer = io.BytesIO()
+        Image.fromarray(canvas.to_array(), "RGBA").save(buffer, "WEBP", lossless=True, quality=0,
+                                                        method=WEBP_LOSSLESS_METHOD)
+        return buffer.getvalue()
+
+
+class WebPEncoder(ImageEncoder):
+    """Lossy WebP with a capped quality."""
+    name = "webp"
+    extension = "webp"
+
+    def __init__(self, quality: int=WEBP_QUALITY):
+        """Initialize encoder with a quality, capped at MAX_WEBP_QUALITY."""
+        self.quality = min(quality, MAX_WEBP_QUALITY)
+
+    def encode(self, canvas: Canvas) -> bytes:
+        buffer = io.BytesIO()
+        Image.fromarray(canvas.to_array(), "RGBA").save(buffer, "WEBP", quality=self.quality, method=WEBP_METHOD)
+        return buffer.getvalue()
+
+
+ENCODERS = {encoder.name: encoder for encoder in (PNGEncoder, PalettePNGEncoder, WebPLosslessEncoder, WebPEncoder)}
+
+def make_encoder(name: str=None) -> ImageEncoder:
+    """Create an encoder by name, the default encoder if None."""
+    name = name or DEFAULT_ENCODER
+    if name not in ENCODERS:
+        raise ValueError("Unknown image encoder: {}".format(name))
+    return ENCODERS[name]()
+
+
+def get_output_context(is_private: bool) -> str:
+    """Output context of a user's formation image, a preview only while it is private."""
+    return "preview" if is_private else "public"
+
+
+def get_context_encoder(context: str) -> str:
+    """Encoder name for an output context, the default encoder for unknown contexts."""
+    return CONTEXT_ENCODERS.get(context, DEFAULT_ENCODER)
+
+
+def get_extension(data: bytes) -> str:
+    """File extension of encoded image bytes, read from the format signature."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+
+def compare_encoders(repeat: int=5) -> dict[str, dict]:
+    """
+    Encode a sample formation on every arena with each encoder.
+
+    Returns:
+        Dictionary of arena to per-encoder size, bytes saved against PNG,
+        encode time and PSNR over visible pixels
+    """
+    from bot.core.config import data_settings
+    from bot.database.database import DEFAULT_HEXES
+    from bot.image.image_maker import Image_Maker
+    from bot.image.render_backends import (get_sample_formation,
+                                           make_render_backend)
+
+    settings = {'make_transparent': False, 'show_numbers': True, 'show_title': True}
+    backend = make_render_backend()
+    report = {}
+    with backend:
+        for arena in data_settings.maps:
+            units, artifacts = get_sample_formation(arena, backend.tiles)
+            with Image_Maker(None, DEFAULT_HEXES, settings, arena, False, False, talent=True,
+                             backend=backend) as img_maker:
+                canvas = img_maker.render(arena, units, artifacts)
+            pixels = canvas.to_array().astype(np.float64)
+            visible = pixels[..., 3] > 0
+
+            report[arena] = {}
+            for name in ENCODERS:
+                encoder = make_encoder(name)
+                results = [encoder.encode_timed(canvas) for _ in range(repeat)]
+                decoded = np.asarray(Image.open(io.BytesIO(results[0].data)).convert("RGBA")).astype(np.float64)
+                error = ((decoded[visible] - pixels[visible]) ** 2).mean()
+                report[arena][name] = {
+                    'bytes': results[0].size,
+                    'encode_ms': float(np.median([result.encode_ms for result in results])),
+                    'psnr': None if error == 0 else float(10 * np.log10(255 ** 2 / error))
+                }
+            png_size = report[arena][DEFAULT_ENCODER]['bytes']
+            for result in report[arena].values():
+                result['saved'] = png_size - result['bytes']
+    return report
+
+
+if __name__ == "__main__":
+    for arena, results in compare_encoders().items():
+        print(arena)
+        for name, result in results.items():
+            psnr = "lossless" if result['psnr'] is None else "{:.1f} dB".format(result['psnr'])
+            print("    {:<14} {:>8} bytes  saved {:>8}  {:7.2f} ms  {}".format(
+                name, result['bytes'], result['saved'], result['encode_ms'], psnr))
@@ -1,24 +1,92 @@
+"""
+Formation image composition.
+
+A formation is composed into a display list of draw operations before any
+pixel is touched. Every render starts from a cached layer, either the user's
+last image or the board with no units drawn for the same arena, hexes and
+settings, whichever differs less, and only redraws the rectangles whose
+operations differ from it. Blending is per pixel and the draw order is fixed
+by phase and position, so clearing a rectangle and replaying every operation
+that touches it, clipped to it, reproduces a full render exactly, including
+the alpha edges of neighbouring hexes and talent outlines that moved.
+"""
+import logging
 import math
+import threading
+from collections import Counter
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from itertools import repeat
+from typing import NamedTuple
 
-import pygame
+from cachetools import LRUCache
 
-from bot.core.config import data_settings, path_settings
+from bot.core.config import data_settings
 from bot.image.hex import Hex
-from bot.image.image_loader import Image_Loader
+from bot.image.image_encoder import EncodedImage, make_encoder
+from bot.image.render_backends import (Canvas, Rect, RenderBackend,
+                                       make_render_backend, rects_overlap)
+
+logger = logging.getLogger()
 
 MARGIN = 20
 FONT_SIZE = 20
+BASE_LAYER_CACHE_SIZE = 32
+# Last image of each recent user; a canvas takes up to about 1.2 MB
+USER_LAYER_CACHE_SIZE = 32
+MAX_CHANGED_RATIO = 0.5
+
+
+class DrawOp(NamedTuple):
+    """One blit of a tile, the Yap image or a text label."""
+    kind: str
+    value: str
+    x: float
+    y: float
+
+
+class Layer(NamedTuple):
+    """Composed canvas with the display list it was drawn from."""
+    ops: tuple[DrawOp, ...]
+    canvas: Canvas
+
+
+@dataclass(frozen=True)
+class FormationSpec:
+    """Everything drawn in one formation image, independent of any user record."""
+    title: str
+    units: dict[int, str]
+    artifacts: dict[int, str]
+    arena: str
+    base_hexes: tuple[str, ...]
+    settings: dict[str, bool]
+    is_private: bool = False
+    talent: bool = False
+
+
+base_layers = LRUCache(maxsize=BASE_LAYER_CACHE_SIZE)
+user_layers = LRUCache(maxsize=USER_LAYER_CACHE_SIZE)
+layers_lock = threading.Lock()
+
+
+def changed_ops(ops: tuple[DrawOp, ...], base_ops: tuple[DrawOp, ...]) -> list[DrawOp]:
+    """Operations drawn a different number of times in the two display lists."""
+    changed = Counter(ops)
+    changed.subtract(base_ops)
+    return [op for op, count in changed.items() if count]
+
 
 class Image_Maker:
-    """Generate formation images using pygame."""
-    def __init__(self, user_id: int, base_hexes: list[str], settings: dict[str, bool], arena: str, is_private: bool, test_setting, talent: bool=False):
-        """Initialize image maker with user settings and arena configuration."""
-        self.loader = Image_Loader()
+    """Generate formation images with a pygame or Pillow render backend."""
+    def __init__(self, user_id: int, base_hexes: list[str], settings: dict[str, bool], arena: str, is_private: bool, test_setting, talent: bool=False,
+                 backend: str | RenderBackend=None):
+        """Initialize image maker with user settings, arena configuration and a render backend name or instance."""
+        self.backend = backend if isinstance(backend, RenderBackend) else make_render_backend(backend)
         self.user_id = user_id
         self.arena = arena
         if self.arena not in data_settings.maps:
             self.arena = "Arena I"
-        self.tiles = sorted(data_settings.maps[self.arena]['Tiles'], key=lambda x: (x[0] - x[1], x[0], x[1]), reverse=True)
+        self.tiles = Hex.order_tiles(data_settings.maps[self.arena]['Tiles'])
             
         self.is_private = is_private
         self.show_outline = True
@@ -46,22 +114,19 @@ class Image_Maker:
         
 
     def __enter__(self):
-        """Initialize pygame and create surface."""
-        pygame.init()
-        self.font = pygame.font.Font(str(path_settings.font_path), FONT_SIZE)
-        self.surface = pygame.Surface((self.width, self.height + self.test_setting), pygame.SRCALPHA)
-        self.surface.fill((0, 0, 0, 0))
+        """Prepare the backend."""
+        self.backend.__enter__()
         return self
     
     def __exit__(self, exc_type, exc_value, traceback):
-        """Clean up pygame on exit."""
-        pygame.quit()
+        """Release the backend on exit."""
+        self.backend.__exit__(exc_type, exc_value, traceback)
             
     def __draw_yap(self, artifacts):
         """Draw Yap character if certain artifacts are not present."""
         if 2 not in artifacts and 3 not in artifacts:
             x, y = Hex.hex_to_corner_pixel(3, -3, self.height)
-            self.surface.blit(self.loader.yap, (x, y))
+            self.ops.append(DrawOp("yap", "Yap", x, y))
         """if self.arena == "Arena V - Special":
             self.surface.blit(self.loader.icon, (self.width - Hex.HALF_PNG_WIDTH - MARGIN, self.height - Hex.HALF_PNG_WIDTH - MARGIN))
         else:
@@ -88,28 +153,30 @@ class Image_Maker:
                 q2, r2 = self.tiles[1]
         
         x, y = Hex.hex_to_corner_pixel(q1, r1, self.height)
-        self.surface.blit(self.loader.tiles["Mythic-Outline"], (x, y))
+        self.__draw_tile(x, y, "Mythic-Outline")
         
         x, y = Hex.hex_to_corner_pixel(q2, r2, self.height)
-        self.surface.blit(self.loader.tiles["Mythic-Outline"], (x, y))
+        self.__draw_tile(x, y, "Mythic-Outline")
         
     def __draw_text(self, center_x, center_y, text: str):
         """Draw text at specified center coordinates."""
-        text_surface = self.font.render(text, True, (255, 255, 255))
-        text_rect = text_surface.get_rect(center=(center_x, center_y))
-        self.surface.blit(text_surface, text_rect.topleft)
+        self.ops.append(DrawOp("text", text, center_x, center_y))
+        
+    def __draw_tile(self, x, y, name: str):
+        """Draw a tile image by name."""
+        self.ops.append(DrawOp("tile", name, x, y))
         
     def __draw_occupied_tile(self, x, y, name: str):
         """Draw tile with unit/artifact image."""
-        self.surface.blit(self.loader.tiles[name], (x, y))
+        self.__draw_tile(x, y, name)
         if not self.show_outline:
-            self.surface.blit(self.loader.tiles[self.unit_line], (x, y))
+            self.__draw_tile(x, y, self.unit_line)
     
     def __draw_blank_tile(self, x, y, blank_fill: str, blank_line: str):
         """Draw empty tile with fill and outline."""
         if self.show_fill:
-            self.surface.blit(self.loader.tiles[blank_fill], (x, y))
-        self.surface.blit(self.loader.tiles[blank_line], (x, y))
+            self.__draw_tile(x, y, blank_fill)
+        self.__draw_tile(x, y, blank_line)
 
     def __draw_units(self, units: dict[int, str]):
         """Draw all unit tiles on the formation."""
@@ -181,8 +248,9 @@ class Image_Maker:
                 if self.show_number:
                     self.__draw_text(cx, cy, 'A')
         
-    def generate_image(self, title, units, artifacts):
-        """Generate complete formation image and save to file."""
+    def compose(self, title, units, artifacts) -> tuple[DrawOp, ...]:
+        """Display list of a formation, in drawing order."""
+        self.ops = []
         if self.show_title:
             self.__draw_text(self.width / 2, FONT_SIZE + MARGIN, title)
 
@@ -192,8 +260,148 @@ class Image_Maker:
         
         if self.talent:
             self.__draw_talents()
-        
-        file_name = '{}.png'.format(self.user_id)
-        pygame.image.save(self.surface, file_name)
+        return tuple(self.ops)
+
+    def draw(self, op: DrawOp):
+        """Play one draw operation onto the canvas."""
+        if op.kind == "text":
+            self.canvas.draw_text(op.x, op.y, op.value)
+        elif op.kind == "yap":
+            self.canvas.blit(self.backend.yap, op.x, op.y)
+        else:
+            self.canvas.blit(self.backend.tiles[op.value], op.x, op.y)
+
+    def op_rect(self, op: DrawOp) -> Rect:
+        """Rectangle a draw operation covers; blits truncate their position."""
+        if op.kind == "text":
+            return self.canvas.text_rect(op.x, op.y, op.value)
+        atlas = self.backend.tiles.atlas
+        width, height = (atlas.yap_rect if op.kind == "yap" else atlas.rects[op.value])[2:]
+        return (int(op.x), int(op.y), width, height)
+
+    def paint(self, ops: tuple[DrawOp, ...], base: Layer=None) -> Canvas:
+        """
+        Draw a display list onto a new canvas, or onto a copy of base.
+
+        Starting from base, only the rectangles of operations that are not in
+        both lists are cleared and redrawn from every operation touching them.
+        """
+        if base is None:
+            self.canvas = self.backend.new_canvas(self.width, self.height + self.test_setting, FONT_SIZE)
+            for op in ops:
+                self.draw(op)
+            return self.canvas
+
+        self.canvas = base.canvas.copy()
+        dirty = [self.op_rect(op) for op in changed_ops(ops, base.ops)]
+        if not dirty:
+            return self.canvas
+
+        rects = [self.op_rect(op) for op in ops]
+        for rect in dirty:
+            self.canvas.set_clip(rect)
+            self.canvas.clear(rect)
+            for op, op_rect in zip(ops, rects):
+                if rects_overlap(op_rect, rect):
+                    self.draw(op)
+        self.canvas.set_clip(None)
+        return self.canvas
+
+    def get_layer_key(self) -> tuple:
+        """Everything besides the formation that decides how an image is drawn."""
+        return (self.backend.name, self.arena, self.unit_fill, self.unit_line, self.arti_fill, self.arti_line,
+                self.show_fill, self.show_number, self.show_title, self.test_setting, self.talent)
+
+    def get_base_layer(self, key: tuple) -> Layer:
+        """Empty board for this arena, hexes and settings, drawn once and cached."""
+        with layers_lock:
+            layer = base_layers.get(key)
+        if layer is None:
+            ops = self.compose("", {}, {})
+            layer = Layer(ops, self.paint(ops))
+            with layers_lock:
+                base_layers[key] = layer
+        return layer
+
+    def render(self, title, units, artifacts) -> Canvas:
+        """
+        Draw a formation over the closest cached layer.
+
+        The result is kept as the user's last image, so an edit of one or two
+        tiles only redraws those tiles and whatever overlaps them.
+        """
+        key = self.get_layer_key()
+        layers = [self.get_base_layer(key)]
+        if self.user_id is not None:
+            with layers_lock:
+                last = user_layers.get(self.user_id)
+            if last is not None and last[0] == key:
+                layers.append(last[1])
+
+        ops = self.compose(title, units, artifacts)
+        base = min(layers, key=lambda layer: len(changed_ops(ops, layer.ops)))
+        # Replaying clipped regions costs more than a fresh canvas once most operations changed
+        if len(changed_ops(ops, base.ops)) > len(ops) * MAX_CHANGED_RATIO:
+            base = None
+        canvas = self.paint(ops, base)
+
+        if self.user_id is not None:
+            # Painting never writes to its base, so the canvas can be shared with the next render
+            with layers_lock:
+                user_layers[self.user_id] = (key, Layer(ops, canvas))
+        return canvas
+
+    def generate_image(self, title, units, artifacts, encoder: str=None):
+        """Generate complete formation image and save it with the encoder's extension."""
+        encoded = make_encoder(encoder).encode_timed(self.render(title, units, artifacts))
+        log_encoded(encoded)
+
+        file_name = '{}.{}'.format(self.user_id, encoded.extension)
+        with open(file_name, "wb") as f:
+            f.write(encoded.data)
+
+        return file_name
+
+
+def log_encoded(encoded: EncodedImage):
+    """Log the size and encode time of an image."""
+    logger.debug("Encoded {} image: {} bytes in {:.1f} ms".format(encoded.encoder, encoded.size, encoded.encode_ms))
+
+
+def encode_formation(spec: FormationSpec, backend: str | RenderBackend=None, encoder: str=None,
+                     user_id: int=None) -> EncodedImage:
+    """Draw one formation and return it encoded with its encode time; a user ID keeps it as that user's last image."""
+    with Image_Maker(user_id, spec.base_hexes, spec.settings, spec.arena, spec.is_private, 3 in spec.artifacts,
+                     spec.talent, backend) as img_maker:
+        return make_encoder(encoder).encode_timed(img_maker.render(spec.title, spec.units, spec.artifacts))
+
+
+def render_formation(spec: FormationSpec, backend: str | RenderBackend=None, encoder: str=None,
+                     user_id: int=None) -> bytes:
+    """Draw one formation and return it encoded, as PNG by default; a user ID keeps it as that user's last image."""
+    encoded = encode_formation(spec, backend, encoder, user_id)
+    log_encoded(encoded)
+    return encoded.data
+
+
+def render_formations(specs: list[FormationSpec], backend: str | RenderBackend=None,
+                      executor: Executor=None, encoder: str=None) -> list[bytes]:
+    """
+    Draw several formations and return them encoded, in order.
+
+    Without an executor every formation is drawn in one render context, sharing
+    its fonts, text and base layers. With one, formations are spread over its
+    workers by backend name, so a process pool only pickles the specs; thread
+    pools suit the Pillow backend, as pygame draws through one global SDL state.
+    """
+    if executor is not None:
+        name = backend.name if isinstance(backend, RenderBackend) else backend
+        # Workers may not log, so encode metrics are logged here
+        encoded = list(executor.map(encode_formation, specs, repeat(name), repeat(encoder)))
+        for image in encoded:
+            log_encoded(image)
+        return [image.data for image in encoded]
 
-        return file_name
\ No newline at end of file
+    backend = backend if isinstance(backend, RenderBackend) else make_render_backend(backend)
+    with backend:
+        return [render_formation(spec, backend, encoder) for spec in specs]
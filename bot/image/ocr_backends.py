@@ -0,0 +1,169 @@
+"""
+OCR backends for damage extraction.
+
+The tesserocr backend keeps Tesseract and its traineddata loaded in-process
+and hands it the raw image buffer. The tesserocr wheel bundles its own
+libtesseract, so it reads the traineddata of the tesseract-ocr apt package,
+located through TESSDATA_PREFIX or the tesseract binary. The pytesseract
+backend spawns the tesseract binary per image and is used when tesserocr is
+not installed or finds no traineddata.
+"""
+import logging
+import os
+import re
+import subprocess
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+logger = logging.getLogger()
+
+# Columns of Tesseract's TSV output, shared by both backends
+TSV_FIELDS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+              'left', 'top', 'width', 'height', 'conf', 'text')
+INT_FIELDS = TSV_FIELDS[:10]
+
+
+def get_tessdata_path() -> str | None:
+    """Tessdata folder from TESSDATA_PREFIX, else the one the tesseract binary reports, else None."""
+    if os.environ.get("TESSDATA_PREFIX"):
+        return os.environ["TESSDATA_PREFIX"]
+    try:
+        out = subprocess.check_output(["tesseract", "--list-langs"], text=True, stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    # List of available languages in "/usr/share/tesseract-ocr/5/tessdata/" (3):
+    match = re.search(r'"(.+)"', out)
+    return match.group(1) if match else None
+
+
+def parse_tsv(tsv: str) -> dict[str, list]:
+    """Parse Tesseract TSV output into the dictionary layout of pytesseract.image_to_data."""
+    data = {field: [] for field in TSV_FIELDS}
+    for line in tsv.splitlines():
+        values = line.split('\t')
+        if len(values) < len(TSV_FIELDS) - 1 or values[0] == 'level':
+            continue
+        values += [''] * (len(TSV_FIELDS) - len(values))
+        for field, value in zip(TSV_FIELDS, values):
+            data[field].append(int(value) if field in INT_FIELDS else value)
+    return data
+
+
+class OCRBackend:
+    """Interface for running Tesseract on a NumPy image."""
+    name = "base"
+
+    def image_to_data(self, image: np.ndarray, lang: str, psm: int=6, config: str="") -> dict[str, list]:
+        """
+        Recognize words in a grayscale or RGB image.
+
+        Returns:
+            Dictionary of TSV columns, as returned by pytesseract.image_to_data
+        """
+        raise NotImplementedError
+
+    def get_languages(self) -> list[str]:
+        """Installed traineddata languages."""
+        raise NotImplementedError
+
+
+class PytesseractBackend(OCRBackend):
+    """Runs the tesseract binary in a subprocess for every image."""
+    name = "pytesseract"
+
+    def image_to_data(self, image: np.ndarray, lang: str, psm: int=6, config: str="") -> dict[str, list]:
+        """Recognize words through a tesseract subprocess."""
+        return pytesseract.image_to_data(
+            image,
+            lang=lang,
+            output_type=pytesseract.Output.DICT,
+            config="--psm {} {}".format(psm, config).strip()
+        )
+
+    def get_languages(self) -> list[str]:
+        """List languages through `tesseract --list-langs`."""
+        out = subprocess.check_output(["tesseract", "--list-langs"], text=True, stderr=subprocess.STDOUT)
+        return [line.strip() for line in out.splitlines()
+                if line.strip() and not line.lower().startswith("list of available languages")]
+
+
+class TesserocrBackend(OCRBackend):
+    """Keeps one Tesseract API per language and page mode loaded for the life of the process."""
+    name = "tesserocr"
+
+    def __init__(self, path: str = None):
+        """Initialize empty API cache over a tessdata folder, the system one if None."""
+        self.path = path or get_tessdata_path()
+        self.apis = {}
+        self.lock = threading.Lock()
+
+    def get_api(self, lang: str, psm: int, config: str) -> "tesserocr.PyTessBaseAPI":
+        """Create the API for a language, page mode and `-c name=value` config once."""
+        key = (lang, psm, config)
+        if key not in self.apis:
+            if self.path:
+                api = tesserocr.PyTessBaseAPI(path=self.path, lang=lang, psm=psm)
+            else:
+                api = tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+            for option in config.split():
+                if "=" in option:
+                    api.SetVariable(*option.split("=", 1))
+            self.apis[key] = api
+        return self.apis[key]
+
+    def image_to_data(self, image: np.ndarray, lang: str, psm: int=6, config: str="") -> dict[str, list]:
+        """Recognize words from the raw pixel buffer without encoding an image file."""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+
+        # Tesseract APIs are not thread-safe and hold per-image state
+        with self.lock:
+            api = self.get_api(lang, psm, config)
+            api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+            api.Recognize()
+            return parse_tsv(api.GetTSVText(0))
+
+    def get_languages(self) -> list[str]:
+        """List languages from the loaded tessdata folder."""
+        if self.path:
+            return list(tesserocr.get_languages(self.path)[1])
+        return list(tesserocr.get_languages()[1])
+
+
+_backend: OCRBackend = None
+
+def get_ocr_backend() -> OCRBackend:
+    """OCR backend shared by every extractor, preferring the in-process engine."""
+    global _backend
+    if _backend is None:
+        if tesserocr is None:
+            logger.info("tesserocr is not installed, using the pytesseract subprocess backend")
+        else:
+            backend = TesserocrBackend()
+            if backend.get_languages():
+                _backend = backend
+            else:
+                logger.warning("tesserocr found no traineddata in {}, using the pytesseract subprocess backend"
+                               .format(backend.path))
+        if _backend is None:
+            _backend = PytesseractBackend()
+    return _backend
+
+
+@lru_cache(maxsize=None)
+def get_languages() -> tuple[str]:
+    """Installed languages with osd first, looked up once per process."""
+    langs = get_ocr_backend().get_languages()
+    if "osd" in langs:
+        langs.remove("osd")
+        langs.insert(0, "osd")
+    return tuple(langs)
@@ -0,0 +1,183 @@
+"""
+Recognition engines that classify circle crops against the template bank.
+
+Run `python -m bot.image.recognition_engines` to compare their latency and
+accuracy on the labeled sample screenshots.
+"""
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from bot.core.config import path_settings
+from bot.image.template_pack import (CIRCLE_TEMPLATE_SIZE, TemplateBank,
+                                     get_circle_mask, get_template_bank,
+                                     normalize)
+
+EMBEDDING_CROP_SIZE = (48, 48)
+EMBEDDING_DIM = 512
+EMBEDDING_SEED = 232
+EMBEDDING_NEIGHBOURS = 1
+
+
+class RecognitionEngine:
+    """Interface for classifying BGR circle crops into unit labels."""
+    name = "base"
+
+    def __init__(self, bank: TemplateBank=None):
+        """Initialize engine over a template bank."""
+        self.bank = bank or get_template_bank()
+
+    def classify(self, circle: np.ndarray) -> tuple[str, float]:
+        """Return best label and its score for one circle crop."""
+        raise NotImplementedError
+
+    def classify_many(self, circles: list[np.ndarray]) -> list[tuple[str, float]]:
+        """Classify several circle crops."""
+        return [self.classify(circle) for circle in circles]
+
+
+class NCCEngine(RecognitionEngine):
+    """Masked normalized cross-correlation against every template."""
+    name = "ncc"
+
+    def classify(self, circle: np.ndarray) -> tuple[str, float]:
+        """Return best label and its correlation score."""
+        return self.bank.match(circle)
+
+    def classify_many(self, circles: list[np.ndarray]) -> list[tuple[str, float]]:
+        """Score all circles against all templates in one matrix product."""
+        if not circles:
+            return []
+        queries = np.stack([self.bank.prepare(circle).ravel() for circle in circles])
+        scores = queries @ self.bank.matrix.T
+        best = scores.argmax(axis=1)
+        return [(self.bank.labels[idx], float(scores[i, idx])) for i, idx in enumerate(best)]
+
+
+class EmbeddingEngine(RecognitionEngine):
+    """kNN over fixed random-projection embeddings of normalized 48x48 crops."""
+    name = "embedding"
+
+    def __init__(self, bank: TemplateBank=None, dim: int=EMBEDDING_DIM, neighbours: int=EMBEDDING_NEIGHBOURS):
+        """Embed every template once."""
+        super().__init__(bank)
+        self.neighbours = neighbours
+        self.mask = get_circle_mask(EMBEDDING_CROP_SIZE)
+
+        w, h = EMBEDDING_CROP_SIZE
+        rng = np.random.default_rng(EMBEDDING_SEED)
+        self.projection = (rng.standard_normal((h * w * 3, dim)) / np.sqrt(dim)).astype(np.float32)
+
+        # Templates are stored normalized at full size; shrink and renormalize them
+        small = np.stack([cv2.resize(np.asarray(template), EMBEDDING_CROP_SIZE, interpolation=cv2.INTER_AREA)
+                          for template in self.bank.templates])
+        self.embeddings = self.embed(normalize(small, self.mask)[0])
+
+    def embed(self, crops: np.ndarray) -> np.ndarray:
+        """Project normalized (N, 48, 48, 3) crops to unit-norm embeddings."""
+        embeddings = crops.reshape(len(crops), -1) @ self.projection
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-6)
+
+    def prepare(self, circle: np.ndarray) -> np.ndarray:
+        """Resize a BGR circle crop to the embedding size."""
+        if circle.shape[2] == 4:
+            circle = cv2.cvtColor(circle, cv2.COLOR_BGRA2BGR)
+        resized = cv2.resize(circle, CIRCLE_TEMPLATE_SIZE, interpolation=cv2.INTER_AREA)
+        return cv2.resize(resized, EMBEDDING_CROP_SIZE, interpolation=cv2.INTER_AREA)
+
+    def classify(self, circle: np.ndarray) -> tuple[str, float]:
+        """Return best label and its summed neighbour similarity."""
+        return self.classify_many([circle])[0]
+
+    def classify_many(self, circles: list[np.ndarray]) -> list[tuple[str, float]]:
+        """Embed all circles and vote among the nearest templates."""
+        if not circles:
+            return []
+        queries = self.embed(normalize(np.stack([self.prepare(circle) for circle in circles]), self.mask)[0])
+        similarities = queries @ self.embeddings.T
+
+        results = []
+        k = min(self.neighbours, similarities.shape[1])
+        for row in similarities:
+            nearest = np.argpartition(-row, k - 1)[:k]
+            votes = {}
+            for idx in nearest:
+                label = self.bank.labels[idx]
+                votes[label] = votes.get(label, 0.0) + float(row[idx])
+            label = max(votes, key=votes.get)
+            results.append((label, votes[label]))
+        return results
+
+
+ENGINES = {engine.name: engine for engine in (NCCEngine, EmbeddingEngine)}
+
+def make_engine(name: str, bank: TemplateBank=None) -> RecognitionEngine:
+    """Create a recognition engine by name."""
+    if name not in ENGINES:
+        raise ValueError("Unknown recognition engine: {}".format(name))
+    return ENGINES[name](bank)
+
+
+def compare_engines(ground_truth_path: Path=None, repeat: int=5) -> dict[str, dict]:
+    """
+    Classify the circles of every labeled formation sample with each engine.
+
+    Returns:
+        Dictionary of engine name to accuracy, per-image latency and misses
+    """
+    from bot.image.analyze_image import analyze_formation, get_layouts
+
+    ground_truth_path = ground_truth_path or path_settings.ground_truth_path
+    with open(ground_truth_path, "r") as f:
+        ground_truth = json.load(f)
+
+    # Crop the circles once so that only classification is timed
+    samples = []
+    bank = get_template_bank()
+    layouts = get_layouts()
+    for entry in ground_truth['samples']:
+        if 'units' not in entry:
+            continue
+        image_bytes = (path_settings.base_dir / entry['file']).read_bytes()
+        result = analyze_formation(image_bytes, engine=NCCEngine(bank))
+        layout = layouts[result.arena]
+        tiles = [layout.locate(a / result.width, b / result.width)[0] for a, b, _ in result.circles_pos]
+        samples.append((entry, list(result.circles), tiles))
+
+    report = {}
+    for name in ENGINES:
+        engine = make_engine(name, bank)
+        correct, total, misses, elapsed = 0, 0, [], 0.0
+        for entry, circles, tiles in samples:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                results = engine.classify_many(circles)
+            elapsed += (time.perf_counter() - start) / repeat
+
+            for tile, (label, _) in zip(tiles, results):
+                expected = entry['units'].get(str(tile))
+                if expected is None:
+                    continue
+                total += 1
+                if label == expected:
+                    correct += 1
+                else:
+                    misses.append("{} tile {}: {} != {}".format(entry['file'], tile, label, expected))
+
+        report[name] = {
+            'accuracy': correct / total if total else None,
+            'ms_per_image': elapsed * 1000 / max(len(samples), 1),
+            'misses': misses
+        }
+    return report
+
+
+if __name__ == "__main__":
+    for name, result in compare_engines().items():
+        accuracy = "n/a" if result['accuracy'] is None else "{:.1%}".format(result['accuracy'])
+        print("{:<10} accuracy {:>7}  {:7.2f} ms/image".format(name, accuracy, result['ms_per_image']))
+        for miss in result['misses']:
+            print("    {}".format(miss))
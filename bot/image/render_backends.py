@@ -0,0 +1,416 @@
+"""
+Renderer backends for formation images.
+
+The pygame backend draws on SDL surfaces and needs pygame initialized around
+every render, or once around a batch of them. The Pillow backend needs no game library: it blends views of
+the tile atlas, pre-scaled with the same integer filter as pygame's
+smoothscale, with pygame's alpha formula, so both backends produce identical
+tile pixels. Text goes through FreeType in both and may differ by a few levels of
+antialiasing on glyph edges; titles with kerned letter pairs also shift by a
+pixel or more unless Pillow was built with Raqm, as SDL_ttf kerns with
+HarfBuzz.
+
+Run `python -m bot.image.render_backends` to compare both backends on every
+arena.
+"""
+import io
+import math
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from bot.core.config import data_settings, path_settings
+from bot.image.tile_atlas import PREWARM_TILES, TileCache, get_tile_atlas
+
+TEXT_COLOR = (255, 255, 255)
+DEFAULT_RENDER_BACKEND = "pygame"
+
+# [x, y, width, height], as in the tile atlas index
+Rect = tuple[int, int, int, int]
+
+
+def alpha_blend(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Blend RGBA src over dst with pygame's per-pixel alpha blit arithmetic."""
+    src_alpha = src[..., 3]
+    blended = dst.copy()
+
+    # Opaque sources and transparent destinations reduce to a copy of the source
+    copy = (src_alpha == 255) | (dst[..., 3] == 0)
+    blended[copy] = src[copy]
+
+    edge = (src_alpha != 0) & ~copy
+    s = src[edge].astype(np.int32)
+    d = dst[edge].astype(np.int32)
+    s_alpha, d_alpha = s[:, 3:], d[:, 3:]
+    mixed = np.empty_like(d)
+    mixed[:, :3] = (((s[:, :3] - d[:, :3]) * s_alpha + s[:, :3]) >> 8) + d[:, :3]
+    mixed[:, 3:] = s_alpha + d_alpha - s_alpha * d_alpha // 255
+    blended[edge] = mixed
+    return blended
+
+
+def round_half_away(value: float) -> int:
+    """Round like C's round(), which pygame uses for rectangle centers."""
+    return int(math.floor(abs(value) + 0.5) * math.copysign(1, value))
+
+
+def rects_overlap(a: Rect, b: Rect) -> bool:
+    """Whether two [x, y, width, height] rectangles share a pixel."""
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+class Canvas:
+    """Surface a formation image is drawn on."""
+    def blit(self, image, x: float, y: float):
+        """Alpha blend a backend image with its top-left corner at (x, y)."""
+        raise NotImplementedError
+
+    def draw_text(self, center_x: float, center_y: float, text: str):
+        """Draw white text centered at (center_x, center_y)."""
+        raise NotImplementedError
+
+    def text_rect(self, center_x: float, center_y: float, text: str) -> Rect:
+        """Rectangle draw_text covers."""
+        raise NotImplementedError
+
+    def set_clip(self, rect: Rect | None):
+        """Restrict drawing and clearing to a rectangle, or lift the restriction with None."""
+        raise NotImplementedError
+
+    def clear(self, rect: Rect):
+        """Make a rectangle fully transparent."""
+        raise NotImplementedError
+
+    def copy(self) -> "Canvas":
+        """Independent canvas with the same pixels."""
+        raise NotImplementedError
+
+    def to_array(self) -> np.ndarray:
+        """(H, W, 4) RGBA pixels of the canvas."""
+        raise NotImplementedError
+
+    def encode(self) -> bytes:
+        """The canvas as PNG bytes."""
+        raise NotImplementedError
+
+    def save(self, file_name: str):
+        """Write the canvas as a PNG file."""
+        with open(file_name, "wb") as f:
+            f.write(self.encode())
+
+
+class RenderBackend:
+    """Interface for loading tiles and creating canvases."""
+    name = "base"
+
+    def __enter__(self) -> "RenderBackend":
+        """Prepare the backend for one render."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Release per-render resources."""
+
+    @property
+    def tiles(self) -> TileCache:
+        """Lazily loaded hex tile images by name."""
+        raise NotImplementedError
+
+    @property
+    def yap(self):
+        """Yap image."""
+        raise NotImplementedError
+
+    def new_canvas(self, width: int, height: int, font_size: int) -> Canvas:
+        """Transparent canvas with a font of the given size."""
+        raise NotImplementedError
+
+    def prewarm(self, limit: int=PREWARM_TILES, background: bool=True):
+        """Load the most used tiles ahead of the first render, in a daemon thread by default."""
+        names = get_tile_atlas().most_used(limit)
+        if not background:
+            self.tiles.prewarm(names)
+            return
+        threading.Thread(target=self.tiles.prewarm, args=(names,), name="tile-prewarm", daemon=True).start()
+
+
+class PygameCanvas(Canvas):
+    """Canvas backed by a pygame surface."""
+    def __init__(self, width: int, height: int, font_size: int, surface=None):
+        """Create a transparent surface, or wrap an existing one."""
+        import pygame
+
+        self.pygame = pygame
+        self.font_size = font_size
+        self.font = PygameBackend.get_font(font_size)
+        if surface is None:
+            surface = pygame.Surface((width, height), pygame.SRCALPHA)
+            surface.fill((0, 0, 0, 0))
+        self.surface = surface
+
+    def blit(self, image, x: float, y: float):
+        """Blit a pygame surface."""
+        self.surface.blit(image, (x, y))
+
+    def draw_text(self, center_x: float, center_y: float, text: str):
+        """Render text with SDL_ttf and blit it."""
+        text_surface = self.font.render(text, True, TEXT_COLOR)
+        text_rect = text_surface.get_rect(center=(center_x, center_y))
+        self.surface.blit(text_surface, text_rect.topleft)
+
+    def text_rect(self, center_x: float, center_y: float, text: str) -> Rect:
+        width, height = self.font.size(text)
+        return (round_half_away(center_x) - width // 2, round_half_away(center_y) - height // 2, width, height)
+
+    def set_clip(self, rect: Rect | None):
+        self.surface.set_clip(rect)
+
+    def clear(self, rect: Rect):
+        self.surface.fill((0, 0, 0, 0), rect)
+
+    def copy(self) -> "PygameCanvas":
+        return PygameCanvas(0, 0, self.font_size, self.surface.copy())
+
+    def to_array(self) -> np.ndarray:
+        width, height = self.surface.get_size()
+        return np.frombuffer(self.pygame.image.tobytes(self.surface, "RGBA"), np.uint8).reshape(height, width, 4)
+
+    def encode(self) -> bytes:
+        """Encode through pygame."""
+        buffer = io.BytesIO()
+        self.pygame.image.save(self.surface, buffer, "png")
+        return buffer.getvalue()
+
+    def save(self, file_name: str):
+        """Save through pygame."""
+        self.pygame.image.save(self.surface, file_name)
+
+
+class PygameBackend(RenderBackend):
+    """
+    Draws with pygame, initialized around every render.
+
+    Contexts nest: pygame is initialized by the outermost one and shut down
+    when it exits, so a batch of renders shares one initialization and its
+    fonts.
+    """
+    name = "pygame"
+    lock = threading.Lock()
+    depth = 0
+    fonts = {}
+
+    def __enter__(self) -> "PygameBackend":
+        """Initialize pygame unless a render context is already open."""
+        import pygame
+        with PygameBackend.lock:
+            if PygameBackend.depth == 0:
+                pygame.init()
+            PygameBackend.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Shut pygame down when the outermost context exits."""
+        import pygame
+        with PygameBackend.lock:
+            PygameBackend.depth -= 1
+            if PygameBackend.depth == 0:
+                # Fonts belong to the SDL_ttf session that quit ends
+                PygameBackend.fonts.clear()
+                pygame.quit()
+
+    @classmethod
+    def get_font(cls, font_size: int):
+        """Font at a pixel size, loaded once per pygame session."""
+        import pygame
+        with cls.lock:
+            if font_size not in cls.fonts:
+                cls.fonts[font_size] = pygame.font.Font(str(path_settings.font_path), font_size)
+            return cls.fonts[font_size]
+
+    @property
+    def loader(self):
+        """Shared pygame asset loader."""
+        from bot.image.image_loader import Image_Loader
+        return Image_Loader()
+
+    @property
+    def tiles(self) -> TileCache:
+        return self.loader.tiles
+
+    @property
+    def yap(self):
+        return self.loader.yap
+
+    def new_canvas(self, width: int, height: int, font_size: int) -> PygameCanvas:
+        return PygameCanvas(width, height, font_size)
+
+
+@lru_cache(maxsize=None)
+def get_font(font_size: int) -> ImageFont.FreeTypeFont:
+    """Text font at a pixel size, loaded once per size."""
+    return ImageFont.truetype(str(path_settings.font_path), font_size)
+
+
+@lru_cache(maxsize=1024)
+def get_text_image(font_size: int, text: str) -> np.ndarray:
+    """White RGBA text rasterized with FreeType, cached because labels repeat across renders."""
+    font = get_font(font_size)
+    # SDL_ttf clips text to the font height, which can be a row short of ascent + descent
+    mask = Image.new("L", (math.ceil(font.getlength(text)), font.font.height), 0)
+    ImageDraw.Draw(mask).text((0, 0), text, fill=255, font=font)
+
+    image = np.empty((mask.height, mask.width, 4), dtype=np.uint8)
+    image[..., :3] = TEXT_COLOR
+    image[..., 3] = np.asarray(mask)
+    image.flags.writeable = False
+    return image
+
+
+class PillowCanvas(Canvas):
+    """Canvas backed by an RGBA NumPy array."""
+    def __init__(self, width: int, height: int, font_size: int, pixels: np.ndarray=None):
+        """Create a transparent canvas, or wrap existing pixels."""
+        self.pixels = np.zeros((int(height), int(width), 4), dtype=np.uint8) if pixels is None else pixels
+        self.font_size = font_size
+        self.clip = None
+
+    def blit(self, image: np.ndarray, x: float, y: float):
+        """Blend an RGBA array, truncating the position and clipping like pygame."""
+        x, y = int(x), int(y)
+        h, w = image.shape[:2]
+        height, width = self.pixels.shape[:2]
+        x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, width), min(y + h, height)
+        if self.clip:
+            cx, cy, cw, ch = self.clip
+            x0, y0, x1, y1 = max(x0, cx), max(y0, cy), min(x1, cx + cw), min(y1, cy + ch)
+        if x0 >= x1 or y0 >= y1:
+            return
+        region = self.pixels[y0:y1, x0:x1]
+        region[...] = alpha_blend(image[y0 - y:y1 - y, x0 - x:x1 - x], region)
+
+    def draw_text(self, center_x: float, center_y: float, text: str):
+        """Blend cached FreeType text."""
+        x, y = self.text_rect(center_x, center_y, text)[:2]
+        self.blit(get_text_image(self.font_size, text), x, y)
+
+    def text_rect(self, center_x: float, center_y: float, text: str) -> Rect:
+        height, width = get_text_image(self.font_size, text).shape[:2]
+        return (round_half_away(center_x) - width // 2, round_half_away(center_y) - height // 2, width, height)
+
+    def set_clip(self, rect: Rect | None):
+        self.clip = rect
+
+    def clear(self, rect: Rect):
+        if self.clip:
+            x0, y0 = max(rect[0], self.clip[0]), max(rect[1], self.clip[1])
+            x1 = min(rect[0] + rect[2], self.clip[0] + self.clip[2])
+            y1 = min(rect[1] + rect[3], self.clip[1] + self.clip[3])
+        else:
+            x0, y0, x1, y1 = rect[0], rect[1], rect[0] + rect[2], rect[1] + rect[3]
+        self.pixels[max(y0, 0):max(y1, 0), max(x0, 0):max(x1, 0)] = 0
+
+    def copy(self) -> "PillowCanvas":
+        return PillowCanvas(0, 0, self.font_size, self.pixels.copy())
+
+    def to_array(self) -> np.ndarray:
+        return self.pixels
+
+    def encode(self) -> bytes:
+        """Encode through Pillow."""
+        buffer = io.BytesIO()
+        Image.fromarray(self.pixels, "RGBA").save(buffer, "PNG")
+        return buffer.getvalue()
+
+    def save(self, file_name: str):
+        """Save through Pillow."""
+        Image.fromarray(self.pixels, "RGBA").save(file_name)
+
+
+class PillowBackend(RenderBackend):
+    """Draws with NumPy alpha blending over the pre-scaled tile atlas, without pygame."""
+    name = "pillow"
+
+    @property
+    def tiles(self) -> TileCache:
+        return get_tile_atlas().tiles
+
+    @property
+    def yap(self) -> np.ndarray:
+        return get_tile_atlas().yap
+
+    def new_canvas(self, width: int, height: int, font_size: int) -> PillowCanvas:
+        return PillowCanvas(width, height, font_size)
+
+
+BACKENDS = {backend.name: backend for backend in (PygameBackend, PillowBackend)}
+
+def make_render_backend(name: str=None) -> RenderBackend:
+    """Create a render backend by name, the default backend if None."""
+    name = name or DEFAULT_RENDER_BACKEND
+    if name not in BACKENDS:
+        raise ValueError("Unknown render backend: {}".format(name))
+    return BACKENDS[name]()
+
+
+def get_sample_formation(arena: str, tiles: dict) -> tuple[dict[int, str], dict[int, str]]:
+    """Units on every other tile of an arena and one artifact, for benchmarking."""
+    units = [name for name in data_settings.units if name in tiles]
+    artifacts = [name for name in data_settings.artifacts if name in tiles]
+    tile_count = len(data_settings.maps[arena]['Tiles'])
+    return ({idx: units[idx % len(units)] for idx in range(1, tile_count + 1, 2)},
+            {1: artifacts[0]})
+
+
+def compare_backends(repeat: int=5) -> dict[str, dict]:
+    """
+    Render a sample formation on every arena with each backend.
+
+    Returns:
+        Dictionary of arena to per-backend latency and pixel differences
+    """
+    from bot.database.database import DEFAULT_HEXES
+    from bot.image.image_maker import Image_Maker
+
+    settings = {'make_transparent': False, 'show_numbers': True, 'show_title': True}
+    report = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for arena in data_settings.maps:
+            report[arena] = {}
+            images = {}
+            for name in BACKENDS:
+                backend = make_render_backend(name)
+                units, artifacts = get_sample_formation(arena, backend.tiles)
+
+                elapsed = []
+                for i in range(repeat):
+                    start = time.perf_counter()
+                    # A new user ID per render, or only the difference to the last image is drawn
+                    with Image_Maker(Path(folder) / "{}-{}".format(name, i), DEFAULT_HEXES, settings, arena, False, False,
+                                     talent=True, backend=name) as img_maker:
+                        file_name = img_maker.generate_image(arena, units, artifacts)
+                    elapsed.append(time.perf_counter() - start)
+                with Image.open(file_name) as img:
+                    images[name] = np.asarray(img.convert("RGBA")).astype(np.int16)
+                report[arena][name] = {'ms_per_image': float(np.median(elapsed)) * 1000}
+
+            difference = np.abs(images['pygame'] - images['pillow'])
+            report[arena]['max_difference'] = int(difference.max())
+            report[arena]['differing_pixels'] = float((difference.max(axis=2) > 0).mean())
+    return report
+
+
+if __name__ == "__main__":
+    # Cold start: imports and asset loading before the first render
+    for name in BACKENDS:
+        start = time.perf_counter()
+        make_render_backend(name).tiles
+        print("{:<8} assets loaded in {:.0f} ms".format(name, (time.perf_counter() - start) * 1000))
+
+    for arena, result in compare_backends().items():
+        print("{:<24} pygame {:7.2f} ms  pillow {:7.2f} ms  max diff {:3d}  differing {:.3%}".format(
+            arena, result['pygame']['ms_per_image'], result['pillow']['ms_per_image'],
+            result['max_difference'], result['differing_pixels']))
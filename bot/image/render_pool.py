@@ -0,0 +1,247 @@
+"""
+Warm pool of render worker processes.
+
+Rendering is CPU bound, so formation images are drawn in worker processes
+instead of on the event loop. At spawn every worker opens its render backend
+for its whole lifetime, which keeps pygame and its fonts loaded, pages in the
+most used tiles and draws the empty board of every arena once, so its first
+job is as fast as the rest. Jobs are compact FormationSpec values and return
+encoded bytes.
+
+Every warm worker holds about 85 MB, so the pool size is the render_workers
+setting, one worker by default. The pool is replaced after
+MAX_JOBS_PER_WORKER jobs per worker to cap memory, a job that finds the pool
+broken is retried once on a fresh pool, and check_health round-trips a ping
+through the queue.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from bot.core.config import app_settings, data_settings
+from bot.image.image_encoder import EncodedImage
+from bot.image.image_maker import (FormationSpec, Image_Maker, encode_formation,
+                                  log_encoded)
+from bot.image.render_backends import (DEFAULT_RENDER_BACKEND, RenderBackend,
+                                       make_render_backend)
+
+logger = logging.getLogger()
+
+MAX_JOBS_PER_WORKER = 500
+HEALTH_CHECK_TIMEOUT = 10.0
+# Seconds a warming worker waits for the others to reach the barrier
+WARM_TIMEOUT = 60.0
+# Workers get a fresh interpreter rather than a fork of the bot and its event loop
+START_METHOD = "spawn"
+
+# Per worker process
+worker_backend: RenderBackend | None = None
+worker_barrier: threading.Barrier | None = None
+worker_jobs = 0
+
+
+def warm_worker(backend_name: str, barrier: threading.Barrier):
+    """Pool initializer: open the render backend for the worker's lifetime and draw every empty board."""
+    from bot.database.database import DEFAULT_HEXES
+
+    global worker_backend, worker_barrier
+    worker_barrier = barrier
+    worker_backend = make_render_backend(backend_name)
+    worker_backend.__enter__()
+    worker_backend.prewarm(background=False)
+
+    settings = {'make_transparent': False, 'show_numbers': True, 'show_title': False}
+    for arena in data_settings.maps:
+        with Image_Maker(None, DEFAULT_HEXES, settings, arena, True, False, backend=worker_backend) as img_maker:
+            img_maker.render("", {}, {})
+
+
+def run_job(spec: FormationSpec, encoder: str | None, user_id: int | None) -> EncodedImage:
+    """Render one formation in a worker, with encode metrics for the pool to log."""
+    global worker_jobs
+    worker_jobs += 1
+    return encode_formation(spec, worker_backend, encoder, user_id)
+
+
+def worker_status() -> dict:
+    """Health report of the worker that runs it."""
+    return {'pid': os.getpid(), 'jobs': worker_jobs, 'backend': worker_backend.name if worker_backend else None}
+
+
+def sync_worker(timeout: float) -> dict:
+    """Hold the worker until every worker of the pool runs this too, so each takes exactly one, then report it."""
+    try:
+        worker_barrier.wait(timeout)
+    except threading.BrokenBarrierError:
+        pass
+    return worker_status()
+
+
+class RenderPool:
+    """Process pool of warm render workers with queue depth and job counters."""
+    def __init__(self, workers: int = None, backend: str = None,
+                 max_jobs_per_worker: int = MAX_JOBS_PER_WORKER):
+        """Initialize pool settings, sized by the render_workers setting by default; workers are spawned on start."""
+        self.workers = workers or app_settings.render_workers
+        self.backend = backend or DEFAULT_RENDER_BACKEND
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.executor: ProcessPoolExecutor | None = None
+        self.barrier: threading.Barrier | None = None
+        self.lock = threading.Lock()
+        self.jobs = 0
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def start(self) -> ProcessPoolExecutor:
+        """Create the executor if it is not running."""
+        with self.lock:
+            if self.executor is None:
+                context = multiprocessing.get_context(START_METHOD)
+                self.barrier = context.Barrier(self.workers)
+                self.executor = ProcessPoolExecutor(
+                    self.workers, mp_context=context, initializer=warm_worker, initargs=(self.backend, self.barrier))
+                self.jobs = 0
+            return self.executor
+
+    def restart(self, broken: ProcessPoolExecutor = None) -> ProcessPoolExecutor:
+        """
+        Replace the executor, cancelling jobs that have not started.
+
+        Args:
+            broken: Executor a failed job ran on; the pool is left alone if it was already replaced,
+                as every job queued on a broken pool fails and only the first may restart it
+
+        Returns:
+            Running executor
+        """
+        with self.lock:
+            replaced = broken is not None and self.executor is not broken
+            if not replaced:
+                executor, self.executor = self.executor, None
+                self.restarts += 1
+        if replaced:
+            return self.start()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        logger.warning("Render pool restarted ({} restarts)".format(self.restarts))
+        return self.start()
+
+    def recycle(self):
+        """Replace the executor, letting queued jobs finish on the old workers."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        logger.info("Render pool recycled after {} jobs".format(self.jobs))
+
+    def close(self):
+        """Shut the workers down."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs submitted and not finished yet."""
+        return self.pending
+
+    def metrics(self) -> dict:
+        """Queue depth and job counters."""
+        return {'workers': self.workers, 'queue_depth': self.pending, 'completed': self.completed,
+                'failed': self.failed, 'restarts': self.restarts}
+
+    def submit(self, fn, *args) -> Future:
+        """Queue a call on a worker, recycling the pool once its workers ran their share of jobs."""
+        return self.dispatch(fn, *args)[1]
+
+    def dispatch(self, fn, *args) -> tuple[ProcessPoolExecutor, Future]:
+        """Queue a call on a worker like submit, with the executor it was queued on."""
+        if self.jobs >= self.workers * self.max_jobs_per_worker:
+            self.recycle()
+        executor = self.start()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died since the last job finished and no job has restarted the pool yet
+            executor = self.restart(executor)
+            future = executor.submit(fn, *args)
+        with self.lock:
+            self.pending += 1
+            self.jobs += 1
+        future.add_done_callback(self.job_done)
+        return executor, future
+
+    def job_done(self, future: Future):
+        """Count a finished job."""
+        with self.lock:
+            self.pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    async def run(self, fn, *args):
+        """Run a call on a worker, retrying it once on a fresh pool if a worker died and took the pool with it."""
+        executor, future = self.dispatch(fn, *args)
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            self.restart(executor)
+            return await asyncio.wrap_future(self.submit(fn, *args))
+
+    async def render(self, spec: FormationSpec, encoder: str = None, user_id: int = None) -> bytes:
+        """Render a formation on a worker and return the encoded bytes."""
+        encoded = await self.run(run_job, spec, encoder, user_id)
+        log_encoded(encoded)
+        return encoded.data
+
+    async def render_many(self, specs: list[FormationSpec], encoder: str = None) -> list[bytes]:
+        """Render several formations spread over the workers and return the encoded bytes, in order."""
+        return list(await asyncio.gather(*[self.render(spec, encoder) for spec in specs]))
+
+    async def warm(self, timeout: float = WARM_TIMEOUT) -> list[dict]:
+        """
+        Spawn and warm every worker ahead of the first job.
+
+        One ping per worker meets the others at a barrier, so no worker can
+        answer two pings and every worker is warm once all of them answered.
+        """
+        statuses = await asyncio.gather(
+            *[asyncio.wrap_future(self.submit(sync_worker, timeout)) for _ in range(self.workers)])
+        pids = {status['pid'] for status in statuses}
+        if len(pids) < self.workers:
+            logger.warning("Render pool warmed {} of {} workers".format(len(pids), self.workers))
+            self.barrier.reset()
+        return statuses
+
+    async def check_health(self, timeout: float = HEALTH_CHECK_TIMEOUT) -> dict | None:
+        """
+        Round-trip a ping through the queue, restarting the pool if it is broken.
+
+        A ping that times out while other jobs keep finishing only means the
+        queue is long, so the pool is restarted only when nothing completed.
+        """
+        completed = self.completed
+        start = time.perf_counter()
+        executor, future = self.dispatch(worker_status)
+        try:
+            status = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except BrokenProcessPool:
+            self.restart(executor)
+            return None
+        except asyncio.TimeoutError:
+            if self.completed == completed:
+                self.restart(executor)
+            return None
+
+        status['latency_ms'] = (time.perf_counter() - start) * 1000
+        status.update(self.metrics())
+        return status
@@ -0,0 +1,72 @@
+"""
+Screenshot type classification from a small thumbnail.
+
+Formations are a brown hex map and team cards a wide light card, which is
+enough to skip OCR of the damage panel. Formation analysis is only skipped
+on damage statistics, which need a grey screen and a table of white numbers
+in the damage panel: a formation in front of a grey boss would otherwise
+lose its analysis. Anything unclear is UNKNOWN and goes through every
+pipeline, as before routing.
+"""
+import cv2
+import numpy as np
+
+from bot.core.enum_classes import ScreenshotType
+from bot.image.damage_extractor import get_panel_mask, get_panel_rows, get_words
+
+THUMBNAIL_WIDTH = 64
+
+# Center region sampled for colors, as fractions of (x0, x1, y0, y1)
+CENTER_BOUNDS = (0.1, 0.9, 0.2, 0.6)
+
+TEAM_MIN_ASPECT = 1.5
+DAMAGE_MIN_GREY = 0.5
+FORMATION_MIN_BROWN = 0.25
+TEAM_MIN_LIGHT = 0.3
+# Damage panel rows holding at least two numbers
+DAMAGE_MIN_ROWS = 3
+
+
+def get_thumbnail(image: np.ndarray) -> np.ndarray:
+    """Downscale a BGR image to the thumbnail width."""
+    h, w = image.shape[:2]
+    size = (THUMBNAIL_WIDTH, max(1, round(THUMBNAIL_WIDTH * h / w)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def get_color_features(image: np.ndarray) -> dict[str, float]:
+    """Fractions of grey panel, brown map and light card pixels in the center of the thumbnail."""
+    thumbnail = get_thumbnail(image)
+    h, w = thumbnail.shape[:2]
+    x0, x1, y0, y1 = CENTER_BOUNDS
+    center = cv2.cvtColor(thumbnail[int(y0 * h):int(y1 * h), int(x0 * w):int(x1 * w)], cv2.COLOR_BGR2HSV)
+    hue, sat, val = center[..., 0], center[..., 1], center[..., 2]
+    
+    return {
+        'aspect': image.shape[1] / image.shape[0],
+        'grey': float(((sat < 40) & (val < 130)).mean()),
+        'brown': float(((hue < 25) & (sat > 50) & (val < 160)).mean()),
+        'light': float(((sat < 60) & (val > 200)).mean())
+    }
+
+
+def has_damage_panel(image: np.ndarray) -> bool:
+    """Whether the damage panel of a BGR screenshot holds a table of text rows."""
+    mask, _, _ = get_panel_mask(image)
+    rows = get_panel_rows(mask, image.shape[1])
+    return sum(len(get_words(mask[top:bottom])[0]) >= 2 for top, bottom in rows) >= DAMAGE_MIN_ROWS
+
+
+def classify_screenshot(image: np.ndarray) -> ScreenshotType:
+    """Guess which kind of game screenshot a BGR image is."""
+    if image is None or image.size == 0:
+        return ScreenshotType.UNKNOWN
+    
+    features = get_color_features(image)
+    if features['aspect'] >= TEAM_MIN_ASPECT:
+        return ScreenshotType.TEAM if features['light'] >= TEAM_MIN_LIGHT else ScreenshotType.UNKNOWN
+    if features['grey'] >= DAMAGE_MIN_GREY and has_damage_panel(image):
+        return ScreenshotType.DAMAGE
+    if features['brown'] >= FORMATION_MIN_BROWN:
+        return ScreenshotType.FORMATION
+    return ScreenshotType.UNKNOWN
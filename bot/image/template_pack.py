@@ -0,0 +1,311 @@
+"""
+Precompiled template pack for formation recognition.
+
+The PNG templates are compiled once into memory-mappable .npy files holding
+masked, zero-mean, unit-norm templates, so masked TM_CCOEFF_NORMED against
+every template is a single matrix-vector product.
+
+Builds and additions hold a lock on the pack folder, across processes where
+fcntl is available, and replace every file through a uniquely named
+temporary file. Templates learned at runtime are written to the template
+folder on local disk; on Heroku that disk is reset on every dyno restart,
+so a learned template only survives once its PNG is committed to
+assets/images/templates.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from bot.core.config import path_settings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CIRCLE_TEMPLATE_SIZE = (96, 96)
+TEMPLATE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+PACK_VERSION = 2
+
+INDEX_FILE = "index.json"
+TEMPLATES_FILE = "templates.npy"
+MEANS_FILE = "means.npy"
+NORMS_FILE = "norms.npy"
+LOCK_FILE = "pack.lock"
+
+_pack_lock = threading.Lock()
+
+
+def get_circle_mask(size: tuple[int, int]=CIRCLE_TEMPLATE_SIZE) -> np.ndarray:
+    """Boolean circular mask for (width, height) sized crops."""
+    w, h = size
+    mask = np.zeros((h, w), dtype=np.uint8)
+    center = (w // 2, h // 2)
+    cv2.circle(mask, center, min(center), 255, -1)
+    return mask > 0
+
+
+def normalize(images: np.ndarray, mask: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Masked zero-mean, unit-norm version of a (N, H, W, 3) stack.
+
+    Returns:
+        Tuple of (normalized stack, per-channel masked means, norms)
+    """
+    images = images.astype(np.float32)
+    means = images[:, mask].mean(axis=1)
+    centered = (images - means[:, None, None, :]) * mask[None, :, :, None]
+    norms = np.linalg.norm(centered.reshape(len(images), -1), axis=1)
+    return centered / np.maximum(norms, 1e-6)[:, None, None, None], means, norms
+
+
+def folder_checksum(folder: Path) -> str:
+    """Content checksum of every template file in the folder."""
+    digest = hashlib.sha256("v{}:{}x{}".format(PACK_VERSION, *CIRCLE_TEMPLATE_SIZE).encode())
+    for file_path in sorted(folder.iterdir()):
+        if file_path.suffix.lower() in TEMPLATE_EXTENSIONS:
+            digest.update(file_path.name.encode())
+            digest.update(file_path.read_bytes())
+    return digest.hexdigest()
+
+
+def template_hash(template: np.ndarray) -> str:
+    """Content hash of a template-size BGR image."""
+    return hashlib.sha256(np.ascontiguousarray(template).tobytes()).hexdigest()
+
+
+def to_template(input_img: np.ndarray) -> np.ndarray:
+    """Convert any decoded image to a BGR image at template size."""
+    if input_img.ndim == 2:
+        input_img = cv2.cvtColor(input_img, cv2.COLOR_GRAY2BGR)
+    elif input_img.shape[2] == 4:
+        input_img = cv2.cvtColor(input_img, cv2.COLOR_BGRA2BGR)
+    return cv2.resize(input_img, CIRCLE_TEMPLATE_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def load_template_image(file_path: Path) -> np.ndarray:
+    """Read one template as a BGR image at template size."""
+    input_img = cv2.imread(str(file_path), cv2.IMREAD_UNCHANGED)
+    if input_img is None:
+        raise ValueError("Could not read template: {}".format(file_path))
+    return to_template(input_img)
+
+
+@contextmanager
+def lock_pack(pack_dir: Path):
+    """Hold the pack folder exclusively against other threads and, with fcntl, other processes."""
+    pack_dir.mkdir(parents=True, exist_ok=True)
+    with _pack_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(pack_dir / LOCK_FILE, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def replace_file(path: Path, mode: str="wb"):
+    """Write to a uniquely named temporary file next to path and rename it over path once complete."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_pack(pack_dir: Path, templates: np.ndarray, means: np.ndarray, norms: np.ndarray,
+               files: list[str], hashes: list[str], checksum: str):
+    """Write the pack files, replacing any previous pack atomically file by file. Callers hold lock_pack."""
+    pack_dir.mkdir(parents=True, exist_ok=True)
+    for file_name, array in ((TEMPLATES_FILE, templates), (MEANS_FILE, means), (NORMS_FILE, norms)):
+        with replace_file(pack_dir / file_name) as f:
+            np.save(f, np.ascontiguousarray(array, dtype=np.float32))
+
+    # The index is written last, so a half-written pack never matches the checksum
+    index = {
+        'version': PACK_VERSION,
+        'checksum': checksum,
+        'size': list(CIRCLE_TEMPLATE_SIZE),
+        'files': files,
+        'hashes': hashes,
+        'labels': [Path(file_name).stem.split('_', 1)[0] for file_name in files]
+    }
+    with replace_file(pack_dir / INDEX_FILE, "w") as f:
+        json.dump(index, f)
+
+
+def build_template_pack(templates_folder: Path=None, pack_dir: Path=None, checksum: str=None):
+    """Compile the template folder into a pack."""
+    templates_folder = templates_folder or path_settings.templates_folder
+    pack_dir = pack_dir or path_settings.template_pack_folder
+    with lock_pack(pack_dir):
+        compile_pack(templates_folder, pack_dir, checksum or folder_checksum(templates_folder))
+
+
+def compile_pack(templates_folder: Path, pack_dir: Path, checksum: str):
+    """Compile the template folder into a pack. Callers hold lock_pack."""
+    files = sorted(file_path.name for file_path in templates_folder.iterdir()
+                   if file_path.suffix.lower() in TEMPLATE_EXTENSIONS)
+    images = np.stack([load_template_image(templates_folder / file_name) for file_name in files])
+    templates, means, norms = normalize(images, get_circle_mask())
+    hashes = [template_hash(image) for image in images]
+    write_pack(pack_dir, templates, means, norms, files, hashes, checksum)
+
+
+class TemplateBank:
+    """Read-only view of a template pack."""
+    def __init__(self, labels: list[str], files: list[str], hashes: list[str], templates: np.ndarray,
+                 means: np.ndarray, norms: np.ndarray, checksum: str):
+        """Wrap pack arrays; templates are (N, H, W, 3) masked zero-mean unit-norm float32."""
+        self.labels = tuple(labels)
+        self.files = tuple(files)
+        self.hashes = tuple(hashes)
+        self.hash_index = {digest: idx for idx, digest in enumerate(self.hashes)}
+        self.templates = templates
+        self.matrix = templates.reshape(len(templates), -1)
+        self.means = means
+        self.norms = norms
+        self.checksum = checksum
+        self.mask = get_circle_mask((templates.shape[2], templates.shape[1]))
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @classmethod
+    def load(cls, templates_folder: Path=None, pack_dir: Path=None) -> "TemplateBank":
+        """Memory-map the pack, rebuilding it first if the template folder changed."""
+        templates_folder = templates_folder or path_settings.templates_folder
+        pack_dir = pack_dir or path_settings.template_pack_folder
+
+        # Only one thread or worker builds a stale pack; the others wait and open it
+        with lock_pack(pack_dir):
+            checksum = folder_checksum(templates_folder)
+            index = None
+            index_path = pack_dir / INDEX_FILE
+            if index_path.exists():
+                with open(index_path, "r") as f:
+                    index = json.load(f)
+
+            if not index or index.get('checksum') != checksum:
+                compile_pack(templates_folder, pack_dir, checksum)
+
+            return cls.open(pack_dir)
+
+    @classmethod
+    def open(cls, pack_dir: Path) -> "TemplateBank":
+        """Memory-map an existing pack without checking it against the folder."""
+        with open(pack_dir / INDEX_FILE, "r") as f:
+            index = json.load(f)
+
+        return cls(
+            labels=index['labels'],
+            files=index['files'],
+            hashes=index['hashes'],
+            templates=np.load(pack_dir / TEMPLATES_FILE, mmap_mode='r'),
+            means=np.load(pack_dir / MEANS_FILE, mmap_mode='r'),
+            norms=np.load(pack_dir / NORMS_FILE, mmap_mode='r'),
+            checksum=index['checksum'])
+
+    def add(self, image: np.ndarray, label: str, templates_folder: Path=None, pack_dir: Path=None) -> "TemplateBank":
+        """
+        Add one labeled template without rebuilding the pack.
+        
+        The image is saved to the template folder and appended to the pack as
+        it is on disk, which includes templates other workers learned since
+        this bank was opened.
+        
+        Returns:
+            New bank including the template, or this bank if the template is already known
+        """
+        templates_folder = templates_folder or path_settings.templates_folder
+        pack_dir = pack_dir or path_settings.template_pack_folder
+
+        template = to_template(image)
+        digest = template_hash(template)
+        if digest in self.hash_index:
+            return self
+
+        with lock_pack(pack_dir):
+            bank = TemplateBank.open(pack_dir)
+            if digest in bank.hash_index:
+                return bank
+
+            file_name = "{}_{}.png".format(label, digest[:8])
+            if not cv2.imwrite(str(templates_folder / file_name), template):
+                raise ValueError("Could not write template: {}".format(file_name))
+
+            normalized, means, norms = normalize(template[None], bank.mask)
+            write_pack(
+                pack_dir,
+                np.concatenate([bank.templates, normalized]),
+                np.concatenate([bank.means, means]),
+                np.concatenate([bank.norms, norms]),
+                list(bank.files) + [file_name],
+                list(bank.hashes) + [digest],
+                folder_checksum(templates_folder))
+            return TemplateBank.open(pack_dir)
+
+    def prepare(self, circle: np.ndarray) -> np.ndarray:
+        """Resize a BGR circle crop and normalize it like the templates."""
+        if circle.shape[2] == 4:
+            circle = cv2.cvtColor(circle, cv2.COLOR_BGRA2BGR)
+        resized = cv2.resize(circle, CIRCLE_TEMPLATE_SIZE, interpolation=cv2.INTER_AREA)
+        normalized, _, _ = normalize(resized[None], self.mask)
+        return normalized[0]
+
+    def scores(self, circle: np.ndarray) -> np.ndarray:
+        """Masked TM_CCOEFF_NORMED of a circle crop against every template."""
+        return self.matrix @ self.prepare(circle).ravel()
+
+    def match(self, circle: np.ndarray) -> tuple[str, float]:
+        """Best matching label and its score."""
+        scores = self.scores(circle)
+        best = int(np.argmax(scores))
+        return self.labels[best], float(scores[best])
+
+
+_bank: TemplateBank = None
+_bank_lock = threading.RLock()
+
+def get_template_bank() -> TemplateBank:
+    """Template bank shared by every analyzer in this process."""
+    global _bank
+    if _bank is None:
+        with _bank_lock:
+            if _bank is None:
+                _bank = TemplateBank.load()
+    return _bank
+
+
+def learn_template(image: np.ndarray, label: str) -> bool:
+    """
+    Teach the shared bank a new template. Returns False if it was already known.
+    
+    The template lives on local disk only; see the module docstring for
+    keeping it across Heroku dyno restarts.
+    """
+    global _bank
+    with _bank_lock:
+        bank = get_template_bank()
+        _bank = bank.add(image, label)
+        return _bank is not bank
+
+
+if __name__ == "__main__":
+    # Build step: python -m bot.image.template_pack
+    build_template_pack()
+    print("Template pack written to {}".format(path_settings.template_pack_folder))
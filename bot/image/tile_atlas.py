@@ -0,0 +1,356 @@
+"""
+Pre-scaled tile atlas for the formation renderers.
+
+Every hex tile, the icon and Yap are scaled once to their drawing size and
+packed into one RGBA image with a JSON index of their rectangles. The image
+is stored as a raw .npy array, so a fresh process memory-maps a single file
+instead of decoding and scaling every tile, and worker processes share its
+pages. The atlas is rebuilt only when the assets change.
+
+Sprites are sliced out lazily into a bounded cache on first use. Lookups are
+counted and persisted, so a new process can prewarm the most popular tiles
+in the background before the first render.
+
+The bot and its render workers may all find the atlas stale at once, so
+builds hold the same folder lock as the template pack and replace every file
+through a uniquely named temporary file.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import Counter
+from collections.abc import Callable, Iterator, Mapping
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from cachetools import LRUCache
+from PIL import Image
+
+from bot.core.config import data_settings, path_settings
+from bot.image.hex import Hex
+from bot.image.template_pack import lock_pack, replace_file
+
+TILE_SIZE = (int(Hex.HALF_PNG_WIDTH * 2), Hex.HALF_PNG_HEIGHT * 2)
+ICON_SIZE = (int(Hex.HALF_PNG_WIDTH), int(Hex.HALF_PNG_WIDTH))
+ATLAS_VERSION = 2
+# A single column keeps every sprite contiguous in the file, so a lazy
+# lookup only pages in the bytes of that sprite
+ATLAS_COLUMNS = 1
+TILE_CACHE_SIZE = 64
+PREWARM_TILES = 32
+USAGE_SAVE_INTERVAL = 500
+
+INDEX_FILE = "index.json"
+ATLAS_FILE = "atlas.npy"
+USAGE_FILE = "usage.json"
+
+logger = logging.getLogger()
+
+
+def get_tile_paths(hexes_folder: Path=None) -> dict[str, Path]:
+    """Asset path of every hex named in the hex categories, in category order."""
+    hexes_folder = hexes_folder or path_settings.hexes_folder
+    return {name: hexes_folder / faction / f"{name}.png"
+            for factions in data_settings.hex_categories.values()
+            for faction, names in factions.items()
+            for name in names}
+
+
+@lru_cache(maxsize=None)
+def get_shrink_plan(source_length: int, length: int) -> tuple[np.ndarray, ...]:
+    """
+    Replay pygame's 16.16 fixed-point shrink filter for one axis length.
+
+    Every source pixel either adds fully to the current output pixel or ends
+    it, split by weight between that output pixel and the next.
+
+    Returns:
+        Tuple of (end index, end weight, carried weight, reciprocal) arrays per output pixel
+    """
+    space = 0x10000 * source_length // length
+    counter = space
+    ends, end_weights, carry_weights = [], [], [0]
+    for i in range(source_length):
+        if counter > 0x10000:
+            counter -= 0x10000
+        else:
+            frac = 0x10000 - counter
+            ends.append(i)
+            end_weights.append(counter)
+            carry_weights.append(frac)
+            counter = space - frac
+    ends, end_weights, carry_weights = ends[:length], end_weights[:length], carry_weights[:length]
+    return (np.array(ends), np.array(end_weights, dtype=np.int32), np.array(carry_weights, dtype=np.int32),
+            0x100000000 // space)
+
+
+def shrink_axis(image: np.ndarray, length: int, axis: int) -> np.ndarray:
+    """
+    Shrink one int32 axis with pygame's smoothscale filter.
+
+    Sums, partial weights and truncations follow pygame's integer
+    arithmetic, so results are bit-identical.
+    """
+    source_length = image.shape[axis]
+    if source_length == length:
+        return image
+    if source_length < length:
+        raise ValueError("Only shrinking is supported: {} -> {}".format(source_length, length))
+
+    image = np.moveaxis(image, axis, 0)
+    if source_length == 2 * length:
+        # Exact halving, where the filter reduces to a truncated pair average
+        return np.moveaxis((image[0::2] + image[1::2]) >> 1, 0, axis)
+
+    ends, end_weights, carry_weights, recip = get_shrink_plan(source_length, length)
+    weights = (slice(None),) + (None,) * (image.ndim - 1)
+
+    # Whole pixels between the previous end and this one, from a running sum
+    cumulative = np.concatenate([np.zeros_like(image[:1]), np.cumsum(image, axis=0, dtype=np.int32)])
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    whole = cumulative[ends] - cumulative[starts]
+
+    end_part = (image[ends] * end_weights[weights]) >> 16
+    previous = np.concatenate([[0], ends[:-1]])
+    carry_part = (image[previous] * carry_weights[weights]) >> 16
+    return np.moveaxis(((whole + end_part + carry_part) * recip) >> 16, 0, axis)
+
+
+def smoothscale(image: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+    """Shrink a (H, W, C) uint8 image to (width, height) like pygame.transform.smoothscale."""
+    scaled = shrink_axis(image.astype(np.int32), size[0], 1)
+    return shrink_axis(scaled, size[1], 0).astype(np.uint8)
+
+
+def load_rgba(file_path: Path, size: tuple[int, int]) -> np.ndarray:
+    """Read an image as a (H, W, 4) RGBA array scaled to (width, height)."""
+    with Image.open(file_path) as img:
+        return smoothscale(np.asarray(img.convert("RGBA")), size)
+
+
+def asset_checksum(hexes_folder: Path=None) -> str:
+    """Content checksum of every tile, the icon, Yap and the scaled sizes."""
+    digest = hashlib.sha256("v{}:{}x{}:{}x{}".format(ATLAS_VERSION, *TILE_SIZE, *ICON_SIZE).encode())
+    paths = dict(get_tile_paths(hexes_folder), icon=path_settings.icon_path, yap=path_settings.yap_path)
+    for name, file_path in paths.items():
+        digest.update(name.encode() + b"\0")
+        if file_path.exists():
+            digest.update(file_path.read_bytes())
+    return digest.hexdigest()
+
+
+def build_tile_atlas(hexes_folder: Path=None, atlas_dir: Path=None, checksum: str=None):
+    """Scale every asset and write the atlas, replacing any previous atlas file by file."""
+    atlas_dir = atlas_dir or path_settings.tile_atlas_folder
+    with lock_pack(atlas_dir):
+        compile_tile_atlas(hexes_folder, atlas_dir, checksum or asset_checksum(hexes_folder))
+
+
+def compile_tile_atlas(hexes_folder: Path, atlas_dir: Path, checksum: str):
+    """Scale every asset and write the atlas. Callers hold lock_pack."""
+    sprites, missing = {}, []
+    for name, file_path in get_tile_paths(hexes_folder).items():
+        if file_path.exists():
+            sprites[name] = load_rgba(file_path, TILE_SIZE)
+        else:
+            missing.append(name)
+    if missing:
+        # Reported once per asset change; the index keeps the list
+        logger.warning("Tile assets do not exist: {}".format(", ".join(missing)))
+    icon = load_rgba(path_settings.icon_path, ICON_SIZE)
+    yap = load_rgba(path_settings.yap_path, TILE_SIZE)
+
+    # One tile-size cell per sprite, tiles first
+    cells = list(sprites.items()) + [("icon", icon), ("yap", yap)]
+    w, h = TILE_SIZE
+    rows = -(-len(cells) // ATLAS_COLUMNS)
+    pixels = np.zeros((rows * h, ATLAS_COLUMNS * w, 4), dtype=np.uint8)
+    rects = {}
+    for i, (name, sprite) in enumerate(cells):
+        x, y = i % ATLAS_COLUMNS * w, i // ATLAS_COLUMNS * h
+        pixels[y:y + sprite.shape[0], x:x + sprite.shape[1]] = sprite
+        rects[name] = [x, y, sprite.shape[1], sprite.shape[0]]
+
+    atlas_dir.mkdir(parents=True, exist_ok=True)
+    with replace_file(atlas_dir / ATLAS_FILE) as f:
+        np.save(f, pixels)
+
+    # The index is written last, so a half-written atlas never matches the checksum
+    index = {
+        'version': ATLAS_VERSION,
+        'checksum': checksum,
+        'tiles': {name: rects[name] for name in sprites},
+        'icon': rects["icon"],
+        'yap': rects["yap"],
+        'missing': missing
+    }
+    with replace_file(atlas_dir / INDEX_FILE, "w") as f:
+        json.dump(index, f)
+
+
+class TileCache(Mapping):
+    """Bounded, lazily filled mapping of tile name to a renderer image."""
+    def __init__(self, atlas: "TileAtlas", load: Callable[[list[int]], object], maxsize: int=TILE_CACHE_SIZE):
+        """
+        Initialize an empty cache over an atlas.
+
+        Args:
+            atlas: Atlas holding the tile rectangles
+            load: Creates the renderer image for an [x, y, width, height] rectangle
+            maxsize: Number of tile images kept
+        """
+        self.atlas = atlas
+        self.load = load
+        self.entries = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name: str):
+        """Tile image, counting the lookup; KeyError for tiles without an asset."""
+        image = self.get_image(name)
+        self.atlas.record(name)
+        return image
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.atlas.rects
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.atlas.rects)
+
+    def __len__(self) -> int:
+        return len(self.atlas.rects)
+
+    def get_image(self, name: str):
+        """Tile image from the cache, or sliced out of the atlas."""
+        with self.lock:
+            image = self.entries.get(name)
+        if image is not None:
+            return image
+
+        if name not in self.atlas.rects:
+            self.atlas.report_missing(name)
+            raise KeyError(name)
+        image = self.load(self.atlas.rects[name])
+        with self.lock:
+            self.entries[name] = image
+        return image
+
+    def prewarm(self, names: list[str]):
+        """Load tiles and page in their pixels without counting them as used."""
+        for name in names:
+            if name in self:
+                self.get_image(name)
+                self.atlas.view(self.atlas.rects[name]).max()
+
+
+class TileAtlas:
+    """Read-only atlas with lazily sliced RGBA views of every sprite."""
+    def __init__(self, pixels: np.ndarray, index: dict, atlas_dir: Path=None):
+        """Wrap the (H, W, 4) atlas pixels and load persisted usage counts from atlas_dir."""
+        self.pixels = pixels
+        self.checksum = index['checksum']
+        self.missing = tuple(index['missing'])
+        self.rects = index['tiles']
+        self.icon_rect = index['icon']
+        self.yap_rect = index['yap']
+        self.tiles = TileCache(self, self.view)
+        self.icon = self.view(self.icon_rect)
+        self.yap = self.view(self.yap_rect)
+
+        self.usage_path = atlas_dir / USAGE_FILE if atlas_dir else None
+        self.usage = Counter(self.load_usage())
+        self.unsaved = 0
+        self.reported = set()
+        self.lock = threading.Lock()
+
+    def view(self, rect: list[int]) -> np.ndarray:
+        """Sprite at an [x, y, width, height] rectangle, sharing the atlas memory."""
+        x, y, w, h = rect
+        return self.pixels[y:y + h, x:x + w]
+
+    def report_missing(self, name: str):
+        """Log a lookup of a tile without an asset, once per name."""
+        with self.lock:
+            if name in self.reported:
+                return
+            self.reported.add(name)
+        logger.warning("Tile {} has no asset{}".format(name, " (missing file)" if name in self.missing else ""))
+
+    def load_usage(self) -> dict[str, int]:
+        """Persisted lookup counts, empty if there are none."""
+        if self.usage_path is None:
+            return {}
+        try:
+            with open(self.usage_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, name: str):
+        """Count a tile lookup, persisting the counts every USAGE_SAVE_INTERVAL lookups."""
+        with self.lock:
+            self.usage[name] += 1
+            self.unsaved += 1
+            if self.unsaved < USAGE_SAVE_INTERVAL:
+                return
+            self.unsaved = 0
+            counts = dict(self.usage)
+        self.save_usage(counts)
+
+    def save_usage(self, counts: dict[str, int]=None):
+        """Write lookup counts next to the atlas."""
+        if self.usage_path is None:
+            return
+        if counts is None:
+            with self.lock:
+                counts = dict(self.usage)
+        try:
+            with replace_file(self.usage_path, "w") as f:
+                json.dump(counts, f)
+        except OSError as e:
+            logger.warning("Could not save tile usage: {}".format(e))
+
+    def most_used(self, limit: int=PREWARM_TILES) -> list[str]:
+        """Names of the most looked up tiles that have an asset."""
+        with self.lock:
+            ranked = self.usage.most_common()
+        return [name for name, _ in ranked if name in self.rects][:limit]
+
+    @classmethod
+    def load(cls, hexes_folder: Path=None, atlas_dir: Path=None) -> "TileAtlas":
+        """Memory-map the atlas, rebuilding it first if the assets changed."""
+        atlas_dir = atlas_dir or path_settings.tile_atlas_folder
+
+        # Only one thread or worker builds a stale atlas; the others wait and open it
+        with lock_pack(atlas_dir):
+            checksum = asset_checksum(hexes_folder)
+            index = None
+            index_path = atlas_dir / INDEX_FILE
+            if index_path.exists():
+                with open(index_path, "r") as f:
+                    index = json.load(f)
+
+            if not index or index.get('checksum') != checksum:
+                compile_tile_atlas(hexes_folder, atlas_dir, checksum)
+
+            return cls.open(atlas_dir)
+
+    @classmethod
+    def open(cls, atlas_dir: Path) -> "TileAtlas":
+        """Memory-map an existing atlas without checking it against the assets."""
+        with open(atlas_dir / INDEX_FILE, "r") as f:
+            index = json.load(f)
+        return cls(np.load(atlas_dir / ATLAS_FILE, mmap_mode='r'), index, atlas_dir)
+
+
+@lru_cache(maxsize=None)
+def get_tile_atlas() -> TileAtlas:
+    """Tile atlas shared by every renderer in this process."""
+    return TileAtlas.load()
+
+
+if __name__ == "__main__":
+    # Build step: python -m bot.image.tile_atlas
+    build_tile_atlas()
+    print("Tile atlas written to {}".format(path_settings.tile_atlas_folder))
@@ -1,33 +1,92 @@
 """Service for generating formation images."""
+from concurrent.futures import Executor
+
 from bot.database.users import Users
-from bot.image.image_maker import Image_Maker
+from bot.image.image_encoder import (get_context_encoder, get_extension,
+                                     get_output_context)
+from bot.image.image_maker import (FormationSpec, Image_Maker,
+                                   render_formation, render_formations)
+from bot.image.render_pool import RenderPool
 from bot.services.image_service import ImageService
 
 
 class FormationImageService:
     """Service for generating formation images."""
-    def __init__(self, users: Users, image_service: ImageService = None):
-        """Initialize formation image service."""
+    def __init__(self, users: Users, image_service: ImageService = None, render_pool: RenderPool = None):
+        """Initialize formation image service, rendering off the event loop when given a worker pool."""
         self.users = users
         self.image_service = image_service or ImageService(users.db)
+        self.render_pool = render_pool
     
-    def generate_formation_image(self, user_id: int, is_private: bool = True) -> str:
-        """Generate and return formation image filename."""
-        self.users.initialize_user(user_id)
-        settings = self.users.get_settings(user_id)
-        base_hexes = self.users.get_base_hexes(user_id)
-        
-        arena = self.users.get_map(user_id)
-        name = self.users.get_name(user_id)
-        
-        units = self.users.get_units(user_id)
-        artifacts = self.users.get_artifacts(user_id)
-        
+    def get_talent(self) -> bool:
+        """Whether talent outlines are drawn, a global toggle stored with the image links."""
         talent_obj = self.image_service.get_image_link("talents")
-        talent = "True" == talent_obj.get('text', '')
+        return "True" == talent_obj.get('text', '')
+    
+    def get_formation_spec(self, user_id: int, is_private: bool = True) -> FormationSpec:
+        """Current formation of a user with their settings and hexes."""
+        self.users.initialize_user(user_id)
+        return FormationSpec(
+            title=self.users.get_name(user_id),
+            units=dict(self.users.get_units(user_id)),
+            artifacts=dict(self.users.get_artifacts(user_id)),
+            arena=self.users.get_map(user_id),
+            base_hexes=tuple(self.users.get_base_hexes(user_id)),
+            settings=dict(self.users.get_settings(user_id)),
+            is_private=is_private,
+            talent=self.get_talent())
+    
+    def generate_formation_image(self, user_id: int, is_private: bool = True, context: str = None) -> str:
+        """Generate and return formation image filename, encoded for the output context or its visibility."""
+        context = context or get_output_context(is_private)
+        spec = self.get_formation_spec(user_id, is_private)
+        with Image_Maker(user_id, spec.base_hexes, spec.settings, spec.arena, spec.is_private, 3 in spec.artifacts,
+                         spec.talent) as img_maker:
+            file_name = img_maker.generate_image(spec.title, spec.units, spec.artifacts, get_context_encoder(context))
         
-        with Image_Maker(user_id, base_hexes, settings, arena, is_private, 3 in artifacts, talent) as img_maker:
-            file_name = img_maker.generate_image(name, units, artifacts)
+        return file_name
+    
+    async def render_formation_image(self, user_id: int, is_private: bool = True, context: str = None) -> str:
+        """Generate formation image on the worker pool and return its filename, or in process without a pool."""
+        context = context or get_output_context(is_private)
+        if self.render_pool is None:
+            return self.generate_formation_image(user_id, is_private, context)
         
+        spec = self.get_formation_spec(user_id, is_private)
+        data = await self.render_pool.render(spec, get_context_encoder(context), user_id)
+        file_name = '{}.{}'.format(user_id, get_extension(data))
+        with open(file_name, "wb") as f:
+            f.write(data)
         return file_name
 
+    def render_many(self, specs: list[FormationSpec], executor: Executor = None,
+                    context: str = "submission") -> list[bytes]:
+        """
+        Render several formations to image bytes for the output context, in the order given.
+
+        All of them share one render context and its fonts and base layers,
+        or are spread over the executor's workers when one is given.
+        """
+        return render_formations(specs, executor=executor, encoder=get_context_encoder(context))
+
+    async def render_formation_images(self, specs: list[FormationSpec], context: str = "submission") -> list[bytes]:
+        """Render several formations to image bytes on the worker pool, or with render_many without a pool."""
+        if self.render_pool is None:
+            return self.render_many(specs, context=context)
+        return await self.render_pool.render_many(specs, get_context_encoder(context))
+
+    def get_units_spec(self, units: dict[int, str], arena: str, base_hexes: list[str], settings: dict[str, bool],
+                       title: str = "") -> FormationSpec:
+        """
+        Formation of units by tile number, independent of any user record.
+
+        Tile numbers are hidden, as on every public formation image.
+        """
+        return FormationSpec(title, dict(units), {}, arena, tuple(base_hexes), {**settings, 'show_numbers': False},
+                             is_private=False, talent=self.get_talent())
+
+    def render_units(self, units: dict[int, str], arena: str, base_hexes: list[str], settings: dict[str, bool],
+                     title: str = "", context: str = "submission") -> bytes:
+        """Render units by tile number to image bytes without reading or writing a user record."""
+        spec = self.get_units_spec(units, arena, base_hexes, settings, title)
+        return render_formation(spec, encoder=get_context_encoder(context))
@@ -0,0 +1,55 @@
+"""Service for coalescing rapid formation renders per user."""
+import asyncio
+import inspect
+import itertools
+from typing import Awaitable, Callable
+
+# Seconds an edit waits for a newer edit from the same user before rendering
+COALESCE_WINDOW = 0.75
+
+
+class RenderCoalescer:
+    """
+    Debounces formation renders so only the latest state of a user is rendered.
+
+    Edits are applied by the caller before requesting a render. A request waits
+    for the window and is superseded, returning None, when a newer request for
+    the same user arrives in the meantime or while it renders.
+
+    Generations come from one counter that never repeats, so a render that
+    outlives the entry of its user still sees any later edit as newer.
+    """
+    def __init__(self, render: Callable[[int], str | Awaitable[str]], window: float = COALESCE_WINDOW):
+        """Initialize coalescer with a render function of user ID to image filename."""
+        self.render = render
+        self.window = window
+        self.counter = itertools.count(1)
+        self.generations: dict[int, int] = {}
+        self.rendered = 0
+        self.superseded = 0
+
+    def is_latest(self, user_id: int, generation: int) -> bool:
+        """Whether no newer request for the user arrived."""
+        return self.generations.get(user_id) == generation
+
+    async def request(self, user_id: int) -> str | None:
+        """Render the user's formation once the window passes, or None if a newer edit superseded it."""
+        generation = next(self.counter)
+        self.generations[user_id] = generation
+        await asyncio.sleep(self.window)
+
+        if not self.is_latest(user_id, generation):
+            self.superseded += 1
+            return None
+
+        filename = self.render(user_id)
+        if inspect.isawaitable(filename):
+            filename = await filename
+        self.rendered += 1
+
+        # A newer edit that arrived during the render brings its own image
+        if not self.is_latest(user_id, generation):
+            self.superseded += 1
+            return None
+        del self.generations[user_id]
+        return filename
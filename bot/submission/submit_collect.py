@@ -4,14 +4,19 @@ from pathlib import Path
 
 import discord
 
-from bot.core.commands_backend import Commands_Backend
-from bot.core.config import app_settings
-from bot.core.enum_classes import BossType, ChannelType
+from bot.core.commands_backend import Commands_Backend, valid_index
+from bot.core.config import app_settings, data_settings, path_settings
+from bot.core.enum_classes import BossType, ChannelType, ScreenshotType
 from bot.core.utils import (get_or_fetch_channel, get_or_fetch_member,
                             get_or_fetch_server, to_bot_id, to_channel_name,
-                            to_channel_type_id)
-from bot.image.analyze_image import Analyze_Image
+                            to_channel_type_id, translate_name)
+from bot.image.analyze_image import (FormationResult, analyze_formation,
+                                     encode_png, make_contact_sheet)
 from bot.image.damage_extractor import DamageExtractor
+from bot.image.frame import DecodedFrame
+from bot.image.image_encoder import get_extension
+from bot.image.image_maker import FormationSpec
+from bot.image.screenshot_router import classify_screenshot
 from bot.services.counter_service import CounterService
 from bot.submission.google_sheets import add_row
 from bot.ui.embeds import make_embeds
@@ -22,12 +27,12 @@ class Submit_Collect:
     """Handle formation submission and collection from Discord messages."""
     def __init__(self, bot: discord.Client, backend: Commands_Backend, forwarder: discord.Member, channel_id: int, 
                 orig_msg: discord.Message=None, attachments: list[discord.Attachment]=None, content: str=None,
-                counter_service: CounterService = None, boss_type: BossType=BossType.DREAM_REALM):
+                counter_service: CounterService = None, boss_type: BossType=BossType.DREAM_REALM,
+                log_contact_sheet: bool=None):
         """Initialize submission collector with bot, backend, and message context."""
         self.bot = bot
         self.backend = backend
-        self.analyzer = Analyze_Image()
-        self.damage_extractor = DamageExtractor(languages='eng')
+        self.damage_extractor = DamageExtractor(languages='eng', cache_dir=path_settings.ocr_cache_folder)
         self.counter_service = counter_service or CounterService(backend.users.db)
         
         self.forwarder: discord.Member = forwarder
@@ -35,6 +40,7 @@ class Submit_Collect:
         self.bot_id: int = to_bot_id(channel_id, boss_type)
         
         self.boss_type = boss_type
+        self.log_contact_sheet = app_settings.log_contact_sheet if log_contact_sheet is None else log_contact_sheet
         
         self.content = content
         self.form = False
@@ -129,7 +135,7 @@ class Submit_Collect:
         for i, (units, img_bytes) in enumerate(formations):
             buffer = io.BytesIO(img_bytes)
             buffer.seek(0)
-            files.append(discord.File(fp=buffer, filename="formation_{}.png".format(i)))
+            files.append(discord.File(fp=buffer, filename="formation_{}.{}".format(i, get_extension(img_bytes))))
             
         return files
     
@@ -291,63 +297,82 @@ class Submit_Collect:
         """Process all attachments or specific index to extract formations."""
         if index != -1:
             index = min(max(index - 1, 0), len(self.attachments) - 1)
-            formation = await self.__process_attachment(self.attachments[index])
-            return [formation] if formation else []
+            attachments = [self.attachments[index]]
+        else:
+            attachments = self.attachments
         
         #tasks = [self.__process_attachment(attachment) for attachment in self.attachments]
         #formations = await gather(*tasks)
         
-        formations = []
-        for attachment in self.attachments:
+        recognized = []
+        for attachment in attachments:
             formation = await self.__process_attachment(attachment)
             if formation:
-                formations.append(formation)
-            
-        return formations
+                recognized.append(formation)
+        if not recognized:
+            return []
+        
+        # Every formation of the message is rendered in one batch, off the event loop when there is a worker pool
+        images = await self.backend.image_service.render_formation_images([spec for _, spec in recognized])
+        return [(units, img_bytes) for (units, _), img_bytes in zip(recognized, images)]
     
     async def __process_attachment(self, attachment: discord.Attachment) -> tuple:
-        """Extract formation data from single attachment using image analyzer."""
+        """Extract formation units and the formation to render from single attachment using image analyzer."""
         if not attachment.content_type or 'image' not in attachment.content_type:
             return None
         
-        image_bytes = await attachment.read()
+        # Decode once; routing, OCR and analysis share the frame
+        frame = DecodedFrame.from_bytes(await attachment.read())
+        if frame is None:
+            return None
         
-        try:
-            damage_value = self.damage_extractor.extract_largest_damage(image_bytes)
-            if damage_value is not None and (self.extracted_damage is None or damage_value > self.extracted_damage):
-                self.extracted_damage = damage_value
-        except Exception as e:
-            print(f"Damage extraction failed: {e}")
+        # Only run the pipelines that apply to this kind of screenshot
+        screenshot_type = classify_screenshot(frame.bgr)
         
-        # Extract formation units
-        units = self.analyzer.process_image(image_bytes)
-        units = [unit for unit in units if unit is not None]
+        if screenshot_type.has_damage:
+            try:
+                damage_value = self.damage_extractor.extract_largest_damage(frame, screenshot_type)
+                if damage_value is not None and (self.extracted_damage is None or damage_value > self.extracted_damage):
+                    self.extracted_damage = damage_value
+            except Exception as e:
+                print(f"Damage extraction failed: {e}")
         
-        if not units or len(units) < 3:
+        if not screenshot_type.has_formation:
             return None
         
-        yapbuilder_filename = await self.__draw_formation(units)
+        # Extract formation units, using the channel's map to break layout ties
+        self.backend.initialize_user(self.bot_id)
+        channel_arena = self.backend.users.get_map(self.bot_id)
+        result = analyze_formation(frame, channel_arena)
+        units = list(result.units)
         
-        image_bytes = None
-        with open(yapbuilder_filename, "rb") as f:
-            img_bytes = f.read()
-            
-        return (units, img_bytes)
+        if not units or len(units) < 3:
+            return None
+        
+        return (units, self.__get_formation_spec(result, channel_arena))
         
-    async def __draw_formation(self, units: list) -> str:
-        """Generate formation image using backend."""
-        pairs = ["{} {}".format(unit['name'], unit['number']) for unit in units]
+    def __get_formation_spec(self, result: FormationResult, channel_arena: str) -> FormationSpec:
+        """
+        Recognized units over the channel's hexes and settings, without writing to its record.
+
+        Tile numbers belong to the layout the analysis detected, so that arena is
+        drawn; the channel's map is only used when no layout was detected.
+        """
+        arena = result.arena or channel_arena
+        tiles = {}
+        for unit in result.units:
+            name = translate_name(unit['name'])
+            if name in data_settings.units and valid_index(unit['number']):
+                tiles[unit['number']] = name
         chan_name = to_channel_name(self.channel_id)
-        if chan_name is not None and "Nocturne Judicator" in chan_name:
-            pairs.append("Hunter 13")
-        pairs = ' '.join(pairs)
-            
-        self.backend.set_settings(user_id=self.bot_id, key='show_numbers', value=False)
-        self.backend.clear_user(user_id=self.bot_id)
-        self.backend.add_list(user_id=self.bot_id, pairs=pairs)
+        # The Hunter stands on tile 13, which only the Arena I layout has
+        has_hunter_tile = len(data_settings.maps[arena]['Tiles']) >= 13
+        if chan_name is not None and "Nocturne Judicator" in chan_name and has_hunter_tile:
+            tiles[13] = translate_name("Hunter")
 
-        filename = self.backend.show_image(user_id=self.bot_id, is_private=False)
-        return filename
+        users = self.backend.users
+        return self.backend.image_service.get_units_spec(
+            tiles, arena, users.get_base_hexes(self.bot_id), users.get_settings(self.bot_id), users.get_name(self.bot_id))
     
     async def __get_or_fetch_channel(self, channel_id: int) -> discord.abc.GuildChannel | discord.Thread | None:
         """Get or fetch Discord channel by ID."""
@@ -365,16 +390,25 @@ class Submit_Collect:
         if img_bytes:
             buffer = io.BytesIO(img_bytes)
             buffer.seek(0)
-            files.append(discord.File(fp=buffer, filename="formation.png"))
+            files.append(discord.File(fp=buffer, filename="formation.{}".format(get_extension(img_bytes))))
         #if image_bytes_stream:
         #    files.append(discord.File(fp=image_bytes_stream, filename="src_image.png"))
         
+        # Circle crops are only encoded here, once the log is actually sent
         names = []
         for dictionary in units:
             filename = "{}_{}.png".format(dictionary['name'], dictionary['number'])
             names.append(filename)
-            if dictionary['image']:
-                files.append(discord.File(fp=dictionary['image'], filename=filename))
+            if self.log_contact_sheet:
+                continue
+            byte_stream = encode_png(dictionary['image'])
+            if byte_stream:
+                files.append(discord.File(fp=byte_stream, filename=filename))
+        
+        if self.log_contact_sheet:
+            byte_stream = encode_png(make_contact_sheet(units))
+            if byte_stream:
+                files.append(discord.File(fp=byte_stream, filename="circles.png"))
 
         if not names:
             return await spam_chan.send("No characters processed", files=files[:10])
@@ -181,6 +181,8 @@ async def _process_report(interaction: discord.Interaction, message: discord.Mes
                     submission_id = embed.footer.text.split('ID:')[1].split('|')[0].strip()
                     report_text += f"**Submission ID:** {submission_id}\n"
 
+        report_text += "Reply to the logged crops with `!learn <name> <tile>` to add the correct template.\n"
+
         msg = await spam_channel.send(f"<@{app_settings.amaryllis_id}>")
         await msg.edit(content=report_text)
         
@@ -4,10 +4,12 @@ Main entry point for the Discord Bot Yaphalla-Roberto
 """
 import logging
 
-from bot.core.bot import bot
 from bot.core.config import app_settings
 
 if __name__ == "__main__":
+    # Imported here so that spawned render workers do not build the bot
+    from bot.core.bot import bot
+
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
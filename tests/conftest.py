@@ -0,0 +1,33 @@
+"""
+Shared test setup.
+
+Settings are read at import, so the required secrets get placeholders
+before any bot module is imported; nothing here talks to Discord or Mongo.
+"""
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost")
+os.environ.setdefault("GOOGLE_SA_JSON", "{}")
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="session")
+def sample_bytes():
+    """Read a sample screenshot from the project root by name."""
+    def read(name: str) -> bytes:
+        return (ROOT / name).read_bytes()
+    return read
+
+
+@pytest.fixture(scope="session")
+def ground_truth() -> dict[str, dict]:
+    """Benchmark ground truth entries by file name."""
+    with open(ROOT / "benchmarks" / "ground_truth.json", "r") as f:
+        return {entry['file']: entry for entry in json.load(f)['samples']}
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+import pytest
+
+from bot.image.analyze_image import (LAYOUT_BOUNDARIES, SLOT_DIAMETER,
+                                     FormationAnalysis, analyze_formation,
+                                     fit_hex_transform, get_layouts)
+from bot.image.hex import Hex
+from bot.image.recognition_engines import NCCEngine
+from bot.image.template_pack import get_template_bank
+
+FORMATIONS = ["Sample_Formation.png", "benchmarks/Sample_Ravaged_Realm.png", "benchmarks/Sample_Thalassa.png"]
+
+
+def get_tiles(result) -> dict[str, str]:
+    return {str(unit['number']): unit['name'] for unit in result.units}
+
+
+@pytest.mark.parametrize("q, r", [(0, 0), (2, -1), (-3, 4), (5, 5)])
+def test_hex_pixel_round_trip(q, r):
+    assert Hex.round_qr(*Hex.xy_to_qr(*Hex.qr_to_exact_xy(q, r))) == (q, r)
+
+
+@pytest.mark.parametrize("q, r, expected", [
+    (0.2, -0.3, (0, 0)),
+    (1.4, 0.1, (1, 0)),
+    # Rounding each axis alone gives (0, 0), which is not the nearest hex
+    (0.45, 0.2, (1, 0)),
+    (-0.2, -0.45, (0, -1)),
+])
+def test_cube_rounding(q, r, expected):
+    assert Hex.round_qr(q, r) == expected
+
+
+def test_transform_fits_measured_slots():
+    transform = fit_hex_transform()
+    for arena, bounds in LAYOUT_BOUNDARIES.items():
+        layout = get_layouts()[arena]
+        for tile, (x, y) in enumerate(layout.centers, 1):
+            x1, x2, y1, y2 = bounds[tile]
+            assert abs(x - (x1 + x2) / 2) < SLOT_DIAMETER / 4
+            assert abs(y - (y1 + y2) / 2) < SLOT_DIAMETER / 4
+    assert transform.shape == (3, 2)
+
+
+@pytest.mark.parametrize("arena", list(get_layouts()))
+def test_layout_locates_its_centers(arena):
+    layout = get_layouts()[arena]
+    for tile, (x, y) in enumerate(layout.centers, 1):
+        assert layout.locate(x, y) == (tile, 1.0)
+        # Half a radius off the center is still the tile, with half the confidence
+        located, confidence = layout.locate(x + SLOT_DIAMETER / 4, y)
+        assert located == tile
+        assert confidence == pytest.approx(0.5)
+    assert layout.locate(-1.0, -1.0) == (0, 0.0)
+
+
+@pytest.fixture(scope="module")
+def analysis():
+    analysis = FormationAnalysis(NCCEngine(get_template_bank()), get_layouts())
+    analysis.width = 1000
+    return analysis
+
+
+@pytest.mark.parametrize("file, hint, expected", [
+    ("benchmarks/Sample_Ravaged_Realm.png", None, "Ravaged Realm"),
+    ("benchmarks/Sample_Ravaged_Realm.png", "Thalassa", "Ravaged Realm"),
+    ("benchmarks/Sample_Thalassa.png", "Thalassa", "Thalassa"),
+    # Thalassa slots 1-10 are Arena I slots 1-10, so the unhinted tie goes to maps.json order
+    ("benchmarks/Sample_Thalassa.png", None, "Arena I"),
+])
+def test_detect_layout(analysis, ground_truth, file, hint, expected):
+    entry = ground_truth[file]
+    centers = get_layouts()[entry['arena']].centers * analysis.width
+    analysis.circles_pos = [[x, y, 0] for x, y in (centers[int(tile) - 1] for tile in entry['units'])]
+    assert analysis.detect_layout(hint) == expected
+
+
+@pytest.mark.parametrize("file", FORMATIONS)
+def test_analyze_formation(sample_bytes, ground_truth, file):
+    entry = ground_truth[file]
+    result = analyze_formation(sample_bytes(file), entry['arena'])
+    assert result.arena == entry['arena']
+    assert get_tiles(result) == entry['units']
+
+
+@pytest.mark.parametrize("file", FORMATIONS[:2])
+def test_analyze_formation_unhinted(sample_bytes, ground_truth, file):
+    entry = ground_truth[file]
+    result = analyze_formation(sample_bytes(file))
+    assert result.arena == entry['arena']
+    assert get_tiles(result) == entry['units']
+
+
+def test_hough_fallback_matches_slot_sampling(sample_bytes, ground_truth):
+    data = sample_bytes("Sample_Formation.png")
+    fast, hough = analyze_formation(data), analyze_formation(data, fast=False)
+    assert hough.arena == fast.arena == "Arena I"
+    assert get_tiles(hough) == get_tiles(fast) == ground_truth["Sample_Formation.png"]['units']
+
+
+def test_analyze_formation_rejects_blank_image():
+    _, data = cv2.imencode(".png", np.zeros((400, 300, 3), np.uint8))
+    assert not analyze_formation(data.tobytes())
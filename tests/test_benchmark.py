@@ -0,0 +1,43 @@
+from bot.image.benchmark import compare
+
+
+def make_report(reference_ms: float, p50_ms: dict[str, float | None], accuracy: dict[str, float | None]) -> dict:
+    return {
+        'reference_ms': reference_ms,
+        'latency': {stage: {'p50_ms': value, 'p50_rel': None if value is None else value / reference_ms}
+                    for stage, value in p50_ms.items()},
+        'accuracy': accuracy
+    }
+
+
+BASELINE = make_report(10.0, {'detect': 4.0, 'ocr': 150.0}, {'tiles': 1.0, 'damage': 0.95})
+
+
+def test_slower_machine_is_no_regression():
+    report = make_report(20.0, {'detect': 8.5, 'ocr': 310.0}, {'tiles': 1.0, 'damage': 0.95})
+    assert compare(report, BASELINE) == ([], [])
+
+
+def test_slower_stage_is_a_regression():
+    report = make_report(10.0, {'detect': 9.0, 'ocr': 150.0}, {'tiles': 1.0, 'damage': 0.95})
+    regressions, _ = compare(report, BASELINE)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("latency detect")
+
+
+def test_accuracy_drop_is_a_regression():
+    report = make_report(10.0, {'detect': 4.0, 'ocr': 150.0}, {'tiles': 0.9, 'damage': 0.95})
+    assert compare(report, BASELINE)[0] == ["accuracy tiles: 0.9 < 1.0"]
+
+
+def test_missing_ocr_is_skipped():
+    report = make_report(10.0, {'detect': 4.0, 'ocr': None}, {'tiles': 1.0, 'damage': None})
+    regressions, skipped = compare(report, BASELINE)
+    assert regressions == []
+    assert skipped == ["accuracy damage: not measured", "latency ocr: not measured"]
+
+
+def test_baseline_without_relative_timings_skips_latency():
+    baseline = {'latency': {'detect': {'p50_ms': 1.0}}, 'accuracy': {}}
+    report = make_report(10.0, {'detect': 50.0}, {})
+    assert compare(report, baseline) == ([], [])
@@ -0,0 +1,153 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bot.core.enum_classes import ScreenshotType
+from bot.image import damage_extractor
+from bot.image.damage_extractor import (DamageExtractor, OCRCache,
+                                        get_panel_mask, get_panel_rows,
+                                        parse_damage_text, split_rows,
+                                        stack_rows)
+from bot.image.frame import DecodedFrame
+
+# Tesseract's psm 6 words for the stacked damage panel rows of Sample_Damage.png
+RECORDED_PANEL_OCR = Path(__file__).parent / "data" / "damage_panel_ocr.json"
+
+
+class RecordedBackend:
+    """OCR backend answering every call with one recorded image_to_data result."""
+    name = "recorded"
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.calls = 0
+
+    def image_to_data(self, image: np.ndarray, lang: str, psm: int=6, config: str="") -> dict[str, list]:
+        self.calls += 1
+        return {field: list(values) for field, values in self.data.items()}
+
+
+@pytest.fixture(scope="module")
+def panel_ocr() -> dict:
+    with open(RECORDED_PANEL_OCR, "r") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def damage_frame(sample_bytes) -> DecodedFrame:
+    return DecodedFrame.from_bytes(sample_bytes("Sample_Damage.png"))
+
+
+def make_extractor(backend, cache_dir: Path=None) -> DamageExtractor:
+    return DamageExtractor(languages="eng", backend=backend, cache=OCRCache(), cache_dir=cache_dir)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1234567", 1234567),
+    ("75,059,000", 75059000),
+    ("1.2M", 1200000),
+    ("3.5B", 3500000000),
+    ("8756億", 875600000000),
+    ("10万", 100000),
+    ("1.234,56", 1234.56),
+    ("9'876", 9876),
+    ("１２３", 123),
+    ("DMG", None),
+    ("", None),
+])
+def test_parse_damage_text(text, expected):
+    assert parse_damage_text(text) == (expected if expected is None else pytest.approx(expected))
+
+
+def test_parse_damage_text_is_memoized():
+    parse_damage_text.cache_clear()
+    parse_damage_text("42M")
+    parse_damage_text("42M")
+    assert parse_damage_text.cache_info().hits == 1
+
+
+def test_stack_and_split_rows():
+    rows = [np.zeros((10, 30), np.uint8), np.zeros((12, 50), np.uint8), np.zeros((8, 20), np.uint8)]
+    stacked, tops = stack_rows(rows, gap=5)
+    assert stacked.shape == (10 + 12 + 8 + 3 * 5, 50)
+    assert tops == [0, 15, 32]
+    assert (stacked[10:15] == 255).all()
+
+    # Words are assigned by their center, tops become relative to their row
+    data = {'text': ["a", "b", "c", "d"], 'top': [1, 14, 30, 33], 'height': [8, 10, 10, 6]}
+    split = split_rows(data, tops)
+    assert [row['text'] for row in split] == [["a"], ["b"], ["c", "d"]]
+    assert [row['top'] for row in split] == [[1], [-1], [-2, 1]]
+
+
+def test_stacked_panel_read_splits_into_rows(panel_ocr, damage_frame, ground_truth):
+    backend = RecordedBackend(panel_ocr)
+    results = make_extractor(backend).extract_panel_damage(damage_frame)
+    assert backend.calls == 1
+    assert [result['value'] for result in results if result['value'] is not None] == \
+        ground_truth["Sample_Damage.png"]['damage']
+
+    # Every word box lands on the panel row it was read from
+    mask, _, top = get_panel_mask(damage_frame.bgr)
+    rows = [(top + start, top + end) for start, end in get_panel_rows(mask, damage_frame.width)]
+    for result in results:
+        center = (result['bbox'][0][1] + result['bbox'][2][1]) / 2
+        assert any(start - 1 <= center <= end + 1 for start, end in rows)
+
+
+def test_ocr_cache_evicts_least_recently_used():
+    cache = OCRCache(maxsize=2)
+    cache.put("a", [{'value': 1}])
+    cache.put("b", [{'value': 2}])
+    cache.get("a")
+    cache.put("c", [{'value': 3}])
+    assert cache.get("b") is None
+    assert cache.get("a") == [{'value': 1}]
+    assert cache.get("c") == [{'value': 3}]
+
+
+def test_ocr_cache_returns_copies():
+    cache = OCRCache()
+    results = [{'value': 1, 'bbox': [[0, 0]]}]
+    cache.put("a", results)
+    results[0]['bbox'][0][0] = 5
+    cache.get("a")[0]['value'] = 2
+    assert cache.get("a") == [{'value': 1, 'bbox': [[0, 0]]}]
+
+
+def test_ocr_cache_persists_and_reloads(tmp_path):
+    OCRCache().put("a", [{'value': 1}], tmp_path)
+    assert (tmp_path / "a.json").exists()
+    assert not list(tmp_path.glob("*.tmp"))
+    assert OCRCache().get("a", tmp_path) == [{'value': 1}]
+
+    (tmp_path / "b.json").write_text("{not json")
+    assert OCRCache().get("b", tmp_path) is None
+
+
+def test_ocr_cache_prunes_oldest_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(damage_extractor, "OCR_DISK_CACHE_FILES", 2)
+    cache = OCRCache()
+    for i, key in enumerate("ab"):
+        cache.put(key, [{'value': i}], tmp_path)
+        os.utime(tmp_path / "{}.json".format(key), (1000 + i, 1000 + i))
+    cache.put("c", [{'value': 2}], tmp_path)
+    assert sorted(file_path.stem for file_path in tmp_path.glob("*.json")) == ["b", "c"]
+
+
+def test_cache_key_is_stable(panel_ocr, damage_frame, sample_bytes, tmp_path):
+    backend = RecordedBackend(panel_ocr)
+    extractor = make_extractor(backend, tmp_path)
+    first = extractor.extract_damage(damage_frame, ScreenshotType.DAMAGE)
+
+    # The same pixels decoded again, or read by a fresh process from disk, skip OCR
+    assert extractor.extract_damage(sample_bytes("Sample_Damage.png"), ScreenshotType.DAMAGE) == first
+    assert make_extractor(backend, tmp_path).extract_damage(damage_frame, ScreenshotType.DAMAGE) == first
+    assert backend.calls == 1
+
+    # The routed type is part of the key
+    extractor.extract_damage(damage_frame, ScreenshotType.UNKNOWN)
+    assert backend.calls == 2
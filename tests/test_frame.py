@@ -0,0 +1,118 @@
+import struct
+import zlib
+
+import cv2
+import numpy as np
+import pytest
+
+from bot.image import frame as frame_module
+from bot.image.frame import (CANONICAL_WIDTH, MAX_DECODED_PIXELS,
+                             DecodedFrame, as_frame, get_reduction)
+
+
+def encode(image: np.ndarray, ext: str=".png", *params) -> bytes:
+    return cv2.imencode(ext, image, list(params))[1].tobytes()
+
+
+def with_header_size(png: bytes, width: int, height: int) -> bytes:
+    """PNG whose header claims another size, to test refusals without allocating the pixels."""
+    ihdr = b"IHDR" + struct.pack(">II", width, height) + png[24:29]
+    return png[:12] + ihdr + struct.pack(">I", zlib.crc32(ihdr)) + png[33:]
+
+
+def gradient(width: int, height: int) -> np.ndarray:
+    x = np.arange(width, dtype=np.uint16)[None, :] * 255 // max(width - 1, 1)
+    y = np.arange(height, dtype=np.uint16)[:, None] * 255 // max(height - 1, 1)
+    return np.dstack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                      np.full((height, width), 128)]).astype(np.uint8)
+
+
+@pytest.mark.parametrize("width, height, max_width, expected", [
+    (1080, 1920, 1080, 1),
+    (2160, 3840, 1080, 2),
+    (4319, 100, 1080, 2),
+    (4320, 100, 1080, 4),
+    (8640, 100, 1080, 8),
+    # Full resolution requested: the decoder keeps at least the pixel budget, downscaling trims the rest
+    (4000, 4000, 4000, 1),
+    (4001, 4000, 4001, 1),
+])
+def test_get_reduction(width, height, max_width, expected):
+    assert get_reduction(width, height, max_width) == expected
+
+
+def test_small_image_is_kept():
+    frame = DecodedFrame.from_bytes(encode(gradient(640, 360)))
+    assert (frame.width, frame.height, frame.scale) == (640, 360, 1.0)
+
+
+def test_wide_image_is_decoded_reduced_to_canonical_width():
+    frame = DecodedFrame.from_bytes(encode(gradient(4320, 200), ".jpg"))
+    assert frame.width == CANONICAL_WIDTH
+    assert frame.scale == pytest.approx(0.25)
+    assert frame.to_source(10, 20) == (40, 80)
+
+
+def test_decode_budget():
+    zeros = np.zeros((4000, 4000, 3), np.uint8)
+    at_budget = DecodedFrame.from_bytes(encode(zeros), max_width=None)
+    assert at_budget.width * at_budget.height == MAX_DECODED_PIXELS
+
+    over_budget = DecodedFrame.from_bytes(encode(np.zeros((4000, 4001, 3), np.uint8)), max_width=None)
+    assert over_budget.width * over_budget.height <= MAX_DECODED_PIXELS
+    assert over_budget.scale < 1
+
+
+def test_source_size_limit_refuses_before_decoding(monkeypatch):
+    png = encode(np.zeros((10, 10, 3), np.uint8))
+
+    def imdecode(*args):
+        raise AssertionError("refused images must not be decoded")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(frame_module.cv2, "imdecode", imdecode)
+        assert DecodedFrame.from_bytes(with_header_size(png, 12_000, 10_001)) is None
+        # Beyond what PIL agrees to open at all
+        assert DecodedFrame.from_bytes(with_header_size(png, 20_000, 10_000)) is None
+
+    monkeypatch.setattr(frame_module, "MAX_SOURCE_PIXELS", 100)
+    assert DecodedFrame.from_bytes(png) is not None
+    assert DecodedFrame.from_bytes(encode(np.zeros((10, 11, 3), np.uint8))) is None
+
+
+def test_undecodable_bytes():
+    assert DecodedFrame.from_bytes(b"not an image") is None
+    assert as_frame(b"") is None
+
+
+def test_digest_is_stable_across_encodings():
+    image = gradient(300, 200)
+    digests = {DecodedFrame.from_bytes(encode(image, ".png", cv2.IMWRITE_PNG_COMPRESSION, level)).digest
+               for level in (0, 9)}
+    digests.add(DecodedFrame.from_bytes(encode(image, ".webp", cv2.IMWRITE_WEBP_QUALITY, 101)).digest)
+    assert len(digests) == 1
+
+    changed = image.copy()
+    changed[0, 0] += 1
+    assert DecodedFrame.from_bytes(encode(changed)).digest not in digests
+    # Same bytes, other shape
+    assert DecodedFrame(image.reshape(100, 600, 3)).digest not in digests
+
+
+def test_crop_shares_memory_and_views():
+    frame = DecodedFrame(gradient(200, 100))
+    gray = frame.gray
+    crop = frame.crop(10, 20, 60, 90)
+    assert np.shares_memory(crop.bgr, frame.bgr)
+    assert np.shares_memory(crop.gray, gray)
+    assert (crop.width, crop.height) == (50, 70)
+    assert np.array_equal(crop.rgb, frame.rgb[20:90, 10:60])
+
+
+def test_crop_maps_back_to_source():
+    frame = DecodedFrame.from_bytes(encode(gradient(4320, 800)))
+    assert frame.scale == pytest.approx(0.25)
+    crop = frame.crop(100, 40, 300, 120).crop(5, 10, 50, 60)
+    assert crop.to_source(0, 0) == (420, 200)
+    assert crop.to_source(2, 3) == (428, 212)
+    assert np.array_equal(crop.bgr[3, 2], frame.bgr[53, 107])
@@ -0,0 +1,103 @@
+"""Incremental formation rendering against a full repaint, and encode metrics of batch renders."""
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from bot.core.config import data_settings
+from bot.image import image_maker
+from bot.image.image_maker import (FormationSpec, Image_Maker, encode_formation,
+                                  render_formations)
+from bot.image.render_backends import make_render_backend
+
+EDITS = 150
+USER_ID = "test-image-maker"
+BASE_HEXES = ("Graveborn-Hex", "Generic-Outline", "Lightbearer-Hex", "S3-Artifact-Outline")
+SETTINGS = {'make_transparent': False, 'show_numbers': True, 'show_title': True}
+
+
+def edit(rng: random.Random, state: dict, names: list[str], artifact_names: list[str]):
+    """Apply one random edit of the kind a user makes between two renders."""
+    tile_count = len(data_settings.maps[state['arena']]['Tiles'])
+    kind = rng.choice(["place", "place", "remove", "swap", "artifact", "title", "settings", "hexes", "arena"])
+    if kind == "place":
+        state['units'][rng.randint(1, tile_count)] = rng.choice(names)
+    elif kind == "remove" and state['units']:
+        del state['units'][rng.choice(list(state['units']))]
+    elif kind == "swap":
+        a, b = rng.sample(range(1, tile_count + 1), 2)
+        first, second = state['units'].pop(a, None), state['units'].pop(b, None)
+        if first is not None:
+            state['units'][b] = first
+        if second is not None:
+            state['units'][a] = second
+    elif kind == "artifact":
+        idx = rng.randint(1, 3)
+        if idx in state['artifacts'] and rng.random() < 0.5:
+            del state['artifacts'][idx]
+        else:
+            state['artifacts'][idx] = rng.choice(artifact_names)
+    elif kind == "title":
+        state['title'] = rng.choice(["", "Test", "A longer formation title"])
+    elif kind == "settings":
+        setting = rng.choice(list(state['settings']))
+        state['settings'][setting] = not state['settings'][setting]
+    elif kind == "hexes":
+        idx = rng.randrange(4)
+        state['base_hexes'][idx] = rng.choice(data_settings.fills if idx % 2 == 0 else data_settings.lines)
+    elif kind == "arena" and rng.random() < 0.3:
+        state['arena'] = rng.choice(list(data_settings.maps))
+        tile_count = len(data_settings.maps[state['arena']]['Tiles'])
+        state['units'] = {idx: name for idx, name in state['units'].items() if idx <= tile_count}
+
+
+@pytest.mark.parametrize("backend_name", ["pygame", "pillow"])
+def test_incremental_render_matches_full_paint(backend_name):
+    backend = make_render_backend(backend_name)
+    rng = random.Random(47)
+    names = [name for name in data_settings.units if name in backend.tiles]
+    artifact_names = [name for name in data_settings.artifacts if name in backend.tiles]
+    state = {
+        'title': "Test",
+        'units': {},
+        'artifacts': {},
+        'arena': "Arena I",
+        'base_hexes': list(BASE_HEXES),
+        'settings': dict(SETTINGS),
+    }
+
+    with image_maker.layers_lock:
+        image_maker.user_layers.pop(USER_ID, None)
+    try:
+        with backend:
+            for step in range(EDITS):
+                edit(rng, state, names, artifact_names)
+                args = (state['base_hexes'], state['settings'], state['arena'], False, 3 in state['artifacts'], True, backend)
+                formation = (state['title'], state['units'], state['artifacts'])
+
+                incremental = Image_Maker(USER_ID, *args).render(*formation).to_array()
+                full_maker = Image_Maker(None, *args)
+                full = full_maker.paint(full_maker.compose(*formation)).to_array()
+
+                assert incremental.shape == full.shape, "step {}".format(step)
+                assert np.array_equal(incremental, full), "step {}: {} pixels differ".format(
+                    step, int((incremental != full).any(axis=-1).sum()))
+    finally:
+        with image_maker.layers_lock:
+            image_maker.user_layers.pop(USER_ID, None)
+
+
+def test_render_formations_logs_encode_metrics(caplog):
+    specs = [FormationSpec("Test", {1: name}, {}, "Arena I", BASE_HEXES, SETTINGS)
+             for name in data_settings.units[:3]]
+
+    with caplog.at_level(logging.DEBUG), ThreadPoolExecutor(2) as executor:
+        images = render_formations(specs, "pillow", executor)
+
+    assert images == [encode_formation(spec, "pillow").data for spec in specs]
+    logged = [record.getMessage() for record in caplog.records if record.getMessage().startswith("Encoded png")]
+    assert len(logged) == len(images)
+    for message, data in zip(logged, images):
+        assert "{} bytes".format(len(data)) in message
@@ -0,0 +1,61 @@
+"""Ordering of coalesced renders when renders overlap newer edits."""
+import asyncio
+
+from bot.services.render_coalescer import RenderCoalescer
+
+
+class SlowRender:
+    """Render function whose calls finish only when released, in any order."""
+    def __init__(self):
+        self.calls: list[asyncio.Event] = []
+        self.started = asyncio.Event()
+
+    async def __call__(self, user_id: int) -> str:
+        release = asyncio.Event()
+        self.calls.append(release)
+        self.started.set()
+        await release.wait()
+        return "render-{}".format(len(self.calls))
+
+    async def next_call(self) -> asyncio.Event:
+        """Wait for the next render to start and return its release."""
+        await self.started.wait()
+        self.started.clear()
+        return self.calls[-1]
+
+
+def test_stale_render_is_dropped_after_newer_edit_finished():
+    async def run():
+        render = SlowRender()
+        coalescer = RenderCoalescer(render, window=0)
+
+        # Edit 1 renders slowly
+        first = asyncio.create_task(coalescer.request(1))
+        release_first = await render.next_call()
+
+        # Edit 2 renders and finishes while edit 1 is still rendering
+        second = asyncio.create_task(coalescer.request(1))
+        (await render.next_call()).set()
+        assert await second == "render-2"
+
+        # Edit 3 arrives before edit 1 returns
+        third = asyncio.create_task(coalescer.request(1))
+        release_third = await render.next_call()
+        release_first.set()
+        assert await first is None
+
+        release_third.set()
+        assert await third == "render-3"
+
+    asyncio.run(run())
+
+
+def test_rapid_edits_render_once():
+    async def run():
+        renders = []
+        coalescer = RenderCoalescer(lambda user_id: renders.append(user_id) or "image", window=0.01)
+        results = await asyncio.gather(*[coalescer.request(7) for _ in range(5)])
+        assert results == [None] * 4 + ["image"]
+        assert renders == [7]
+
+    asyncio.run(run())
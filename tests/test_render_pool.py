@@ -0,0 +1,64 @@
+"""Render pool recovery from dead workers and batch ordering."""
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pytest
+
+from bot.core.config import data_settings
+from bot.image.image_maker import FormationSpec, render_formation
+from bot.image.render_pool import RenderPool, worker_status
+
+BASE_HEXES = ("Graveborn-Hex", "Generic-Outline", "Lightbearer-Hex", "S3-Artifact-Outline")
+SETTINGS = {'make_transparent': False, 'show_numbers': True, 'show_title': True}
+
+
+def exit_once(marker: str) -> int:
+    """Kill the worker the first time it runs, as a crash in native code would; return the pid afterwards."""
+    if not os.path.exists(marker):
+        Path(marker).touch()
+        os._exit(1)
+    return os.getpid()
+
+
+@pytest.fixture
+def pool():
+    render_pool = RenderPool(workers=1, backend="pillow")
+    yield render_pool
+    render_pool.close()
+
+
+def test_dead_worker_restarts_pool_once(pool, tmp_path):
+    async def run_batch():
+        pool.start()
+        # Everything is queued on the same worker, so every job fails when the first one kills it
+        return await asyncio.gather(pool.run(exit_once, str(tmp_path / "exited")),
+                                    *[pool.run(worker_status) for _ in range(3)])
+
+    pid, *statuses = asyncio.run(run_batch())
+
+    assert pool.restarts == 1
+    assert {status['pid'] for status in statuses} == {pid}
+    assert pool.metrics()['queue_depth'] == 0
+
+
+def test_check_health_after_dead_worker(pool, tmp_path):
+    async def crash_and_check():
+        with pytest.raises(BrokenProcessPool):
+            await asyncio.wrap_future(pool.submit(exit_once, str(tmp_path / "exited")))
+        return await pool.check_health()
+
+    status = asyncio.run(crash_and_check())
+
+    assert status['backend'] == "pillow"
+    assert pool.restarts == 1
+
+
+def test_render_many_keeps_order(pool):
+    specs = [FormationSpec(name, {idx: name}, {}, "Arena I", BASE_HEXES, SETTINGS)
+             for idx, name in enumerate(data_settings.units[:4], start=1)]
+
+    images = asyncio.run(pool.render_many(specs))
+
+    assert images == [render_formation(spec, "pillow") for spec in specs]
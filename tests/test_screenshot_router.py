@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+import pytest
+
+from bot.core.enum_classes import ScreenshotType
+from bot.image.frame import DecodedFrame
+from bot.image.screenshot_router import classify_screenshot
+
+
+def decode(image_bytes: bytes) -> np.ndarray:
+    return DecodedFrame.from_bytes(image_bytes).bgr
+
+
+def encode(image: np.ndarray, ext: str=".png", *params) -> bytes:
+    return cv2.imencode(ext, image, list(params))[1].tobytes()
+
+
+def classify(image: np.ndarray) -> ScreenshotType:
+    return classify_screenshot(decode(encode(image)))
+
+
+@pytest.fixture(scope="module")
+def formation(sample_bytes):
+    return decode(sample_bytes("Sample_Formation.png"))
+
+
+@pytest.fixture(scope="module")
+def damage(sample_bytes):
+    return decode(sample_bytes("Sample_Damage.png"))
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("Sample_Damage.png", ScreenshotType.DAMAGE),
+    ("Sample_Formation.png", ScreenshotType.FORMATION),
+    ("Sample_Team.png", ScreenshotType.TEAM),
+])
+def test_samples(sample_bytes, name, expected):
+    assert classify_screenshot(decode(sample_bytes(name))) == expected
+
+
+def test_desaturated_formation_is_analyzed(formation):
+    grey = cv2.cvtColor(cv2.cvtColor(formation, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+    assert classify(grey).has_formation
+
+
+def test_dark_grey_formation_is_analyzed(formation):
+    grey = cv2.cvtColor(cv2.cvtColor(formation, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+    assert classify((grey * 0.45).astype(np.uint8)).has_formation
+
+
+def test_formation_on_grey_background_is_analyzed(formation):
+    hsv = cv2.cvtColor(formation, cv2.COLOR_BGR2HSV)
+    brown = (hsv[..., 0] < 25) & (hsv[..., 1] > 50) & (hsv[..., 2] < 160)
+    recolored = formation.copy()
+    recolored[brown] = 90
+    assert classify(recolored).has_formation
+
+
+@pytest.mark.parametrize("scale", [0.5, 1.5])
+def test_rescaled_damage(damage, scale):
+    resized = cv2.resize(damage, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    assert classify(resized) == ScreenshotType.DAMAGE
+
+
+def test_jpeg_damage(damage):
+    jpeg = encode(damage, ".jpg", cv2.IMWRITE_JPEG_QUALITY, 60)
+    assert classify_screenshot(decode(jpeg)) == ScreenshotType.DAMAGE
+
+
+def test_grey_screen_without_numbers_is_analyzed(damage):
+    blank = damage.copy()
+    blank[blank.min(axis=2) > 150] = 70
+    assert classify(blank).has_formation
+
+
+def test_uniform_grey_is_unknown():
+    assert classify(np.full((900, 600, 3), 80, dtype=np.uint8)) == ScreenshotType.UNKNOWN
+
+
+def test_square_crop_of_team_card_is_not_team(sample_bytes):
+    team = decode(sample_bytes("Sample_Team.png"))
+    h = team.shape[0]
+    assert classify(team[:, :h]) != ScreenshotType.TEAM
+
+
+def test_empty_image_is_unknown():
+    assert classify_screenshot(np.zeros((0, 0, 3), dtype=np.uint8)) == ScreenshotType.UNKNOWN
@@ -0,0 +1,124 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from bot.core.config import path_settings
+from bot.image import template_pack
+from bot.image.template_pack import (CIRCLE_TEMPLATE_SIZE, INDEX_FILE,
+                                     PACK_VERSION, TEMPLATES_FILE,
+                                     TemplateBank, build_template_pack,
+                                     learn_template)
+
+LABELS = ["Rowan", "Lucius", "Talene"]
+
+
+def make_portrait(seed: int) -> np.ndarray:
+    """Distinct smooth portrait-like image at template size."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (6, 6, 3), dtype=np.uint8)
+    return cv2.resize(small, CIRCLE_TEMPLATE_SIZE, interpolation=cv2.INTER_CUBIC)
+
+
+@pytest.fixture
+def folders(tmp_path):
+    templates_folder = tmp_path / "templates"
+    templates_folder.mkdir()
+    for seed, label in enumerate(LABELS):
+        cv2.imwrite(str(templates_folder / "{}_{}.png".format(label, seed)), make_portrait(seed))
+    return templates_folder, tmp_path / "pack"
+
+
+def test_pack_format(folders):
+    templates_folder, pack_dir = folders
+    build_template_pack(templates_folder, pack_dir)
+
+    with open(pack_dir / INDEX_FILE, "r") as f:
+        index = json.load(f)
+    assert index['version'] == PACK_VERSION
+    assert index['labels'] == sorted(LABELS)
+    assert index['size'] == list(CIRCLE_TEMPLATE_SIZE)
+
+    templates = np.load(pack_dir / TEMPLATES_FILE)
+    assert templates.dtype == np.float32
+    assert templates.shape == (len(LABELS), CIRCLE_TEMPLATE_SIZE[1], CIRCLE_TEMPLATE_SIZE[0], 3)
+    flat = templates.reshape(len(LABELS), -1)
+    assert np.linalg.norm(flat, axis=1) == pytest.approx(1, abs=1e-4)
+    assert not list(pack_dir.glob("*.tmp"))
+
+
+def test_match(folders):
+    bank = TemplateBank.load(*folders)
+    for seed, label in enumerate(LABELS):
+        name, score = bank.match(make_portrait(seed))
+        assert name == label
+        assert score == pytest.approx(1, abs=1e-3)
+
+
+def test_unchanged_folder_reuses_pack(folders):
+    templates_folder, pack_dir = folders
+    TemplateBank.load(templates_folder, pack_dir)
+    built = (pack_dir / TEMPLATES_FILE).stat().st_mtime_ns
+    assert len(TemplateBank.load(templates_folder, pack_dir)) == len(LABELS)
+    assert (pack_dir / TEMPLATES_FILE).stat().st_mtime_ns == built
+
+
+def test_changed_folder_rebuilds_pack(folders):
+    templates_folder, pack_dir = folders
+    bank = TemplateBank.load(templates_folder, pack_dir)
+    cv2.imwrite(str(templates_folder / "Vala_9.png"), make_portrait(9))
+
+    rebuilt = TemplateBank.load(templates_folder, pack_dir)
+    assert rebuilt.checksum != bank.checksum
+    assert rebuilt.match(make_portrait(9))[0] == "Vala"
+
+
+def test_stale_index_rebuilds_pack(folders):
+    templates_folder, pack_dir = folders
+    TemplateBank.load(templates_folder, pack_dir)
+    with open(pack_dir / INDEX_FILE, "r") as f:
+        index = json.load(f)
+    index['checksum'] = "stale"
+    with open(pack_dir / INDEX_FILE, "w") as f:
+        json.dump(index, f)
+
+    assert TemplateBank.load(templates_folder, pack_dir).checksum != "stale"
+
+
+def test_add_and_match_back(folders):
+    templates_folder, pack_dir = folders
+    bank = TemplateBank.load(templates_folder, pack_dir)
+    learned = bank.add(make_portrait(7), "Vala", templates_folder, pack_dir)
+
+    assert len(learned) == len(LABELS) + 1
+    assert learned.match(make_portrait(7)) == ("Vala", pytest.approx(1, abs=1e-3))
+    assert bank.add(make_portrait(7), "Vala", templates_folder, pack_dir) is not bank
+    assert learned.add(make_portrait(7), "Vala", templates_folder, pack_dir) is learned
+
+    # The appended pack matches the folder, so loading it again does not rebuild
+    appended = (pack_dir / TEMPLATES_FILE).stat().st_mtime_ns
+    assert TemplateBank.load(templates_folder, pack_dir).labels == learned.labels
+    assert (pack_dir / TEMPLATES_FILE).stat().st_mtime_ns == appended
+
+
+def test_add_keeps_templates_learned_by_others(folders):
+    templates_folder, pack_dir = folders
+    first = TemplateBank.load(templates_folder, pack_dir)
+    second = TemplateBank.load(templates_folder, pack_dir)
+
+    first.add(make_portrait(7), "Vala", templates_folder, pack_dir)
+    merged = second.add(make_portrait(8), "Hodgkin", templates_folder, pack_dir)
+    assert {"Vala", "Hodgkin"} <= set(merged.labels)
+    assert len(list(templates_folder.iterdir())) == len(LABELS) + 2
+
+
+def test_learn_template(folders, monkeypatch):
+    templates_folder, pack_dir = folders
+    monkeypatch.setattr(type(path_settings), "templates_folder", property(lambda self: templates_folder))
+    monkeypatch.setattr(type(path_settings), "template_pack_folder", property(lambda self: pack_dir))
+    monkeypatch.setattr(template_pack, "_bank", None)
+
+    assert learn_template(make_portrait(7), "Vala")
+    assert not learn_template(make_portrait(7), "Vala")
+    assert template_pack.get_template_bank().match(make_portrait(7))[0] == "Vala"
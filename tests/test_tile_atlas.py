@@ -0,0 +1,49 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from bot.image.tile_atlas import (ATLAS_FILE, INDEX_FILE, TileAtlas,
+                                  build_tile_atlas)
+
+
+def load_checksum(atlas_dir) -> str:
+    return TileAtlas.load(atlas_dir=atlas_dir).checksum
+
+
+def test_load_builds_once_and_reuses(tmp_path):
+    atlas = TileAtlas.load(atlas_dir=tmp_path)
+    built = (tmp_path / ATLAS_FILE).stat().st_mtime_ns
+    assert TileAtlas.load(atlas_dir=tmp_path).checksum == atlas.checksum
+    assert (tmp_path / ATLAS_FILE).stat().st_mtime_ns == built
+    assert atlas.icon.shape[2] == 4
+
+
+def test_stale_index_rebuilds(tmp_path):
+    build_tile_atlas(atlas_dir=tmp_path, checksum="stale")
+    assert TileAtlas.load(atlas_dir=tmp_path).checksum != "stale"
+
+
+def test_concurrent_builds(tmp_path):
+    # Threads share the process lock, spawned workers the file lock
+    with ThreadPoolExecutor(4) as threads:
+        checksums = set(threads.map(load_checksum, [tmp_path] * 4))
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("spawn")) as processes:
+        checksums |= set(processes.map(load_checksum, [tmp_path / "fresh"] * 2))
+        build_tile_atlas(atlas_dir=tmp_path / "fresh")
+
+    assert len(checksums) == 1
+    for atlas_dir in (tmp_path, tmp_path / "fresh"):
+        assert not list(atlas_dir.glob("*.tmp"))
+        atlas = TileAtlas.open(atlas_dir)
+        assert atlas.checksum in checksums
+        assert np.asarray(atlas.pixels).any()
+
+
+def test_usage_is_saved_and_reloaded(tmp_path):
+    atlas = TileAtlas.load(atlas_dir=tmp_path)
+    name = next(iter(atlas.rects))
+    atlas.tiles[name]
+    atlas.save_usage()
+    assert not list(tmp_path.glob("*.tmp"))
+    assert TileAtlas.open(tmp_path).most_used() == [name]